@@ -1,2 +1,215 @@
-# This module will expose REST API endpoints for dashboard and external integrations.
-# Use FastAPI or Flask for implementation.
+# This module exposes REST API endpoints for the dashboard and external integrations.
+# aiohttp app sharing the db_service pool. Run with: python -m api.main
+#
+# - Listas con paginación por keyset: la respuesta trae next_cursor (opaco) y se
+#   pide la siguiente página con ?cursor=...
+# - Todas las respuestas GET llevan ETag; con If-None-Match igual se devuelve 304.
+# - Los agregados (stats de campaña) se cachean API_STATS_TTL_SECONDS, y las
+#   peticiones concurrentes al mismo agregado comparten una sola consulta.
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import secrets
+import time
+
+from aiohttp import web
+
+from services import db_service, metrics
+
+API_TOKEN = os.getenv("API_TOKEN", "")
+STATS_TTL = float(os.getenv("API_STATS_TTL_SECONDS", "30"))
+MAX_PAGE_SIZE = 500
+
+routes = web.RouteTableDef()
+
+
+def _int_param(request: web.Request, name: str, default: int, minimum: int = 0, maximum: int = None) -> int:
+    raw = request.query.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise web.HTTPBadRequest(reason=f"{name} must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise web.HTTPBadRequest(reason=f"{name} out of range")
+    return value
+
+
+def encode_cursor(key) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(request: web.Request, shape=int):
+    """shape: int for single-column keys, or a tuple of types for composite keys."""
+    cursor = request.query.get("cursor")
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise web.HTTPBadRequest(reason="invalid cursor")
+    if isinstance(shape, tuple):
+        valid = isinstance(key, list) and len(key) == len(shape) and all(isinstance(k, t) for k, t in zip(key, shape))
+        key = tuple(key) if valid else None
+    else:
+        valid = isinstance(key, shape) and not isinstance(key, bool)
+    if not valid:
+        raise web.HTTPBadRequest(reason="invalid cursor")
+    return key
+
+
+def _page(items: list, limit: int, key_of) -> dict:
+    # Se pide limit + 1 filas: si sobra una, hay página siguiente
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {"items": items, "next_cursor": encode_cursor(key_of(items[-1])) if has_more else None}
+
+
+def json_response(request: web.Request, body, max_age: int = 0) -> web.Response:
+    payload = json.dumps(body, default=str, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(payload).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=payload, content_type="application/json", headers=headers)
+
+
+class TTLCache:
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._store(key, t))
+        # Si el cliente que inició la carga se desconecta, la carga sigue para los demás
+        return await asyncio.shield(task)
+
+    def _store(self, key, task: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (task.result(), time.monotonic())
+
+
+_stats_cache = TTLCache(STATS_TTL)
+
+
+@web.middleware
+async def auth_middleware(request: web.Request, handler):
+    # Sin API_TOKEN la API solo debería escuchar en localhost (API_HOST por defecto)
+    if API_TOKEN and request.path != "/health":
+        header = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(header, f"Bearer {API_TOKEN}"):
+            raise web.HTTPUnauthorized()
+    return await handler(request)
+
+
+@routes.get("/health")
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+@routes.get("/users")
+async def list_users(request: web.Request) -> web.Response:
+    limit = _int_param(request, "limit", 50, minimum=1, maximum=MAX_PAGE_SIZE)
+    after = decode_cursor(request)
+    rows = await db_service.list_users_page(after_id=after, limit=limit + 1)
+    return json_response(request, _page(rows, limit, lambda r: r["id"]))
+
+
+@routes.get("/referrals")
+async def list_referrals(request: web.Request) -> web.Response:
+    limit = _int_param(request, "limit", 50, minimum=1, maximum=MAX_PAGE_SIZE)
+    after = decode_cursor(request, shape=(str, int))
+    rows = await db_service.list_referrals_page(
+        campaign_id=request.query.get("campaign_id"),
+        status=request.query.get("status"),
+        after=after,
+        limit=limit + 1,
+    )
+    return json_response(request, _page(rows, limit, lambda r: [r["campaign_id"], r["referee_id"]]))
+
+
+@routes.get("/payments")
+async def list_payments(request: web.Request) -> web.Response:
+    limit = _int_param(request, "limit", 50, minimum=1, maximum=MAX_PAGE_SIZE)
+    after = decode_cursor(request)
+    user_id = _int_param(request, "user_id", None) if "user_id" in request.query else None
+    rows = await db_service.list_payments_page(
+        after_id=after,
+        limit=limit + 1,
+        status=request.query.get("status"),
+        user_id=user_id,
+    )
+    return json_response(request, _page(rows, limit, lambda r: r["id"]))
+
+
+@routes.get("/campaigns/{campaign_id}/stats")
+async def campaign_stats(request: web.Request) -> web.Response:
+    campaign_id = request.match_info["campaign_id"]
+    stats = await _stats_cache.get_or_load(("campaign", campaign_id), lambda: db_service.get_campaign_stats(campaign_id))
+    if stats is None:
+        raise web.HTTPNotFound(reason="campaign not found")
+    return json_response(request, stats, max_age=int(STATS_TTL))
+
+
+@routes.get("/campaigns/{campaign_id}/leaderboard")
+async def campaign_leaderboard(request: web.Request) -> web.Response:
+    campaign_id = request.match_info["campaign_id"]
+    metric = request.query.get("metric", "referrals")
+    if metric not in db_service.METRICS:
+        raise web.HTTPBadRequest(reason=f"metric must be one of {', '.join(db_service.METRICS)}")
+    limit = _int_param(request, "limit", 10, minimum=1, maximum=100)
+    offset = _int_param(request, "offset", 0)
+    rows = await db_service.get_leaderboard_top(campaign_id, metric, limit=limit, offset=offset)
+    body = {
+        "campaign_id": campaign_id,
+        "metric": metric,
+        "items": [{"rank": rank, "user_id": user_id, "score": score} for rank, user_id, score in rows],
+    }
+    if "user_id" in request.query:
+        user_id = _int_param(request, "user_id", 0)
+        mine = await db_service.get_leaderboard_rank(campaign_id, metric, user_id)
+        body["user"] = {"user_id": user_id, "rank": mine[0], "score": mine[1]} if mine else None
+    return json_response(request, body)
+
+
+async def _on_startup(app: web.Application):
+    await db_service.open_pool()
+
+
+async def _on_cleanup(app: web.Application):
+    await db_service.close_pool()
+
+
+def build_app() -> web.Application:
+    app = web.Application(middlewares=[auth_middleware])
+    app.add_routes(routes)
+    app.router.add_get("/metrics", metrics.metrics_handler)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(build_app(), host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,90 @@
+# Storage FSM de aiogram sobre Postgres (tabla fsm_states) con un front LRU + TTL
+# en memoria. Los estados expiran (FSM_STATE_TTL_SECONDS), así que los flujos
+# abandonados no se acumulan, y varias réplicas del bot comparten el mismo estado.
+# El front es write-through; su TTL debe ser corto si hay más de una réplica.
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from services import db_service
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresStorage(BaseStorage):
+    def __init__(self, state_ttl: float = 3600, cache_ttl: float = 5, cache_max_entries: int = 10_000):
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"cache_hits": 0, "db_reads": 0, "db_writes": 0}
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _remember(self, k: str, state: Optional[str], data: dict) -> None:
+        self._cache[k] = (state, data, time.monotonic())
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def _load(self, k: str):
+        entry = self._cache.get(k)
+        if entry is not None:
+            state, data, stored_at = entry
+            if time.monotonic() - stored_at < self.cache_ttl:
+                self._cache.move_to_end(k)
+                self.stats["cache_hits"] += 1
+                return state, data
+            self._cache.pop(k, None)
+        self.stats["db_reads"] += 1
+        state, data = await db_service.fsm_load(k)
+        self._remember(k, state, data)
+        return state, data
+
+    async def _save(self, k: str, state: Optional[str], data: dict) -> None:
+        self.stats["db_writes"] += 1
+        await db_service.fsm_save(k, state, data, self.state_ttl)
+        self._remember(k, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self._key(key)
+        _, data = await self._load(k)
+        value = state.state if isinstance(state, State) else state
+        await self._save(k, value, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self._key(key)
+        state, _ = await self._load(k)
+        await self._save(k, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def purge_expired(self) -> int:
+        deleted = await db_service.fsm_purge_expired()
+        if deleted:
+            logger.info(f"FSM storage: purged {deleted} expired states")
+        return deleted
+
+    async def run_purge_loop(self, interval_seconds: float = 600) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                logger.error(f"FSM purge failed: {e}")
+
+    async def close(self) -> None:
+        self._cache.clear()
@@ -1,5 +1,7 @@
-from aiogram import Bot, Dispatcher, F, types
+from aiogram import Bot, Dispatcher, F, Router, types
 from aiogram.filters import CommandStart, Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
     Message,
     KeyboardButton,
@@ -10,6 +12,16 @@ from aiogram.types import (
     CallbackQuery,
     ForceReply,
 )
+from bot.routing import (
+    LEGACY_MENU_CALLBACKS,
+    MenuAction,
+    MenuCallback,
+    PayoutConfirmAction,
+    PayoutConfirmCallback,
+    PayoutMethodCallback,
+    PrefixRouter,
+    is_payload,
+)
 from services.db_service import (
     get_existing_code_by_user,
     upsert_user,
@@ -19,21 +31,33 @@ from services.db_service import (
     add_points,
 )
 from services.referral_service import assign_or_get_code, register_referral
-from utils.helpers import e164, country_code_from_phone, get_lang
+from services import membership_service
+from services.export_service import EXPORTS, export_table
+from services import broadcast_service
+from utils.helpers import e164, country_code_from_phone, get_lang, parse_age
 import logging
 import re
+import time
+from functools import lru_cache
 
-user_requested_withdraw = {}
+# Flujo de retiro: el estado vive en el storage FSM del Dispatcher (bot/fsm_storage.py)
+class WithdrawFlow(StatesGroup):
+    amount = State()  # esperando el monto
+    method = State()  # monto elegido, esperando método de pago
+    account = State()  # esperando el correo de PayPal / Binance Pay ID
+    confirm = State()  # esperando confirmación de la cuenta
 
 # UI Helper Functions
+# Memoizado: el código de un usuario no cambia, el link tampoco
+@lru_cache(maxsize=100_000)
 def build_affiliate_link_for_code(code: str, bot_username: str) -> str:
     return f"https://t.me/{bot_username}?start={code}"
 
 def payout_methods_kb(lang: str):
     # Por defecto solo PayPal y Binance Pay
     methods = [
-        [InlineKeyboardButton(text="PayPal 💵", callback_data="pm:Paypal")],
-        [InlineKeyboardButton(text="Binance Pay ID 🚀", callback_data="pm:BinancePay")],
+        [InlineKeyboardButton(text="PayPal 💵", callback_data=PayoutMethodCallback(method="Paypal").pack())],
+        [InlineKeyboardButton(text="Binance Pay ID 🚀", callback_data=PayoutMethodCallback(method="BinancePay").pack())],
     ]
     # Aquí puedes agregar lógica para añadir métodos según país/usuario
     return InlineKeyboardMarkup(inline_keyboard=methods)
@@ -43,19 +67,53 @@ def register_handlers(dp: Dispatcher, config, texts, t):
     import json
 
     BOT_USERNAME = config["BOT_USERNAME"]
+    ADMIN_USER_IDS = set(config["ADMIN_USER_IDS"])
+
+    def is_admin(user) -> bool:
+        return str(user.id) in ADMIN_USER_IDS
+
+    def account_label(method_type: str, lang: str) -> str:
+        key = "account_label_paypal" if method_type == "Paypal" else "account_label_binance"
+        return t(key, lang)
+
+    def confirm_account_kb(method_type: str, lang: str) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text=t("btn_confirm_yes", lang),
+                        callback_data=PayoutConfirmCallback(method=method_type, action=PayoutConfirmAction.yes).pack(),
+                    )
+                ],
+                [
+                    InlineKeyboardButton(
+                        text=t("btn_confirm_edit", lang),
+                        callback_data=PayoutConfirmCallback(method=method_type, action=PayoutConfirmAction.edit).pack(),
+                    )
+                ],
+            ]
+        )
+
+    # Un Router por funcionalidad. Callbacks y comandos entran por la tabla de
+    # prefijos de `routes` (bot/routing.py); los mensajes del flujo de retiro y el
+    # fallback van en routers aparte, después, en ese orden.
+    menu = Router(name="menu")
+    account = Router(name="account")
+    withdraw = Router(name="withdraw")
+    withdraw_flow = Router(name="withdraw_flow")
+    admin = Router(name="admin")
+    fallback = Router(name="fallback")
 
     # --- START: Inline button handlers ---
-    @dp.callback_query(lambda c: c.data == "remember_code")
     async def cb_remember_code(callback: types.CallbackQuery):
         lang = get_lang(callback.from_user)
         code = await get_existing_code_by_user(callback.from_user.id)
         if code:
-            await callback.message.answer(f"{t('mycode_has', lang)} {code}")
+            await callback.message.answer(t("mycode_has", lang, code=code))
         else:
             await callback.message.answer(t("mycode_missing", lang))
         await callback.answer()
 
-    @dp.callback_query(lambda c: c.data == "get_affiliate_link")
     async def cb_get_affiliate_link(callback: types.CallbackQuery):
         lang = get_lang(callback.from_user)
         code = await get_existing_code_by_user(callback.from_user.id)
@@ -67,7 +125,6 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         await callback.message.answer(t("your_affiliate_link", lang, link=aff))
         await callback.answer()
 
-    @dp.callback_query(lambda c: c.data == "get_group_link")
     async def cb_get_group_link(callback: types.CallbackQuery):
         lang = get_lang(callback.from_user)
         campaign = await db_repo.get_active_campaign_for_user(callback.from_user.id)
@@ -90,18 +147,49 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         else:
             await callback.message.answer(t("group_invite_fail_short", lang))
         await callback.answer()
+
+    menu_actions = {
+        MenuAction.code: cb_remember_code,
+        MenuAction.link: cb_get_affiliate_link,
+        MenuAction.group: cb_get_group_link,
+    }
+
+    @menu.callback_query(is_payload(MenuCallback))
+    async def cb_menu(callback: types.CallbackQuery, callback_data: MenuCallback):
+        await menu_actions[callback_data.action](callback)
     # --- END: Inline button handlers ---
 
+    # --- START: Group membership events ---
+    @dp.chat_member()
+    async def on_chat_member(event: types.ChatMemberUpdated):
+        user_id = event.new_chat_member.user.id
+        old_status = membership_service.normalize_status(event.old_chat_member)
+        new_status = membership_service.normalize_status(event.new_chat_member)
+        membership_service.stats["events"] += 1
+        await membership_service.record_member_status(event.chat.id, user_id, new_status)
+        left = (
+            old_status in membership_service.MEMBER_STATUSES
+            and new_status not in membership_service.MEMBER_STATUSES
+        )
+        if left:
+            # Se advierte al usuario que pierde sus puntos si sale del grupo
+            await db_repo.clawback_referral_points(
+                event.chat.id, user_id, config["POINTS_PER_REFERRAL"]
+            )
+
+    @dp.my_chat_member()
+    async def on_my_chat_member(event: types.ChatMemberUpdated):
+        if membership_service.normalize_status(event.new_chat_member) not in membership_service.MEMBER_STATUSES:
+            await membership_service.forget_chat(event.chat.id)
+    # --- END: Group membership events ---
+
     # --- START: Métodos de pago y retiro ---
-    @dp.message(
-        F.reply_to_message,
-        F.reply_to_message.text.contains("monto disponible para retirar"),
-    )
-    async def process_withdraw_amount(message: Message):
+    @withdraw_flow.message(WithdrawFlow.amount, F.text, ~F.text.startswith("/"))
+    async def process_withdraw_amount(message: Message, state: FSMContext):
         lang = get_lang(message.from_user)
         campaign = await db_repo.get_active_campaign_for_user(message.from_user.id)
         if not campaign:
-            await message.answer(t("error", lang, err="No campaign found."))
+            await message.answer(t("error", lang, err=t("no_campaign", lang)))
             return
         commission_cents = campaign.get("commission_per_approved_cents", 0)
         approved, gross, paid, pending = await compute_balances(
@@ -131,44 +219,50 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             return
         if requested_cents < min_withdraw_cents:
             min_amt = fmt(min_withdraw_cents)
+            await message.answer(t("withdraw_min", lang, min_amount=min_amt))
             await message.answer(
-                f"❌ El retiro mínimo es {min_amt}.\nMinimum withdrawal is {min_amt}."
-            )
-            await message.answer(
-                f"💸 Tu monto disponible para retirar es {fmt(available)}.\n\n¿Cuánto deseas retirar? Escribe el monto como respuesta a este mensaje.",
+                t("withdraw_ask_amount", lang, available=fmt(available)),
                 reply_markup=ForceReply(),
             )
             return
         if requested_cents > available:
             await message.answer(
-                f"❌ El monto solicitado ({fmt(requested_cents)}) excede tu saldo disponible ({fmt(available)}). Por favor ingresa un monto válido."
+                t(
+                    "withdraw_exceeds",
+                    lang,
+                    requested=fmt(requested_cents),
+                    available=fmt(available),
+                )
             )
             await message.answer(
-                f"💸 Tu monto disponible para retirar es {fmt(available)}.\n\n¿Cuánto deseas retirar? Escribe el monto como respuesta a este mensaje.",
+                t("withdraw_ask_amount", lang, available=fmt(available)),
                 reply_markup=ForceReply(),
             )
             return
         if requested_cents <= 0:
             await message.answer(t("invalid_amount", lang))
             await message.answer(
-                f"💸 Tu monto disponible para retirar es {fmt(available)}.\n\n¿Cuánto deseas retirar? Escribe el monto como respuesta a este mensaje.",
+                t("withdraw_ask_amount", lang, available=fmt(available)),
                 reply_markup=ForceReply(),
             )
             return
         # Mostrar monto y opciones de pago
-        user_requested_withdraw[message.from_user.id] = requested_cents
+        await state.update_data(requested_cents=requested_cents)
+        await state.set_state(WithdrawFlow.method)
         await message.answer(
-            f"¿Cómo quieres recibir tu pago de {fmt(requested_cents)}?",
+            t("choose_payout_method", lang, amount=fmt(requested_cents)),
             reply_markup=payout_methods_kb(lang),
         )
 
-    @dp.callback_query(lambda c: c.data.startswith("pm:"))
-    async def cb_select_payout_method(callback: types.CallbackQuery):
+    @withdraw.callback_query(is_payload(PayoutMethodCallback))
+    async def cb_select_payout_method(
+        callback: types.CallbackQuery, callback_data: PayoutMethodCallback, state: FSMContext
+    ):
         lang = get_lang(callback.from_user)
         campaign = await db_repo.get_active_campaign_for_user(callback.from_user.id)
         if not campaign:
             await callback.answer(
-                t("error", lang, err="No campaign found."), show_alert=True
+                t("error", lang, err=t("no_campaign", lang)), show_alert=True
             )
             return
         commission_cents = campaign.get("commission_per_approved_cents", 0)
@@ -183,7 +277,8 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         if requested_cents < min_withdraw_cents or requested_cents <= 0:
             await callback.answer(t("insufficient_funds", lang), show_alert=True)
             return
-        method_name = callback.data[3:]
+        method_name = callback_data.method
+        await state.update_data(method_type=method_name)
         # Buscar método existente para el usuario y tipo
         method = await db_repo.get_default_method(callback.from_user.id, method_name)
         # Si existe, mostrar y pedir confirmación
@@ -198,48 +293,28 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             if isinstance(details, str):
                 details = json.loads(details)
             account = details.get("value", "")
+            await state.set_state(WithdrawFlow.confirm)
             await callback.message.edit_text(
-                f"{t('confirm_account', lang, method=method_name, account=account)}\n\n¿Es correcto este dato?",
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text="✅ Sí, es correcto",
-                                callback_data=f"pmc:{method_name}:yes",
-                            )
-                        ],
-                        [
-                            InlineKeyboardButton(
-                                text="✏️ Cambiar",
-                                callback_data=f"pmc:{method_name}:edit",
-                            )
-                        ],
-                    ]
-                ),
+                t("confirm_account", lang, method=method_name, account=account)
+                + "\n\n"
+                + t("confirm_account_question", lang),
+                reply_markup=confirm_account_kb(method_name, lang),
             )
             await callback.answer()
             return
         # Si no existe, pedir el dato
+        await state.set_state(WithdrawFlow.account)
         await callback.message.answer(
-            f"Por favor ingresa tu {'correo de PayPal' if method_name=='Paypal' else 'Binance Pay ID'} para recibir el pago:",
+            t("ask_account", lang, label=account_label(method_name, lang)),
             reply_markup=ForceReply(),
         )
         await callback.answer()
 
-    @dp.message(
-        F.reply_to_message,
-        F.reply_to_message.text.contains("PayPal")
-        | F.reply_to_message.text.contains("Binance"),
-    )
-    async def save_account_and_confirm(message: Message):
+    @withdraw_flow.message(WithdrawFlow.account, F.text, ~F.text.startswith("/"))
+    async def save_account_and_confirm(message: Message, state: FSMContext):
         lang = get_lang(message.from_user)
-        # Detectar método según el mensaje original
-        if "PayPal" in message.reply_to_message.text:
-            method_type = "Paypal"
-        elif "Binance" in message.reply_to_message.text:
-            method_type = "BinancePay"
-        else:
-            method_type = "Paypal"  # fallback
+        data = await state.get_data()
+        method_type = data.get("method_type", "Paypal")
         account = message.text.strip()
         # Guardar en payout_methods (upsert), details como JSONB
         pool = db_repo.get_pool()
@@ -250,36 +325,29 @@ def register_handlers(dp: Dispatcher, config, texts, t):
                 VALUES (%s, %s, %s::jsonb, true)
                 ON CONFLICT (user_id, method_type) DO UPDATE SET details=EXCLUDED.details, is_default=true;
             """,
-                (message.from_user.id, method_type, '{"value": "%s"}' % account),
+                (message.from_user.id, method_type, json.dumps({"value": account})),
             )
             await conn.commit()
         # Pedir confirmación
+        await state.set_state(WithdrawFlow.confirm)
         await message.answer(
-            f"¿Confirmas que este es tu {'correo de PayPal' if method_type=='Paypal' else 'Binance Pay ID'}: {account}?",
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text="✅ Sí, es correcto",
-                            callback_data=f"pmc:{method_type}:yes",
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            text="✏️ Cambiar", callback_data=f"pmc:{method_type}:edit"
-                        )
-                    ],
-                ]
+            t(
+                "confirm_account_label",
+                lang,
+                label=account_label(method_type, lang),
+                account=account,
             ),
+            reply_markup=confirm_account_kb(method_type, lang),
         )
 
-    @dp.callback_query(lambda c: c.data.startswith("pmc:"))
-    async def cb_confirm_account(callback: types.CallbackQuery):
+    @withdraw.callback_query(is_payload(PayoutConfirmCallback))
+    async def cb_confirm_account(
+        callback: types.CallbackQuery, callback_data: PayoutConfirmCallback, state: FSMContext
+    ):
         lang = get_lang(callback.from_user)
-        parts = callback.data.split(":")
-        method_name = parts[1]
-        action = parts[2]
-        if action == "yes":
+        method_name = callback_data.method
+        action = callback_data.action
+        if action == PayoutConfirmAction.yes:
             campaign = await db_repo.get_active_campaign_for_user(callback.from_user.id)
             commission_cents = campaign.get("commission_per_approved_cents", 0)
             approved, gross, paid, pending = await compute_balances(
@@ -289,7 +357,7 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             )
             available = max(0, gross - paid - pending)
             min_withdraw_cents = campaign.get("min_withdraw_cents", 0)
-            requested_cents = user_requested_withdraw.get(callback.from_user.id)
+            requested_cents = (await state.get_data()).get("requested_cents")
             if not requested_cents:
                 requested_cents = available
             if requested_cents <= 0 or requested_cents < min_withdraw_cents:
@@ -322,64 +390,66 @@ def register_handlers(dp: Dispatcher, config, texts, t):
                         "withdrawal",
                         campaign_id=campaign["id"],
                     )
-            # Limpia el monto solicitado
-            user_requested_withdraw.pop(callback.from_user.id, None)
+            # Fin del flujo: limpia estado y monto solicitado
+            await state.clear()
             await callback.message.edit_text(
                 t("withdraw_created", lang, amount=f"{requested_cents/100:.2f}")
             )
             await callback.answer(t("withdraw_created", lang), show_alert=True)
-        elif action == "edit":
+        elif action == PayoutConfirmAction.edit:
+            await state.update_data(method_type=method_name)
+            await state.set_state(WithdrawFlow.account)
             await callback.message.answer(
-                f"Por favor ingresa tu {'correo de PayPal' if method_name=='Paypal' else 'Binance Pay ID'} para recibir el pago:",
+                t("ask_account", lang, label=account_label(method_name, lang)),
                 reply_markup=ForceReply(),
             )
             await callback.answer()
     # --- END: Métodos de pago y retiro ---
 
-    @dp.message(CommandStart())
+    @account.message(CommandStart())
     async def on_start(message: Message):
         lang = get_lang(message.from_user)
         keyboard = types.InlineKeyboardMarkup(
             inline_keyboard=[
                 [
                     types.InlineKeyboardButton(
-                        text="🔑 Remember my code", callback_data="remember_code"
+                        text=t("btn_remember_code", lang), callback_data=MenuCallback(action=MenuAction.code).pack()
                     )
                 ],
                 [
                     types.InlineKeyboardButton(
-                        text="🔗 Get my affiliate link",
-                        callback_data="get_affiliate_link",
+                        text=t("btn_affiliate_link", lang),
+                        callback_data=MenuCallback(action=MenuAction.link).pack(),
                     )
                 ],
                 [
                     types.InlineKeyboardButton(
-                        text="🟢 Get group link", callback_data="get_group_link"
+                        text=t("btn_group_link", lang), callback_data=MenuCallback(action=MenuAction.group).pack()
                     )
                 ],
             ]
         )
         await message.answer(t("start_mobile_only", lang), reply_markup=keyboard)
 
-    @dp.message(Command("help"))
+    @account.message(Command("help"))
     async def help_cmd(message: Message):
         lang = get_lang(message.from_user)
         await message.answer(t("help", lang))
 
-    @dp.message(Command("mypoints"))
-    @dp.message(Command("mispuntos"))
+    @account.message(Command("mypoints"))
+    @account.message(Command("mispuntos"))
     async def mypoints_cmd(message: Message):
         lang = get_lang(message.from_user)
         pts = await get_user_points(message.from_user.id)
-        await message.answer(f"🏅 {t('your_points', lang)}: {pts}")
+        await message.answer(t("mypoints", lang, points=pts))
 
-    @dp.message(Command("balance"))
-    @dp.message(Command("misganancias"))
+    @account.message(Command("balance"))
+    @account.message(Command("misganancias"))
     async def balance_cmd(message: Message):
         lang = get_lang(message.from_user)
         campaign = await db_repo.get_active_campaign_for_user(message.from_user.id)
         if not campaign:
-            await message.answer(t("error", lang, err="No campaign found."))
+            await message.answer(t("error", lang, err=t("no_campaign", lang)))
             return
         commission_cents = campaign.get("commission_per_approved_cents", 0)
         currency = campaign.get("currency", "$")
@@ -415,13 +485,41 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         )
         await message.answer("\n".join(msg))
 
-    @dp.message(Command("withdraw"))
-    @dp.message(Command("cobrar"))
-    async def withdraw_cmd(message: Message):
+    @account.message(Command("top"))
+    async def top_cmd(message: Message):
+        # /top [points]
+        lang = get_lang(message.from_user)
+        user_id = message.from_user.id
+        campaign = await db_repo.get_active_campaign_for_user(user_id)
+        if not campaign:
+            await message.answer(t("error", lang, err=t("no_campaign", lang)))
+            return
+        args = (message.text or "").split()[1:]
+        metric = "points" if args and args[0].lower() in ("points", "puntos") else "referrals"
+        rows = await db_repo.get_leaderboard_top(campaign["id"], metric, limit=10)
+        if not rows:
+            await message.answer(t("top_empty", lang))
+            return
+        lines = [t(f"top_header_{metric}", lang, campaign=campaign.get("name") or campaign["id"])]
+        for rank, uid, score in rows:
+            # No mostramos ids completos de otros usuarios
+            user = t("top_you", lang) if uid == user_id else f"•••{str(uid)[-4:]}"
+            lines.append(t("top_row", lang, rank=rank, user=user, score=score))
+        mine = await db_repo.get_leaderboard_rank(campaign["id"], metric, user_id)
+        lines.append("")
+        if mine:
+            lines.append(t("top_my_rank", lang, rank=mine[0], score=mine[1]))
+        else:
+            lines.append(t("top_not_ranked", lang))
+        await message.answer("\n".join(lines))
+
+    @withdraw.message(Command("withdraw"))
+    @withdraw.message(Command("cobrar"))
+    async def withdraw_cmd(message: Message, state: FSMContext):
         lang = get_lang(message.from_user)
         campaign = await db_repo.get_active_campaign_for_user(message.from_user.id)
         if not campaign:
-            await message.answer(t("error", lang, err="No campaign found."))
+            await message.answer(t("error", lang, err=t("no_campaign", lang)))
             return
         commission_cents = campaign.get("commission_per_approved_cents", 0)
         approved, gross, paid, pending = await compute_balances(
@@ -446,8 +544,9 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             await message.answer(t("insufficient_funds", lang))
             return
         if len(args) == 1:
+            await state.set_state(WithdrawFlow.amount)
             await message.answer(
-                f"💸 Tu monto disponible para retirar es {fmt(available)}.\n\n¿Cuánto deseas retirar? Escribe el monto como respuesta a este mensaje.",
+                t("withdraw_ask_amount", lang, available=fmt(available)),
                 reply_markup=ForceReply(),
             )
             return
@@ -465,34 +564,31 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             requested_cents = available
         if requested_cents < min_withdraw_cents:
             min_amt = fmt(min_withdraw_cents)
-            await message.answer(
-                f"❌ El retiro mínimo es {min_amt}.\nMinimum withdrawal is {min_amt}."
-            )
+            await message.answer(t("withdraw_min", lang, min_amount=min_amt))
             return
         if requested_cents <= 0 or requested_cents > available:
             await message.answer(t("insufficient_funds", lang))
             return
-        user_requested_withdraw[message.from_user.id] = requested_cents
+        await state.update_data(requested_cents=requested_cents)
+        await state.set_state(WithdrawFlow.method)
         # Mostrar monto y opciones de pago
         await message.answer(
-            f"¿Cómo quieres recibir tu pago de {fmt(requested_cents)}?",
+            t("choose_payout_method", lang, amount=fmt(requested_cents)),
             reply_markup=payout_methods_kb(lang),
         )
-        # Guardar en contexto de usuario el monto solicitado para usarlo al seleccionar método
-        # (esto requiere FSM o almacenamiento temporal, aquí solo se deja el comentario)
 
-    @dp.message(Command("mycode"))
-    @dp.message(Command("micodigo"))
+    @account.message(Command("mycode"))
+    @account.message(Command("micodigo"))
     async def cmd_micodigo(message: Message):
         lang = get_lang(message.from_user)
         code = await get_existing_code_by_user(message.from_user.id)
         if code:
-            await message.answer(f"{t('mycode_has', lang)} {code}")
+            await message.answer(t("mycode_has", lang, code=code))
         else:
             await message.answer(t("mycode_missing", lang))
 
-    @dp.message(Command("mylink"))
-    @dp.message(Command("milink"))
+    @account.message(Command("mylink"))
+    @account.message(Command("milink"))
     async def mylink_cmd(message: Message):
         lang = get_lang(message.from_user)
         code = await get_existing_code_by_user(message.from_user.id)
@@ -502,8 +598,8 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         aff = build_affiliate_link_for_code(code, BOT_USERNAME)
         await message.answer(t("your_affiliate_link", lang, link=aff))
 
-    @dp.message(Command("group"))
-    @dp.message(Command("grupo"))
+    @account.message(Command("group"))
+    @account.message(Command("grupo"))
     async def cmd_group(message: Message):
         lang = get_lang(message.from_user)
         campaign = await db_repo.get_active_campaign_for_user(message.from_user.id)
@@ -513,16 +609,191 @@ def register_handlers(dp: Dispatcher, config, texts, t):
         group_chat_id = campaign["group_chat_id"]
         await message.answer(t("group_access", lang, link="https://t.me/+dummy"))
 
-    @dp.message(Command("id"))
+    @account.message(Command("id"))
     async def id_cmd(message: Message):
         chat_id = message.chat.id
         user_id = message.from_user.id
         chat_type = message.chat.type
-        text = f"Chat ID: <code>{chat_id}</code>\nUser ID: <code>{user_id}</code>\nChat type: <code>{chat_type}</code>"
+        text = t(
+            "id_info",
+            get_lang(message.from_user),
+            chat_id=chat_id,
+            user_id=user_id,
+            chat_type=chat_type,
+        )
         await message.answer(text, parse_mode="HTML")
 
+    # --- Admin: export CSV ---
+    @admin.message(Command("exportcsv"))
+    async def exportcsv_cmd(message: Message):
+        if not is_admin(message.from_user):
+            return
+        lang = get_lang(message.from_user)
+        # /exportcsv <tabla> [campaign=ID] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [gz]
+        from datetime import date
+
+        args = message.text.split()[1:]
+        if not args or args[0] not in EXPORTS:
+            await message.answer(t("export_usage", lang, tables="|".join(sorted(EXPORTS))))
+            return
+        opts = dict(a.split("=", 1) for a in args[1:] if "=" in a)
+        try:
+            date_from = date.fromisoformat(opts["from"]) if "from" in opts else None
+            date_to = date.fromisoformat(opts["to"]) if "to" in opts else None
+        except ValueError:
+            await message.answer(t("export_bad_date", lang))
+            return
+        result = await export_table(
+            args[0],
+            campaign_id=opts.get("campaign"),
+            date_from=date_from,
+            date_to=date_to,
+            gzip_output="gz" in args[1:],
+        )
+        import os
+
+        # Límite de subida de la Bot API: 50 MB
+        if os.path.getsize(result["path"]) < 49 * 1024 * 1024:
+            await message.answer_document(
+                types.FSInputFile(result["path"]),
+                caption=t("export_done", lang, table=args[0], rows=result["rows"]),
+            )
+        else:
+            await message.answer(
+                t(
+                    "export_too_big",
+                    lang,
+                    table=args[0],
+                    rows=result["rows"],
+                    path=result["path"],
+                )
+            )
+
+    # --- Admin: broadcast ---
+    @admin.message(Command("broadcast"))
+    async def broadcast_cmd(message: Message):
+        if not is_admin(message.from_user):
+            return
+        lang = get_lang(message.from_user)
+        # /broadcast [campaign=ID] <texto> | /broadcast status <id> | /broadcast cancel <id>
+        args = (message.text or "").split(maxsplit=1)[1:]
+        rest = args[0].strip() if args else ""
+        action, _, job_arg = rest.partition(" ")
+        if action in ("status", "cancel"):
+            if not job_arg.strip().isdigit():
+                await message.answer(t("broadcast_usage", lang))
+                return
+            job_id = int(job_arg.strip())
+            job = await db_repo.get_broadcast_job(job_id)
+            if not job:
+                await message.answer(t("broadcast_not_found", lang, job_id=job_id))
+                return
+            if action == "cancel" and await broadcast_service.cancel_broadcast(job_id):
+                await message.answer(t("broadcast_cancelled", lang, job_id=job_id))
+                return
+            await message.answer(
+                t(
+                    "broadcast_status",
+                    lang,
+                    job_id=job_id,
+                    status=job["status"],
+                    sent=job["sent"],
+                    blocked=job["blocked"],
+                    failed=job["failed"],
+                    last_user_id=job["last_user_id"],
+                )
+            )
+            return
+        campaign_id = None
+        if rest.startswith("campaign="):
+            first, _, rest = rest.partition(" ")
+            campaign_id = first.split("=", 1)[1] or None
+            rest = rest.strip()
+        source = message.reply_to_message
+        if not rest and source is None:
+            await message.answer(t("broadcast_usage", lang))
+            return
+        job = await db_repo.create_broadcast_job(
+            created_by=message.from_user.id,
+            lang=lang,
+            text=rest or None,
+            campaign_id=campaign_id,
+            # Si responde a un mensaje se copia tal cual (admite fotos, formato, etc.)
+            source_chat_id=source.chat.id if source else None,
+            source_message_id=source.message_id if source else None,
+        )
+        broadcast_service.start_broadcast(message.bot, job)
+        await message.answer(t("broadcast_started", lang, job_id=job["id"]))
+
+    # --- Admin: aprobación / rechazo masivo de referidos ---
+    @admin.message(Command("referrals"))
+    async def referrals_bulk_cmd(message: Message):
+        if not is_admin(message.from_user):
+            return
+        lang = get_lang(message.from_user)
+        # /referrals <approve|reject> [campaign=ID] [older=7d] [verified] [ids=1,2,3] [dry]
+        args = (message.text or "").split()[1:]
+        statuses = {"approve": "APPROVED", "reject": "REJECTED"}
+        if not args or args[0] not in statuses:
+            await message.answer(t("referrals_bulk_usage", lang))
+            return
+        opts = dict(a.split("=", 1) for a in args[1:] if "=" in a)
+        flags = {a for a in args[1:] if "=" not in a}
+        older_than = parse_age(opts["older"]) if "older" in opts else None
+        try:
+            referee_ids = [int(x) for x in opts["ids"].split(",") if x] if "ids" in opts else None
+        except ValueError:
+            referee_ids = None
+        if ("older" in opts and older_than is None) or ("ids" in opts and not referee_ids) or not (
+            opts.get("campaign") or older_than or referee_ids
+        ):
+            await message.answer(t("referrals_bulk_usage", lang))
+            return
+        filters = {
+            "campaign_id": opts.get("campaign"),
+            "older_than": older_than,
+            "verified": "verified" in flags,
+            "referee_ids": referee_ids,
+            "default_chat_id": config.get("GROUP_CHAT_ID"),
+        }
+        total = await db_repo.count_pending_referrals(**filters)
+        if "dry" in flags or not total:
+            await message.answer(t("referrals_bulk_preview", lang, count=total))
+            return
+        status = statuses[args[0]]
+        progress = await message.answer(t("referrals_bulk_progress", lang, status=status, done=0, total=total, chunks=0))
+        last_edit = [time.monotonic()]
+
+        async def on_progress(done, chunks):
+            # Editar como mucho cada 2 s: el límite de Telegram es por chat
+            if time.monotonic() - last_edit[0] < 2:
+                return
+            last_edit[0] = time.monotonic()
+            try:
+                await progress.edit_text(t("referrals_bulk_progress", lang, status=status, done=done, total=total, chunks=chunks))
+            except Exception as e:
+                logging.warning(f"Bulk referral progress edit failed: {e}")
+
+        result = await db_repo.bulk_set_referral_status(
+            status,
+            # Rechazar devuelve los puntos que se dieron al registrar el referido
+            clawback_points=config["POINTS_PER_REFERRAL"] if status == "REJECTED" else 0,
+            on_progress=on_progress,
+            **filters,
+        )
+        await progress.edit_text(
+            t(
+                "referrals_bulk_done",
+                lang,
+                status=status,
+                done=result["updated"],
+                chunks=result["chunks"],
+                elapsed=round(result["elapsed"], 1),
+            )
+        )
+
     # --- Fallback handler ---
-    @dp.message()
+    @fallback.message()
     async def fallback_handler(message: Message):
         lang = get_lang(message.from_user)
         keyboard = types.ReplyKeyboardMarkup(
@@ -538,10 +809,14 @@ def register_handlers(dp: Dispatcher, config, texts, t):
             ],
             resize_keyboard=True,
         )
-        await message.answer(
-            "No entendí eso 🤔. Por favor, usa los botones para continuar.",
-            reply_markup=keyboard,
-        )
+        await message.answer(t("fallback", lang), reply_markup=keyboard)
+
+    routes = PrefixRouter(name="routes")
+    routes.include_callbacks(menu, MenuCallback, legacy=LEGACY_MENU_CALLBACKS)
+    routes.include_callbacks(withdraw, PayoutMethodCallback, PayoutConfirmCallback)
+    for router in (account, withdraw, admin):
+        routes.include_commands(router)
+    dp.include_routers(routes, withdraw_flow, fallback)
 
 # This module will contain all Telegram bot handlers and UI logic.
 # Move aiogram handlers and UI helpers from telegram_referrals_bot.py here.
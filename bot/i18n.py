@@ -0,0 +1,268 @@
+# Catálogo de traducciones.
+# Se carga una vez al arrancar: cada plantilla se valida y se guarda junto con sus
+# campos ya parseados, indexada por (key, lang). Opcionalmente se sobreescriben
+# textos desde archivos Babel en <locale_dir>/<lang>/LC_MESSAGES/messages.{mo,po}
+# (msgid = key, msgstr = texto).
+import logging
+import os
+from string import Formatter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LANGS = ("es", "en")
+
+DEFAULT_TEXTS = {
+    "your_points": {"es": "Tus puntos", "en": "Your points"},
+    "mypoints": {"es": "🏅 Tus puntos: {points}", "en": "🏅 Your points: {points}"},
+    "balance_header": {"es": "💰 Tu balance:", "en": "💰 Your balance:"},
+    "balance_body": {
+        "es": (
+            "Referidos aprobados: {approved}\n"
+            "Comisión por referido: {commission}\n"
+            "Bruto ganado: {gross}\n"
+            "Pagado: {paid}\n"
+            "Retiros pendientes: {pending}\n"
+            "\nDisponible ahora: {available}"
+        ),
+        "en": (
+            "Approved referrals: {approved}\n"
+            "Commission per referral: {commission}\n"
+            "Gross earned: {gross}\n"
+            "Paid out: {paid}\n"
+            "Pending withdrawals: {pending}\n"
+            "\nAvailable now: {available}"
+        ),
+    },
+    "no_balance": {"es": "Aún no tienes ganancias.", "en": "You have no earnings yet."},
+    "withdraw_created": {
+        "es": "✅ Su retiro se está procesando. Le contactaremos pronto.",
+        "en": "✅ Your withdrawal is being processed. We will contact you soon.",
+    },
+    "withdraw_min": {
+        "es": "❌ El retiro mínimo es {min_amount}.",
+        "en": "❌ Minimum withdrawal is {min_amount}.",
+    },
+    "withdraw_ask_amount": {
+        "es": "💸 Tu monto disponible para retirar es {available}.\n\n¿Cuánto deseas retirar? Escribe el monto como respuesta a este mensaje.",
+        "en": "💸 Your available amount to withdraw is {available}.\n\nHow much do you want to withdraw? Type the amount as a reply to this message.",
+    },
+    "withdraw_exceeds": {
+        "es": "❌ El monto solicitado ({requested}) excede tu saldo disponible ({available}). Por favor ingresa un monto válido.",
+        "en": "❌ The requested amount ({requested}) exceeds your available balance ({available}). Please enter a valid amount.",
+    },
+    "invalid_amount": {"es": "❌ Monto inválido.", "en": "❌ Invalid amount."},
+    "insufficient_funds": {"es": "❌ Saldo insuficiente.", "en": "❌ Insufficient funds."},
+    "choose_payout_method": {
+        "es": "¿Cómo quieres recibir tu pago de {amount}?",
+        "en": "How do you want to receive your payment of {amount}?",
+    },
+    "confirm_account": {
+        "es": "¿Confirmas que este es tu dato de {method}: {account}?",
+        "en": "Do you confirm this {method} account: {account}?",
+    },
+    "confirm_account_question": {"es": "¿Es correcto este dato?", "en": "Is this correct?"},
+    "confirm_account_label": {
+        "es": "¿Confirmas que este es tu {label}: {account}?",
+        "en": "Do you confirm this is your {label}: {account}?",
+    },
+    "ask_account": {
+        "es": "Por favor ingresa tu {label} para recibir el pago:",
+        "en": "Please enter your {label} to receive the payment:",
+    },
+    "account_label_paypal": {"es": "correo de PayPal", "en": "PayPal email"},
+    "account_label_binance": {"es": "Binance Pay ID", "en": "Binance Pay ID"},
+    "btn_confirm_yes": {"es": "✅ Sí, es correcto", "en": "✅ Yes, it's correct"},
+    "btn_confirm_edit": {"es": "✏️ Cambiar", "en": "✏️ Change"},
+    "btn_remember_code": {"es": "🔑 Recordar mi código", "en": "🔑 Remember my code"},
+    "btn_affiliate_link": {"es": "🔗 Obtener mi link de referido", "en": "🔗 Get my affiliate link"},
+    "btn_group_link": {"es": "🟢 Obtener link del grupo", "en": "🟢 Get group link"},
+    "mycode_has": {"es": "Tu código de referido es: {code}", "en": "Your referral code is: {code}"},
+    "mycode_missing": {"es": "No tienes código asignado.", "en": "You have no code assigned."},
+    "start_mobile_only": {
+        "es": "¡Bienvenido! Usa los comandos para interactuar con el bot.",
+        "en": "Welcome! Use the commands to interact with the bot.",
+    },
+    "group_access": {"es": "Acceso al grupo: {link}", "en": "Group access: {link}"},
+    "group_missing_env": {
+        "es": "No hay un grupo configurado para tu campaña.",
+        "en": "No group is configured for your campaign.",
+    },
+    "group_invite_fail_short": {
+        "es": "No se pudo generar el link del grupo.",
+        "en": "Could not create the group link.",
+    },
+    "your_affiliate_link": {"es": "Tu link de referido: {link}", "en": "Your affiliate link: {link}"},
+    "invalid_referral": {"es": "❌ Código de referido inválido.", "en": "❌ Invalid referral code."},
+    "self_referral": {"es": "❌ No puedes usar tu propio código.", "en": "❌ You cannot use your own code."},
+    "already_referred": {
+        "es": "ℹ️ Ya fuiste referido en esta campaña.",
+        "en": "ℹ️ You were already referred in this campaign.",
+    },
+    "reciprocal_blocked": {
+        "es": "❌ No se permiten referidos recíprocos.",
+        "en": "❌ Reciprocal referrals are not allowed.",
+    },
+    "campaign_inactive": {"es": "❌ La campaña no está activa.", "en": "❌ The campaign is not active."},
+    "referral_done": {"es": "✅ ¡Referido registrado!", "en": "✅ Referral registered!"},
+    "leave_group_warning": {
+        "es": "⚠️ ¡Si sales del grupo principal, perderás tus puntos!",
+        "en": "⚠️ If you leave the main group, you will lose your points!",
+    },
+    "must_join_group": {
+        "es": "❗️Debes unirte al grupo principal para recibir tus puntos.",
+        "en": "❗️You must join the main group to receive your points.",
+    },
+    "error": {"es": "❌ Error: {err}", "en": "❌ Error: {err}"},
+    "no_campaign": {"es": "No se encontró una campaña activa.", "en": "No campaign found."},
+    "id_info": {
+        "es": "Chat ID: <code>{chat_id}</code>\nUser ID: <code>{user_id}</code>\nChat type: <code>{chat_type}</code>",
+        "en": "Chat ID: <code>{chat_id}</code>\nUser ID: <code>{user_id}</code>\nChat type: <code>{chat_type}</code>",
+    },
+    "fallback": {
+        "es": "No entendí eso 🤔. Por favor, usa los botones para continuar.",
+        "en": "I didn't understand that 🤔. Please use the buttons to continue.",
+    },
+    "export_usage": {
+        "es": "Uso: /exportcsv <{tables}> [campaign=ID] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [gz]",
+        "en": "Usage: /exportcsv <{tables}> [campaign=ID] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [gz]",
+    },
+    "export_bad_date": {"es": "❌ Fecha inválida, usa YYYY-MM-DD.", "en": "❌ Invalid date, use YYYY-MM-DD."},
+    "export_done": {"es": "{table}: ~{rows} filas", "en": "{table}: ~{rows} rows"},
+    "export_too_big": {
+        "es": "{table}: ~{rows} filas. Archivo demasiado grande para Telegram: {path}",
+        "en": "{table}: ~{rows} rows. File too large for Telegram: {path}",
+    },
+    "broadcast_usage": {
+        "es": "Uso: /broadcast [campaign=ID] <texto> (o responde a un mensaje con /broadcast [campaign=ID])\n/broadcast status <id>\n/broadcast cancel <id>",
+        "en": "Usage: /broadcast [campaign=ID] <text> (or reply to a message with /broadcast [campaign=ID])\n/broadcast status <id>\n/broadcast cancel <id>",
+    },
+    "broadcast_started": {
+        "es": "📣 Envío #{job_id} iniciado. Te avisaré al terminar.",
+        "en": "📣 Broadcast #{job_id} started. I will report when it finishes.",
+    },
+    "broadcast_not_found": {"es": "No existe el envío #{job_id}.", "en": "Broadcast #{job_id} not found."},
+    "broadcast_cancelled": {"es": "Cancelando envío #{job_id}…", "en": "Cancelling broadcast #{job_id}…"},
+    "broadcast_status": {
+        "es": "Envío #{job_id}: {status}\nEnviados: {sent} · Bloqueados: {blocked} · Fallidos: {failed}\nÚltimo user_id: {last_user_id}",
+        "en": "Broadcast #{job_id}: {status}\nSent: {sent} · Blocked: {blocked} · Failed: {failed}\nLast user_id: {last_user_id}",
+    },
+    "broadcast_report": {
+        "es": "📣 Envío #{job_id}: {status}\nEnviados: {sent} · Bloqueados: {blocked} · Fallidos: {failed} ({errors})\nDuración: {elapsed}s · {rate} msg/s",
+        "en": "📣 Broadcast #{job_id}: {status}\nSent: {sent} · Blocked: {blocked} · Failed: {failed} ({errors})\nDuration: {elapsed}s · {rate} msg/s",
+    },
+    "referrals_bulk_usage": {
+        "es": "Uso: /referrals <approve|reject> [campaign=ID] [older=7d] [verified] [ids=1,2,3] [dry]\nSe necesita al menos campaign, older o ids.",
+        "en": "Usage: /referrals <approve|reject> [campaign=ID] [older=7d] [verified] [ids=1,2,3] [dry]\nAt least one of campaign, older or ids is required.",
+    },
+    "referrals_bulk_preview": {
+        "es": "{count} referidos PENDING coinciden con el filtro.",
+        "en": "{count} PENDING referrals match the filter.",
+    },
+    "referrals_bulk_progress": {
+        "es": "⏳ {status}: {done}/{total} referidos ({chunks} bloques)…",
+        "en": "⏳ {status}: {done}/{total} referrals ({chunks} chunks)…",
+    },
+    "referrals_bulk_done": {
+        "es": "✅ {status}: {done} referidos en {chunks} bloques ({elapsed}s).",
+        "en": "✅ {status}: {done} referrals in {chunks} chunks ({elapsed}s).",
+    },
+    "top_header_referrals": {
+        "es": "🏆 Top referidores ({campaign}) por referidos aprobados:",
+        "en": "🏆 Top referrers ({campaign}) by approved referrals:",
+    },
+    "top_header_points": {"es": "🏆 Top por puntos ({campaign}):", "en": "🏆 Top by points ({campaign}):"},
+    "top_row": {"es": "{rank}. {user} — {score}", "en": "{rank}. {user} — {score}"},
+    "top_you": {"es": "tú", "en": "you"},
+    "top_empty": {"es": "Aún no hay nadie en el ranking.", "en": "Nobody is on the leaderboard yet."},
+    "top_my_rank": {"es": "Tu posición: #{rank} ({score})", "en": "Your rank: #{rank} ({score})"},
+    "top_not_ranked": {"es": "Aún no estás en el ranking.", "en": "You are not on the leaderboard yet."},
+    "help": {
+        "es": "Comandos disponibles:\n/mypoints - Ver tus puntos\n/balance - Ver tu balance\n/withdraw - Retirar\n/mycode - Ver tu código\n/mylink - Ver tu link de referido\n/group - Acceso al grupo\n/top - Ranking de la campaña",
+        "en": "Available commands:\n/mypoints - See your points\n/balance - See your balance\n/withdraw - Withdraw\n/mycode - See your code\n/mylink - See your affiliate link\n/group - Group access\n/top - Campaign leaderboard",
+    },
+}
+
+
+def _fields(template: str) -> frozenset:
+    # Lanza ValueError si la plantilla tiene llaves mal formadas
+    return frozenset(name for _, name, _, _ in Formatter().parse(template) if name)
+
+
+class Catalog:
+    def __init__(self, texts: dict):
+        self._templates = {}
+        for key, by_lang in texts.items():
+            for lang, template in by_lang.items():
+                self._templates[(key, lang)] = (template, _fields(template))
+
+    def override(self, key: str, lang: str, template: str) -> bool:
+        try:
+            fields = _fields(template)
+        except ValueError as e:
+            logger.warning(f"Invalid translation for {key}/{lang}, keeping default: {e}")
+            return False
+        self._templates[(key, lang)] = (template, fields)
+        return True
+
+    def t(self, key, lang, **kwargs):
+        entry = self._templates.get((key, lang))
+        if entry is None:
+            return key
+        template, fields = entry
+        if not kwargs:
+            return template
+        missing = [f for f in fields if f not in kwargs]
+        if missing:
+            return f"[ERROR: Missing params: {', '.join(sorted(missing))}] {template}"
+        return template.format(**kwargs)
+
+    def texts(self) -> dict:
+        out = {}
+        for (key, lang), (template, _) in self._templates.items():
+            out.setdefault(key, {})[lang] = template
+        return out
+
+
+def _load_babel_overrides(catalog: Catalog, locale_dir: str) -> int:
+    from babel.messages.mofile import read_mo
+    from babel.messages.pofile import read_po
+
+    loaded = 0
+    for lang in LANGS:
+        base = os.path.join(locale_dir, lang, "LC_MESSAGES", "messages")
+        if os.path.exists(base + ".mo"):
+            with open(base + ".mo", "rb") as f:
+                messages = read_mo(f)
+        elif os.path.exists(base + ".po"):
+            with open(base + ".po", "rb") as f:
+                messages = read_po(f, locale=lang)
+        else:
+            continue
+        for message in messages:
+            if message.id and isinstance(message.string, str) and message.string:
+                loaded += catalog.override(message.id, lang, message.string)
+    return loaded
+
+
+_catalog: Optional[Catalog] = None
+
+
+def load_catalog(locale_dir: Optional[str] = None) -> Catalog:
+    global _catalog
+    catalog = Catalog(DEFAULT_TEXTS)
+    if locale_dir and os.path.isdir(locale_dir):
+        loaded = _load_babel_overrides(catalog, locale_dir)
+        logger.info(f"Loaded {loaded} translations from {locale_dir}")
+    _catalog = catalog
+    return catalog
+
+
+def get_catalog() -> Catalog:
+    if _catalog is None:
+        return load_catalog()
+    return _catalog
+
+
+def t(key, lang, **kwargs):
+    return get_catalog().t(key, lang, **kwargs)
@@ -1,2 +1,107 @@
 # This file will initialize and run the Telegram bot, importing handlers from bot/handlers.py
 # Keeps the entrypoint clean and modular.
+#
+# Modo webhook: servidor aiohttp que recibe los updates de Telegram, valida el
+# secret token y los procesa en paralelo con un máximo de tareas en vuelo.
+# Se puede probar en local sin Telegram: dejar WEBHOOK_URL vacío y enviar JSON
+# grabado con scripts/post_update.py.
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    def __init__(self, bot: Bot, dp: Dispatcher, secret_token: str, max_concurrency: int = 100):
+        self.bot = bot
+        self.dp = dp
+        self.secret_token = secret_token
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self.stats = {"received": 0, "rejected": 0, "failed": 0}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not self.secret_token or not secrets.compare_digest(token, self.secret_token):
+            self.stats["rejected"] += 1
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Invalid update payload: {e}")
+            return web.Response(status=400)
+        self.stats["received"] += 1
+        # Si todas las plazas están ocupadas esperamos aquí: Telegram ve la
+        # respuesta lenta y reduce el ritmo (backpressure) en vez de acumular tareas.
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher, config) -> web.Application:
+    handler = WebhookHandler(
+        bot,
+        dp,
+        secret_token=config["WEBHOOK_SECRET"],
+        max_concurrency=config["WEBHOOK_MAX_CONCURRENCY"],
+    )
+    app = web.Application()
+    app["webhook_handler"] = handler
+    app.router.add_post(config["WEBHOOK_PATH"], handler.handle)
+
+    async def on_startup(app):
+        if config["WEBHOOK_URL"]:
+            await bot.set_webhook(
+                url=config["WEBHOOK_URL"].rstrip("/") + config["WEBHOOK_PATH"],
+                secret_token=config["WEBHOOK_SECRET"],
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False,
+            )
+            logger.info(f"Webhook set to {config['WEBHOOK_URL']}{config['WEBHOOK_PATH']}")
+        else:
+            logger.info("WEBHOOK_URL empty: not calling setWebhook (local mode)")
+
+    async def on_shutdown(app):
+        await handler.drain()
+        await bot.session.close()
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, config):
+    if not config["WEBHOOK_SECRET"]:
+        raise RuntimeError("Missing WEBHOOK_SECRET for webhook mode")
+    app = build_webhook_app(bot, dp, config)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config["WEBHOOK_HOST"], config["WEBHOOK_PORT"])
+    await site.start()
+    logger.info(f"Webhook server listening on {config['WEBHOOK_HOST']}:{config['WEBHOOK_PORT']}{config['WEBHOOK_PATH']}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
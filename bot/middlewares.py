@@ -0,0 +1,157 @@
+# Middlewares del Dispatcher.
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from bot.routing import command_key
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# (tokens por segundo, ráfaga) por comando / prefijo de callback.
+# Los comandos que consultan balance o crean retiros son los más caros para el pool.
+COMMAND_LIMITS = {
+    "balance": (0.2, 2),
+    "misganancias": (0.2, 2),
+    "withdraw": (0.2, 2),
+    "cobrar": (0.2, 2),
+    "pm": (0.5, 3),
+    "pmc": (0.5, 3),
+    "exportcsv": (1 / 60, 1),
+    "referrals": (1 / 10, 1),
+    "top": (0.5, 3),
+}
+
+
+def update_key(event: TelegramObject) -> str:
+    """Command name for messages, callback prefix for callback queries."""
+    if isinstance(event, CallbackQuery):
+        return (event.data or "").split(":", 1)[0]
+    return command_key(getattr(event, "text", None)) or "msg"
+
+
+class TokenBuckets:
+    # key -> (tokens, last_refill); LRU acotado para que la memoria no crezca con los usuarios
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def _peek(self, key, rate: float, burst: float, now: float) -> float:
+        entry = self._buckets.get(key)
+        if entry is None:
+            return burst
+        tokens, last = entry
+        return min(burst, tokens + (now - last) * rate)
+
+    def _store(self, key, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+
+    def level(self, key, rate: float, burst: float, now: float = None) -> float:
+        return self._peek(key, rate, burst, time.monotonic() if now is None else now)
+
+    def take(self, keys_limits, now: float = None) -> bool:
+        """Consumes one token from every (key, rate, burst) only if all of them have one."""
+        now = time.monotonic() if now is None else now
+        levels = [self._peek(key, rate, burst, now) for key, rate, burst in keys_limits]
+        allowed = all(level >= 1 for level in levels)
+        for (key, _, _), level in zip(keys_limits, levels):
+            self._store(key, level - 1 if allowed else level, now)
+        return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Per-user and per-command token buckets, plus coalescing of duplicate in-flight callbacks."""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 5,
+        command_limits: Dict[str, tuple] = None,
+        max_entries: int = 50_000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.command_limits = COMMAND_LIMITS if command_limits is None else command_limits
+        self.buckets = TokenBuckets(max_entries)
+        self._in_flight = set()
+        self.stats = {"passed": 0, "throttled": 0, "coalesced": 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None:
+            return await handler(event, data)
+        key = update_key(event)
+        limits = [(user.id, self.rate, self.burst)]
+        if key in self.command_limits:
+            rate, burst = self.command_limits[key]
+            limits.append(((user.id, key), rate, burst))
+
+        # Mismo callback del mismo usuario aún en proceso (doble tap): una sola ejecución
+        if isinstance(event, CallbackQuery):
+            flight_key = (user.id, event.data)
+            if flight_key in self._in_flight:
+                self.stats["coalesced"] += 1
+                await self._silent_answer(event)
+                return None
+
+        if not self.buckets.take(limits):
+            self.stats["throttled"] += 1
+            if isinstance(event, CallbackQuery):
+                await self._silent_answer(event)
+            return None
+
+        self.stats["passed"] += 1
+        if not isinstance(event, CallbackQuery):
+            return await handler(event, data)
+        self._in_flight.add(flight_key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(flight_key)
+
+    @staticmethod
+    async def _silent_answer(callback: CallbackQuery) -> None:
+        # Quita el "cargando" del botón sin mostrar nada
+        try:
+            await callback.answer()
+        except Exception:
+            pass
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing each matched handler into bot_handler_duration_seconds."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        # Handlers sin filtros (fallback) reciben cualquier texto: una sola etiqueta
+        # para no crear una serie por cada comando inventado
+        label = update_key(event) if handler_object is None or handler_object.filters else "other"
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.HANDLER_DURATION.observe(time.perf_counter() - start, label, status)
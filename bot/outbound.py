@@ -0,0 +1,184 @@
+# Cola de salida hacia la Bot API.
+# Se instala como middleware de la sesión del Bot, así que todos los
+# message.answer/edit_text pasan por aquí sin tocar los handlers. Respeta el
+# límite global (~30 msg/s) y por chat, honra retry_after de los 429 y da
+# prioridad a las respuestas interactivas sobre los envíos masivos.
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.middlewares import TokenBuckets
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Métodos que cuentan para los límites de envío de Telegram
+LIMITED_METHODS = {
+    "SendMessage",
+    "SendDocument",
+    "SendPhoto",
+    "SendMediaGroup",
+    "CopyMessage",
+    "ForwardMessage",
+    "EditMessageText",
+    "EditMessageReplyMarkup",
+}
+
+outbound_lane: ContextVar[str] = ContextVar("outbound_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane():
+    """Requests made inside this block go to the low-priority lane (broadcasts, notifications)."""
+    token = outbound_lane.set(BULK)
+    try:
+        yield
+    finally:
+        outbound_lane.reset(token)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float = 30,
+        private_rate: float = 1,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3,
+        bulk_share: float = 0.8,
+        max_retries: int = 3,
+        max_chats: int = 100_000,
+    ):
+        self.global_rate = global_rate
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        # Los envíos masivos nunca usan más de bulk_share del cupo global
+        self.bulk_rate = global_rate * bulk_share
+        self._chats = TokenBuckets(max_chats)
+        self._global = TokenBuckets(2)
+        self._lanes = {lane: deque() for lane in LANES}
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._pump_task = None
+        self.stats = {"sent": 0, "queued": 0, "retry_after": 0, "max_wait_ms": 0.0}
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or type(method).__name__ not in LIMITED_METHODS:
+            return await make_request(bot, method)
+        lane = outbound_lane.get()
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, lane)
+            try:
+                result = await make_request(bot, method)
+                self.stats["sent"] += 1
+                return result
+            except TelegramRetryAfter as e:
+                self.stats["retry_after"] += 1
+                self._pause(e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"429 from Telegram, retrying after {e.retry_after}s (chat={chat_id}, attempt={attempt})")
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._wakeup.set()
+
+    def _chat_limit(self, chat_id):
+        # chat_id puede ser "@canal"; solo los ids positivos son chats privados
+        is_private = isinstance(chat_id, int) or str(chat_id).lstrip("-").isdigit()
+        rate = self.private_rate if is_private and int(chat_id) > 0 else self.group_rate
+        return (("chat", chat_id), rate, self.chat_burst)
+
+    async def _acquire(self, chat_id, lane: str) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append((chat_id, fut, time.monotonic()))
+        self.stats["queued"] += 1
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wakeup.set()
+        await fut
+
+    def _release_ready(self, now: float) -> float:
+        """Releases every waiter that can go now. Returns seconds until the next one could."""
+        next_wait = None
+        for lane in LANES:
+            queue = self._lanes[lane]
+            deferred = deque()
+            while queue:
+                chat_id, fut, queued_at = queue.popleft()
+                if fut.done():
+                    continue
+                limits = [("global", self.global_rate, self.global_rate)]
+                if lane == BULK:
+                    limits.append(("bulk", self.bulk_rate, self.bulk_rate))
+                limits.append(self._chat_limit(chat_id))
+                if self._global.level(*limits[0], now) < 1 or (
+                    lane == BULK and self._global.level(*limits[1], now) < 1
+                ):
+                    # Sin cupo global: el resto de la cola espera
+                    deferred.append((chat_id, fut, queued_at))
+                    deferred.extend(queue)
+                    queue.clear()
+                    next_wait = min(next_wait or 1.0, 1 / self.global_rate)
+                    break
+                chat_key, chat_rate, chat_burst = limits[-1]
+                chat_level = self._chats.level(chat_key, chat_rate, chat_burst, now)
+                if chat_level < 1:
+                    # Este chat aún no puede recibir; no bloquea a los demás
+                    deferred.append((chat_id, fut, queued_at))
+                    wait = (1 - chat_level) / chat_rate
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    continue
+                self._global.take(limits[:-1], now)
+                self._chats.take([limits[-1]], now)
+                self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], (now - queued_at) * 1000)
+                fut.set_result(None)
+            self._lanes[lane] = deferred
+        return next_wait
+
+    async def _pump(self) -> None:
+        while True:
+            if not any(self._lanes.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._wakeup.clear()
+            next_wait = self._release_ready(now)
+            if next_wait is None:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        """Stops the pump; requests still waiting in the queues are cancelled."""
+        task, self._pump_task = self._pump_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        for lane in LANES:
+            queue = self._lanes[lane]
+            while queue:
+                _, fut, _ = queue.popleft()
+                fut.cancel()
+
+    def queue_sizes(self) -> dict:
+        return {lane: len(q) for lane, q in self._lanes.items()}
@@ -0,0 +1,145 @@
+# Enrutado por tabla de prefijos.
+# Los callbacks llevan datos tipados (CallbackData de aiogram) y cada update se parsea
+# una sola vez: PrefixRouter mira el prefijo del callback (o el nombre del comando),
+# busca en un dict el Router de esa funcionalidad y solo propaga el evento ahí, con el
+# payload ya desempaquetado en callback_data. Así el costo por update no crece con la
+# cantidad de botones o comandos registrados, a diferencia de una cadena de filtros
+# lambda que se evalúan uno tras otro (scripts/bench_routing.py).
+# Los prefijos "pm"/"pmc" y su formato son los mismos de antes: los botones ya enviados
+# siguen funcionando y ThrottlingMiddleware sigue limitando por prefijo.
+import logging
+from enum import Enum
+from typing import Dict, Optional, Tuple, Type
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import BotCommand, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class MenuAction(str, Enum):
+    code = "code"
+    link = "link"
+    group = "group"
+
+
+class MenuCallback(CallbackData, prefix="menu"):
+    action: MenuAction
+
+
+class PayoutMethodCallback(CallbackData, prefix="pm"):
+    method: str
+
+
+class PayoutConfirmAction(str, Enum):
+    yes = "yes"
+    edit = "edit"
+
+
+class PayoutConfirmCallback(CallbackData, prefix="pmc"):
+    method: str
+    action: PayoutConfirmAction
+
+
+# Botones del menú de /start anteriores a MenuCallback: siguen llegando desde mensajes viejos
+LEGACY_MENU_CALLBACKS = {
+    "remember_code": MenuCallback(action=MenuAction.code),
+    "get_affiliate_link": MenuCallback(action=MenuAction.link),
+    "get_group_link": MenuCallback(action=MenuAction.group),
+}
+
+
+def is_payload(factory: Type[CallbackData]):
+    """Handler filter on the payload PrefixRouter already unpacked (no second parse)."""
+
+    def check(event: TelegramObject, callback_data: Optional[CallbackData] = None) -> bool:
+        return isinstance(callback_data, factory)
+
+    return check
+
+
+def command_key(text: Optional[str]) -> Optional[str]:
+    """'/Balance@my_bot 10' -> 'balance'; None if text is not a command."""
+    if not text or not text.startswith("/"):
+        return None
+    name = text[1:].split(maxsplit=1)[0] if text[1:2].strip() else ""
+    return name.split("@", 1)[0].lower() or None
+
+
+def router_commands(router: Router) -> list:
+    """Command names handled by the Command filters of router's message handlers."""
+    names = []
+    for handler in router.message.handlers:
+        for filter_object in handler.filters or ():
+            command = filter_object.callback
+            if not isinstance(command, Command):
+                continue
+            for name in command.commands:
+                if isinstance(name, BotCommand):
+                    name = name.command
+                if not isinstance(name, str):
+                    raise ValueError(f"Router {router.name}: pattern commands cannot be routed by name")
+                names.append(name.lower())
+    return names
+
+
+class PrefixRouter(Router):
+    """Propagates each callback query / command only into the sub-router registered for its key."""
+
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        # clave -> (router, factory para desempaquetar | None, payload fijo | None)
+        self._callbacks: Dict[str, Tuple[Router, Optional[Type[CallbackData]], Optional[CallbackData]]] = {}
+        self._commands: Dict[str, Router] = {}
+
+    def _attach(self, router: Router) -> Router:
+        if router.parent_router is not self:
+            self.include_router(router)
+        return router
+
+    def _add_callback(self, key: str, route: tuple) -> None:
+        if key in self._callbacks:
+            raise ValueError(f"Callback prefix {key!r} is already routed to {self._callbacks[key][0].name}")
+        self._callbacks[key] = route
+
+    def include_callbacks(self, router: Router, *factories: Type[CallbackData], legacy: Optional[dict] = None) -> Router:
+        """Routes the callback data of factories (and fixed legacy strings -> payload) into router."""
+        for factory in factories:
+            self._add_callback(factory.__prefix__, (router, factory, None))
+        for data, payload in (legacy or {}).items():
+            self._add_callback(data, (router, None, payload))
+        return self._attach(router)
+
+    def include_commands(self, router: Router, *commands: str) -> Router:
+        """Routes commands into router; by default the ones its Command filters declare."""
+        for command in commands or router_commands(router):
+            command = command.lower()
+            if command in self._commands:
+                raise ValueError(f"Command /{command} is already routed to {self._commands[command].name}")
+            self._commands[command] = router
+        return self._attach(router)
+
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs) -> object:
+        if update_type == "callback_query":
+            data = event.data or ""
+            route = self._callbacks.get(data.split(":", 1)[0])
+            if route is None:
+                return UNHANDLED
+            router, factory, payload = route
+            if factory is not None:
+                try:
+                    payload = factory.unpack(data)
+                except (TypeError, ValueError):
+                    logger.debug(f"Malformed callback data: {data!r}")
+                    return UNHANDLED
+            return await router.propagate_event(update_type, event, callback_data=payload, **kwargs)
+        if update_type == "message":
+            # Los mensajes que no son comandos siguen hacia los routers siguientes (FSM, fallback)
+            router = self._commands.get(command_key(event.text or event.caption))
+            if router is None:
+                return UNHANDLED
+            return await router.propagate_event(update_type, event, **kwargs)
+        return await super().propagate_event(update_type, event, **kwargs)
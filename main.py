@@ -6,9 +6,11 @@ load_dotenv(".env")
 load_dotenv(".env.dev", override=True)
 print("DEBUG: DATABASE_URL=", os.getenv("DATABASE_URL"))
 
+import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from bot.handlers import register_handlers
+from bot.i18n import get_catalog, load_catalog
 
 def load_config():
 	return {
@@ -24,72 +26,123 @@ def load_config():
 		"MIN_WITHDRAW_CENTS": int(os.getenv("MIN_WITHDRAW_CENTS", "2500")),
 		"PAYPAL_PERCENT_FEE": float(os.getenv("PAYPAL_PERCENT_FEE", "5.2")),
 		"PAYPAL_FIXED_FEE": float(os.getenv("PAYPAL_FIXED_FEE", "0.30")),
+		"TELEGRAM_API_BASE": os.getenv("TELEGRAM_API_BASE", ""),
+		# Límites de salida (mensajes por segundo)
+		"OUTBOUND_GLOBAL_RATE": float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+		"OUTBOUND_PRIVATE_RATE": float(os.getenv("OUTBOUND_PRIVATE_RATE", "1")),
+		"OUTBOUND_GROUP_RATE": float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60))),
+		# Endpoint /metrics (Prometheus); 0 lo desactiva
+		"METRICS_HOST": os.getenv("METRICS_HOST", "127.0.0.1"),
+		"METRICS_PORT": int(os.getenv("METRICS_PORT", "9108")),
+		# polling | webhook
+		"BOT_MODE": os.getenv("BOT_MODE", "polling").strip().lower(),
+		"WEBHOOK_URL": os.getenv("WEBHOOK_URL", ""),
+		"WEBHOOK_PATH": os.getenv("WEBHOOK_PATH", "/webhook"),
+		"WEBHOOK_SECRET": os.getenv("WEBHOOK_SECRET", ""),
+		"WEBHOOK_HOST": os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+		"WEBHOOK_PORT": int(os.getenv("WEBHOOK_PORT", "8080")),
+		"WEBHOOK_MAX_CONCURRENCY": int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100")),
 	}
 
+# Loops de fondo: asyncio solo guarda referencias débiles a las tasks, así que se
+# mantienen aquí hasta que terminan y se cancelan al apagar
+_background_tasks = set()
+
+def _on_background_done(task: asyncio.Task):
+	_background_tasks.discard(task)
+	if not task.cancelled() and task.exception() is not None:
+		logging.error(f"Background task {task.get_name()} stopped", exc_info=task.exception())
+
+def start_background(coro, name: str) -> asyncio.Task:
+	task = asyncio.create_task(coro, name=name)
+	_background_tasks.add(task)
+	task.add_done_callback(_on_background_done)
+	return task
+
+async def stop_background():
+	tasks = list(_background_tasks)
+	for task in tasks:
+		task.cancel()
+	await asyncio.gather(*tasks, return_exceptions=True)
+
 def get_texts():
-	# Diccionario de textos traducidos
-	return {
-		"your_points": {"es": "Tus puntos", "en": "Your points"},
-		"balance_header": {"es": "💰 Tu balance:", "en": "💰 Your balance:"},
-		"balance_body": {
-			"es": (
-				"Referidos aprobados: {approved}\n"
-				"Comisión por referido: {commission}\n"
-				"Bruto ganado: {gross}\n"
-				"Pagado: {paid}\n"
-				"Retiros pendientes: {pending}\n"
-				"\nDisponible ahora: {available}"
-			),
-			"en": (
-				"Approved referrals: {approved}\n"
-				"Commission per referral: {commission}\n"
-				"Gross earned: {gross}\n"
-				"Paid out: {paid}\n"
-				"Pending withdrawals: {pending}\n"
-				"\nAvailable now: {available}"
-			)
-		},
-		   "withdraw_created": {
-			   "es": "✅ Su retiro se está procesando. Le contactaremos pronto.",
-			   "en": "✅ Your withdrawal is being processed. We will contact you soon."
-		   },
-		   "confirm_account": {
-			   "es": "¿Confirmas que este es tu dato de {method}: {account}?",
-			   "en": "Do you confirm this {method} account: {account}?"
-		   },
-		"mycode_has": {"es": "Tu código de referido es:", "en": "Your referral code is:"},
-		"mycode_missing": {"es": "No tienes código asignado.", "en": "You have no code assigned."},
-		"start_mobile_only": {"es": "¡Bienvenido! Usa los comandos para interactuar con el bot.", "en": "Welcome! Use the commands to interact with the bot."},
-		"group_access": {"es": "Acceso al grupo: {link}", "en": "Group access: {link}"},
-		"your_affiliate_link": {"es": "Tu link de referido: {link}", "en": "Your affiliate link: {link}"},
-		"help": {"es": "Comandos disponibles:\n/mypoints - Ver tus puntos\n/balance - Ver tu balance\n/withdraw - Retirar\n/mycode - Ver tu código\n/mylink - Ver tu link de referido\n/group - Acceso al grupo", "en": "Available commands:\n/mypoints - See your points\n/balance - See your balance\n/withdraw - Withdraw\n/mycode - See your code\n/mylink - See your affiliate link\n/group - Group access"}
-	}
+	# Textos traducidos (precompilados una sola vez en bot/i18n.py)
+	return get_catalog().texts()
 
 def t(key, lang, **kwargs):
-	texts = get_texts()
-	value = texts.get(key, {}).get(lang, key)
-	if kwargs:
-		try:
-			return value.format(**kwargs)
-		except Exception as e:
-			missing = ', '.join([k for k in value.split('{')[1:] if '}' in k and k.split('}')[0] not in kwargs])
-			return f"[ERROR: Missing params: {missing}] {value}"
-	return value
+	return get_catalog().t(key, lang, **kwargs)
 
 async def main():
 	from services.db_service import open_pool
 	await open_pool()
 	config = load_config()
 	logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
-	bot = Bot(token=config["BOT_TOKEN"])
-	dp = Dispatcher()
+	load_catalog(os.getenv("LOCALE_DIR", "locales"))
+	from services.migrations import pending_migrations
+	pending = await pending_migrations()
+	if pending:
+		logging.warning(f"Pending schema migrations: {', '.join(f'{v:04d}_{n}' for v, n in pending)}. Run: python -m scripts.migrate")
+	session = None
+	if config["TELEGRAM_API_BASE"]:
+		# Servidor Bot API alternativo (p.ej. scripts/fake_bot_api.py en pruebas locales)
+		from aiogram.client.session.aiohttp import AiohttpSession
+		from aiogram.client.telegram import TelegramAPIServer
+		session = AiohttpSession(api=TelegramAPIServer.from_base(config["TELEGRAM_API_BASE"]))
+	bot = Bot(token=config["BOT_TOKEN"], session=session)
+	from bot.outbound import OutboundScheduler
+	outbound = OutboundScheduler(
+		global_rate=config["OUTBOUND_GLOBAL_RATE"],
+		private_rate=config["OUTBOUND_PRIVATE_RATE"],
+		group_rate=config["OUTBOUND_GROUP_RATE"],
+	)
+	bot.session.middleware(outbound)
+	from bot.fsm_storage import PostgresStorage
+	storage = PostgresStorage(
+		state_ttl=float(os.getenv("FSM_STATE_TTL_SECONDS", "3600")),
+		cache_ttl=float(os.getenv("FSM_CACHE_TTL_SECONDS", "5")),
+		cache_max_entries=int(os.getenv("FSM_CACHE_MAX_ENTRIES", "10000")),
+	)
+	start_background(storage.run_purge_loop(), "fsm_purge")
+	from services.db_service import rebuild_code_filter, run_code_filter_listener, run_code_filter_sync_loop
+	await rebuild_code_filter()
+	start_background(run_code_filter_sync_loop(float(os.getenv("CODE_FILTER_SYNC_SECONDS", "5"))), "code_filter_sync")
+	start_background(run_code_filter_listener(), "code_filter_listen")
+	from services.db_service import run_leaderboard_flush_loop
+	start_background(run_leaderboard_flush_loop(float(os.getenv("LEADERBOARD_FLUSH_SECONDS", "5"))), "leaderboard_flush")
+	from services.partitions import run_partition_maintenance_loop
+	start_background(run_partition_maintenance_loop(float(os.getenv("PARTITION_MAINTENANCE_SECONDS", "21600"))), "partition_maintenance")
+	dp = Dispatcher(storage=storage)
+	from bot.middlewares import ThrottlingMiddleware
+	throttling = ThrottlingMiddleware(
+		rate=float(os.getenv("THROTTLE_RATE_PER_SECOND", "1")),
+		burst=float(os.getenv("THROTTLE_BURST", "5")),
+	)
+	dp.message.outer_middleware(throttling)
+	dp.callback_query.outer_middleware(throttling)
+	from bot.middlewares import MetricsMiddleware
+	dp.message.middleware(MetricsMiddleware())
+	dp.callback_query.middleware(MetricsMiddleware())
+	if config["METRICS_PORT"]:
+		from services.metrics import start_metrics_server
+		await start_metrics_server(config["METRICS_HOST"], config["METRICS_PORT"])
 	texts = get_texts()
 	register_handlers(dp, config, texts, t)
-	print("Bot is starting...")
-	await dp.start_polling(bot)
+	from services.broadcast_service import resume_broadcasts
+	await resume_broadcasts(bot)
+	print(f"Bot is starting ({config['BOT_MODE']})...")
+	try:
+		if config["BOT_MODE"] == "webhook":
+			from bot.main import run_webhook
+			await run_webhook(bot, dp, config)
+			return
+		# chat_member no llega por defecto: pedir solo los tipos de update que usamos
+		await bot.delete_webhook(drop_pending_updates=False)
+		await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+	finally:
+		await stop_background()
+		await outbound.close()
 
 if __name__ == "__main__":
-	import asyncio
 	asyncio.run(main())
 # This file will serve as the main entrypoint for the SaaS app.
 # It can launch the bot, API, or both, depending on configuration.
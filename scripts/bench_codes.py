@@ -0,0 +1,77 @@
+# Benchmark del asignador de códigos bajo registros concurrentes.
+# Requiere un Postgres local (DATABASE_URL) con el esquema de scripts/init_db.py.
+# Uso: python -m scripts.bench_codes --codes 100000 --concurrency 64 [--registrations 2000]
+import argparse
+import asyncio
+import time
+
+from services import db_service
+from services.code_allocator import CodeAllocator
+from services.referral_service import assign_or_get_code
+
+BENCH_USER_BASE = 9_100_000_000_000
+
+
+async def bench_allocation(codes: int, concurrency: int):
+    allocator = CodeAllocator()
+    issued = []
+    remaining = codes
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            issued.append(await allocator.next_code(prefix="CR"))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    unique = len(set(issued))
+    print(
+        f"allocation: {len(issued)} codes in {elapsed:.3f}s -> {len(issued) / elapsed:,.0f} codes/s, "
+        f"{allocator.blocks_reserved} block reservations, unique={unique == len(issued)}"
+    )
+
+
+async def bench_registrations(users: int, concurrency: int):
+    # Registro completo (assign_or_get_code -> INSERT users) con usuarios sintéticos
+    user_ids = list(range(BENCH_USER_BASE, BENCH_USER_BASE + users))
+    queue = list(user_ids)
+    results = []
+
+    async def worker():
+        while queue:
+            uid = queue.pop()
+            results.append(await assign_or_get_code(uid, f"+999{uid}", "CR", None))
+
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        failed = sum(1 for r in results if r is None)
+        print(
+            f"registrations: {len(results)} users in {elapsed:.3f}s -> {len(results) / elapsed:,.0f} users/s, "
+            f"failed={failed}"
+        )
+    finally:
+        for uid in user_ids:
+            await db_service.delete_user(uid)
+
+
+async def main(args):
+    db_service.logger.setLevel("WARNING")
+    await db_service.open_pool()
+    try:
+        await bench_allocation(args.codes, args.concurrency)
+        if args.registrations:
+            await bench_registrations(args.registrations, args.concurrency)
+    finally:
+        await db_service.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark referral code allocation throughput")
+    parser.add_argument("--codes", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--registrations", type=int, default=0, help="also run N end-to-end registrations (writes users)")
+    asyncio.run(main(parser.parse_args()))
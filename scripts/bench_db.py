@@ -0,0 +1,92 @@
+# Benchmark de las consultas calientes de db_service: ad-hoc vs prepared + pipeline.
+# Requiere un Postgres local (DATABASE_URL) con el esquema de scripts/init_db.py.
+# Uso: python -m scripts.bench_db --iterations 2000 --concurrency 8 [--writes]
+import argparse
+import asyncio
+import statistics
+import time
+
+from services import db_service
+
+BENCH_USER_ID = 9_000_000_000_001
+BENCH_CODE = "BENCH-0000-0001"
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _run(name, fn, iterations, concurrency):
+    latencies = []
+    remaining = iterations
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            await fn()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "name": name,
+        "ops_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+    }
+
+
+async def _bench_mode(label, prepared, pipeline, args):
+    db_service.PREPARE_HOT_STATEMENTS = prepared
+    db_service.PREPARE_THRESHOLD = 0 if prepared else None
+    db_service.USE_PIPELINE = pipeline
+    # Pool nuevo por modo: los prepared statements viven en cada conexión
+    await db_service.open_pool()
+    try:
+        await db_service.upsert_user(BENCH_USER_ID, BENCH_CODE)
+        cases = [
+            ("code_by_user", lambda: db_service.get_existing_code_by_user(BENCH_USER_ID)),
+            ("user_by_code", lambda: db_service.find_user_by_code(BENCH_CODE)),
+            ("user_points", lambda: db_service.get_user_points(BENCH_USER_ID)),
+            ("balances", lambda: db_service.compute_balances(BENCH_USER_ID, "bench", 100)),
+        ]
+        if args.writes:
+            cases.append(("add_points", lambda: db_service.add_points(BENCH_USER_ID, 0, "bench")))
+        results = []
+        for name, fn in cases:
+            await fn()  # warm-up (prepare)
+            results.append(await _run(name, fn, args.iterations, args.concurrency))
+        return label, results
+    finally:
+        await db_service.delete_user(BENCH_USER_ID)
+        await db_service.close_pool()
+
+
+async def main(args):
+    logging_level = db_service.logger.level
+    db_service.logger.setLevel("WARNING")
+    modes = [
+        await _bench_mode("adhoc", prepared=False, pipeline=False, args=args),
+        await _bench_mode("prepared+pipeline", prepared=True, pipeline=True, args=args),
+    ]
+    db_service.logger.setLevel(logging_level)
+    print(f"{'mode':<20}{'query':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, results in modes:
+        for r in results:
+            print(f"{label:<20}{r['name']:<16}{r['ops_s']:>10.0f}{r['p50']:>10.3f}{r['p95']:>10.3f}{r['p99']:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hot db_service queries")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--writes", action="store_true", help="also benchmark add_points (writes points_history rows)")
+    asyncio.run(main(parser.parse_args()))
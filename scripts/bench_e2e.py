@@ -0,0 +1,265 @@
+# Benchmark end-to-end de los handlers con un backend de Telegram falso.
+# Construye el Dispatcher real (register_handlers) con un Bot cuya sesión responde
+# en memoria (scripts/fake_bot_api.FakeSession) y hace pasar N usuarios sintéticos
+# por: registro de código, /start, referido, /balance y el flujo completo de retiro
+# (/withdraw -> monto -> pm: -> cuenta -> pmc:yes). Reporta throughput y p50/p95/p99
+# por paso, y la espera por conexiones del pool.
+#
+# Requiere un Postgres local (DATABASE_URL) con el esquema completo (campaigns con
+# client_id/group_chat_id/commission_per_approved_cents, users.client_id, payments,
+# payout_methods). Los datos sintéticos se borran al terminar salvo con --keep.
+# Uso: python -m scripts.bench_e2e --users 2000 --concurrency 100 [--memory-fsm] [--throttle]
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from collections import defaultdict
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+from bot.handlers import register_handlers
+from bot.i18n import get_catalog, load_catalog
+from scripts.fake_bot_api import FakeBotAPI, FakeSession
+from services import db_service, membership_service
+from services.referral_service import assign_or_get_code, register_referral
+from utils.helpers import get_lang
+
+BENCH_USER_BASE = 9_200_000_000_000
+BENCH_GROUP_ID = -1009_200_000_000
+BENCH_CAMPAIGN = "bench-e2e"
+COMMISSION_CENTS = 500
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = {}
+
+    async def timed(self, step: str, coro):
+        t0 = time.perf_counter()
+        try:
+            return await coro
+        except Exception as e:
+            self.errors[step] += 1
+            if self.errors[step] <= 3:
+                print(f"  [{step}] error: {type(e).__name__}: {e}")
+        finally:
+            self.latencies[step].append((time.perf_counter() - t0) * 1000)
+
+    def report(self):
+        print(f"\n{'step':<18}{'count':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for step, values in self.latencies.items():
+            values = sorted(values)
+            elapsed = self.elapsed.get(step) or sum(values) / 1000
+            print(
+                f"{step:<18}{len(values):>8}{self.errors[step]:>8}{len(values) / elapsed:>10.0f}"
+                f"{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}{percentile(values, 99):>10.2f}"
+            )
+
+
+class UpdateFactory:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": "Bench", "language_code": "es"}
+
+    def message(self, uid: int, text: str) -> Update:
+        n = next(self._ids)
+        return Update.model_validate({
+            "update_id": n,
+            "message": {
+                "message_id": n,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": self._user(uid),
+                "text": text,
+            },
+        }, context={"bot": self.bot})
+
+    def callback(self, uid: int, data: str) -> Update:
+        n = next(self._ids)
+        return Update.model_validate({
+            "update_id": n,
+            "callback_query": {
+                "id": str(n),
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "data": data,
+                "message": {
+                    "message_id": n,
+                    "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+                    "text": "...",
+                },
+            },
+        }, context={"bot": self.bot})
+
+
+async def seed(user_ids: list):
+    pool = db_service.get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("INSERT INTO clients (name) VALUES ('bench-e2e') RETURNING id;")
+        client_id = (await cur.fetchone())[0]
+        await cur.execute("""
+            INSERT INTO campaigns (id, client_id, name, status, group_chat_id, commission_per_approved_cents, min_withdraw_cents, currency)
+            VALUES (%s, %s, 'Bench', 'ACTIVE', %s, %s, 100, '$')
+            ON CONFLICT (id) DO UPDATE SET client_id = EXCLUDED.client_id, status = 'ACTIVE';
+        """, (BENCH_CAMPAIGN, client_id, BENCH_GROUP_ID, COMMISSION_CENTS))
+        await conn.commit()
+    return client_id
+
+
+async def cleanup(user_ids: list, client_id):
+    pool = db_service.get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        for sql in (
+            "DELETE FROM referrals WHERE campaign_id = %(c)s",
+            "DELETE FROM payments WHERE user_id = ANY(%(u)s)",
+            "DELETE FROM payout_methods WHERE user_id = ANY(%(u)s)",
+            "DELETE FROM points_history WHERE user_id = ANY(%(u)s)",
+            "DELETE FROM user_balances WHERE user_id = ANY(%(u)s)",
+            "DELETE FROM leaderboard_scores WHERE campaign_id = %(c)s",
+            "DELETE FROM group_members WHERE chat_id = %(g)s",
+            "DELETE FROM fsm_states WHERE key LIKE %(k)s",
+            "DELETE FROM users WHERE id = ANY(%(u)s)",
+            "DELETE FROM campaigns WHERE id = %(c)s",
+            "DELETE FROM clients WHERE id = %(cl)s",
+        ):
+            await cur.execute(sql, {"c": BENCH_CAMPAIGN, "u": user_ids, "g": BENCH_GROUP_ID, "k": "%:9200%", "cl": client_id})
+        await conn.commit()
+
+
+async def run_phase(rec: Recorder, name: str, user_ids: list, concurrency: int, scenario):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(uid):
+        async with slots:
+            await scenario(uid)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(uid) for uid in user_ids))
+    elapsed = time.perf_counter() - t0
+    for step in list(rec.latencies):
+        if step.startswith(name):
+            rec.elapsed[step] = elapsed
+    print(f"phase {name}: {len(user_ids)} users in {elapsed:.2f}s")
+
+
+async def main(args):
+    db_service.logger.setLevel("WARNING")
+    await db_service.open_pool()
+    load_catalog()
+    config = {
+        "BOT_USERNAME": "bench_bot",
+        "ADMIN_USER_IDS": [],
+        "GROUP_CHAT_ID": str(BENCH_GROUP_ID),
+        "POINTS_PER_REFERRAL": 1,
+    }
+    api = FakeBotAPI()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FakeSession(api, latency=args.api_latency_ms / 1000))
+    if args.memory_fsm:
+        storage = MemoryStorage()
+    else:
+        from bot.fsm_storage import PostgresStorage
+        storage = PostgresStorage()
+    dp = Dispatcher(storage=storage)
+    if args.throttle:
+        from bot.middlewares import ThrottlingMiddleware
+        throttling = ThrottlingMiddleware()
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+    register_handlers(dp, config, get_catalog().texts(), get_catalog().t)
+    updates = UpdateFactory(bot)
+    rec = Recorder()
+    t = get_catalog().t
+
+    user_ids = list(range(BENCH_USER_BASE, BENCH_USER_BASE + args.users))
+    codes = {}
+    client_id = await seed(user_ids)
+    db_service.get_pool().pop_stats()
+
+    async def feed(step, uid, update):
+        await rec.timed(step, dp.feed_update(bot, update))
+
+    async def register(uid):
+        codes[uid] = await rec.timed("register", assign_or_get_code(uid, f"+999{uid}", "CR", None))
+
+    async def start(uid):
+        await feed("start", uid, updates.message(uid, "/start"))
+
+    async def referral(uid):
+        # Cada usuario refiere al siguiente; el primero no tiene referidor
+        referrer = uid - 1
+        if referrer not in codes:
+            return
+        message = updates.message(uid, f"/start {codes[referrer]}").message
+        await rec.timed("referral", register_referral(
+            BENCH_CAMPAIGN, uid, codes[referrer], str(BENCH_GROUP_ID), 1, bot, get_lang, t, message
+        ))
+
+    async def approve(uid):
+        await rec.timed("approve", db_service.set_referral_status(BENCH_CAMPAIGN, uid, "APPROVED"))
+
+    async def balance(uid):
+        await feed("balance", uid, updates.message(uid, "/balance"))
+
+    async def withdraw(uid):
+        await feed("withdraw_cmd", uid, updates.message(uid, "/withdraw"))
+        await feed("withdraw_amount", uid, updates.message(uid, "1"))
+        await feed("withdraw_method", uid, updates.callback(uid, "pm:Paypal"))
+        await feed("withdraw_account", uid, updates.message(uid, f"bench{uid}@example.com"))
+        await feed("withdraw_confirm", uid, updates.callback(uid, "pmc:Paypal:yes"))
+
+    try:
+        await run_phase(rec, "register", user_ids, args.concurrency, register)
+        pool = db_service.get_pool()
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute("UPDATE users SET client_id = %s WHERE id = ANY(%s);", (client_id, user_ids))
+            await conn.commit()
+        db_service.invalidate_campaign_cache()
+        await run_phase(rec, "start", user_ids, args.concurrency, start)
+        await run_phase(rec, "referral", user_ids, args.concurrency, referral)
+        await run_phase(rec, "approve", user_ids[1:], args.concurrency, approve)
+        await run_phase(rec, "balance", user_ids, args.concurrency, balance)
+        await run_phase(rec, "withdraw", user_ids[:-1], args.concurrency, withdraw)
+        pool_stats = db_service.get_pool().pop_stats()
+        rec.report()
+        waits = pool_stats.get("requests_num", 0)
+        print(
+            f"\npool: {waits} connection requests, total wait {pool_stats.get('requests_wait_ms', 0)} ms "
+            f"(avg {pool_stats.get('requests_wait_ms', 0) / max(1, waits):.2f} ms), "
+            f"queued={pool_stats.get('requests_queued', 0)}, size={pool_stats.get('pool_size')}"
+        )
+        print(f"fake Bot API calls: {dict(api.stats)}")
+        print(f"membership index: {membership_service.stats}")
+    finally:
+        if not args.keep:
+            await cleanup(user_ids, client_id)
+        await db_service.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end handler benchmark with a fake Telegram backend")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated Bot API round trip")
+    parser.add_argument("--memory-fsm", action="store_true", help="use aiogram MemoryStorage instead of PostgresStorage")
+    parser.add_argument("--throttle", action="store_true", help="install the throttling middleware (drops bursts)")
+    parser.add_argument("--keep", action="store_true", help="do not delete the synthetic rows")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,114 @@
+# Micro-benchmark del costo de enrutar un update, sin base de datos ni red.
+# Con N botones y N comandos sintéticos compara:
+#   - lineal: todos los handlers en el Dispatcher, callbacks con filtro lambda
+#     (c.data.startswith("bN:")) como antes de bot/routing.py;
+#   - tabla:  un CallbackData y un Router por botón/comando detrás de PrefixRouter.
+# Los handlers no hacen nada: lo medido es dp.feed_update (filtros, inyección de
+# dependencias y parseo del callback). Se reporta µs por update para una mezcla
+# aleatoria de botones y para el último registrado (peor caso del lineal).
+# Uso: python -m scripts.bench_routing [--sizes 5 50 500] [--updates 2000]
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import Update
+
+from bot.routing import PrefixRouter, is_payload
+
+
+async def noop(*args, **kwargs):
+    return None
+
+
+def button_factory(i: int):
+    return type(f"Button{i}", (CallbackData,), {"__annotations__": {"value": str}, "__module__": __name__}, prefix=f"b{i}")
+
+
+def linear_dispatcher(size: int) -> Dispatcher:
+    dp = Dispatcher()
+    for i in range(size):
+        dp.callback_query.register(noop, lambda c, prefix=f"b{i}:": c.data.startswith(prefix))
+        dp.message.register(noop, Command(f"c{i}"))
+    dp.message.register(noop)
+    return dp
+
+
+def table_dispatcher(size: int) -> Dispatcher:
+    dp = Dispatcher()
+    routes = PrefixRouter(name="routes")
+    for i in range(size):
+        factory = button_factory(i)
+        buttons = Router(name=f"buttons{i}")
+        buttons.callback_query.register(noop, is_payload(factory))
+        routes.include_callbacks(buttons, factory)
+        commands = Router(name=f"commands{i}")
+        commands.message.register(noop, Command(f"c{i}"))
+        routes.include_commands(commands)
+    fallback = Router(name="fallback")
+    fallback.message.register(noop)
+    dp.include_routers(routes, fallback)
+    return dp
+
+
+class Updates:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+        self._user = {"id": 1, "is_bot": False, "first_name": "Bench"}
+
+    def callback(self, data: str) -> Update:
+        n = next(self._ids)
+        return Update.model_validate({
+            "update_id": n,
+            "callback_query": {"id": str(n), "from": self._user, "chat_instance": "1", "data": data},
+        }, context={"bot": self.bot})
+
+    def message(self, text: str) -> Update:
+        n = next(self._ids)
+        return Update.model_validate({
+            "update_id": n,
+            "message": {"message_id": n, "date": 0, "chat": {"id": 1, "type": "private"}, "from": self._user, "text": text},
+        }, context={"bot": self.bot})
+
+
+async def time_updates(dp: Dispatcher, bot: Bot, updates: list) -> float:
+    """Microseconds per update."""
+    t0 = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - t0) / len(updates) * 1e6
+
+
+async def main(args):
+    bot = Bot(token="123456:BENCH")
+    factory = Updates(bot)
+    rng = random.Random(args.seed)
+    print(f"{'buttons':>8}{'kind':>10}{'linear µs':>12}{'table µs':>12}")
+    for size in args.sizes:
+        mixes = {
+            "cb mix": [factory.callback(f"b{rng.randrange(size)}:x") for _ in range(args.updates)],
+            "cb last": [factory.callback(f"b{size - 1}:x") for _ in range(args.updates)],
+            "cmd mix": [factory.message(f"/c{rng.randrange(size)}") for _ in range(args.updates)],
+            "text": [factory.message("hola") for _ in range(args.updates)],
+        }
+        dispatchers = {"linear": linear_dispatcher(size), "table": table_dispatcher(size)}
+        for kind, updates in mixes.items():
+            results = {}
+            for name, dp in dispatchers.items():
+                await time_updates(dp, bot, updates[: max(1, len(updates) // 10)])  # calentamiento
+                results[name] = await time_updates(dp, bot, updates)
+            print(f"{size:>8}{kind:>10}{results['linear']:>12.1f}{results['table']:>12.1f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispatch cost per update: lambda filter chain vs prefix table")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+# Aprueba o rechaza referidos PENDING por filtro, en bloques (UPDATE por conjuntos).
+# Uso: python -m scripts.bulk_referrals approve --campaign CAMP1 [--older-than 7d] [--verified]
+#      python -m scripts.bulk_referrals reject --ids 111,222 --clawback-points 1
+#      ... --dry-run solo cuenta las filas que coinciden
+import argparse
+import asyncio
+import os
+
+from services.db_service import open_pool, close_pool, count_pending_referrals, bulk_set_referral_status
+from utils.helpers import parse_age
+
+async def main(args):
+    await open_pool()
+    try:
+        filters = {
+            "campaign_id": args.campaign,
+            "older_than": args.older_than,
+            "verified": args.verified,
+            "referee_ids": args.ids,
+            "default_chat_id": os.getenv("GROUP_CHAT_ID"),
+        }
+        total = await count_pending_referrals(**filters)
+        print(f"{total} referidos PENDING coinciden con el filtro")
+        if args.dry_run or not total:
+            return
+
+        async def on_progress(done, chunks):
+            print(f"  {done}/{total} ({chunks} bloques)", flush=True)
+
+        result = await bulk_set_referral_status(
+            "APPROVED" if args.action == "approve" else "REJECTED",
+            chunk_size=args.chunk_size,
+            clawback_points=args.clawback_points if args.action == "reject" else 0,
+            on_progress=on_progress,
+            **filters,
+        )
+        print(f"{result['status']}: {result['updated']} referidos en {result['chunks']} bloques ({result['elapsed']:.1f}s)")
+    finally:
+        await close_pool()
+
+def _age(value):
+    age = parse_age(value)
+    if age is None:
+        raise argparse.ArgumentTypeError("use e.g. 30m, 48h, 7d, 2w")
+    return age
+
+def _ids(value):
+    return [int(x) for x in value.split(",") if x]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk approve / reject PENDING referrals")
+    parser.add_argument("action", choices=("approve", "reject"))
+    parser.add_argument("--campaign", help="campaign id")
+    parser.add_argument("--older-than", type=_age, help="only referrals created before now - AGE (30m, 48h, 7d, 2w)")
+    parser.add_argument("--verified", action="store_true", help="only referees that are members of the campaign group")
+    parser.add_argument("--ids", type=_ids, help="comma-separated referee ids")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per UPDATE / transaction")
+    parser.add_argument("--clawback-points", type=int, default=int(os.getenv("POINTS_PER_REFERRAL", "1")),
+                        help="points removed from referrer and referee per rejected referral")
+    parser.add_argument("--dry-run", action="store_true", help="only count matching referrals")
+    args = parser.parse_args()
+    if not (args.campaign or args.older_than or args.ids):
+        parser.error("at least one of --campaign, --older-than or --ids is required")
+    asyncio.run(main(args))
@@ -0,0 +1,31 @@
+# Exporta tablas a CSV en streaming (COPY TO STDOUT).
+# Uso: python -m scripts.export_csv users referrals --campaign CAMP1 --from 2025-09-01 --to 2025-09-30 --gzip
+import argparse
+import asyncio
+from datetime import date
+
+from services.db_service import open_pool
+from services.export_service import EXPORTS, export_path, export_table
+
+async def main(args):
+    await open_pool()
+    for table in args.tables:
+        result = await export_table(
+            table,
+            path=export_path(table, args.gzip, args.out_dir),
+            campaign_id=args.campaign,
+            date_from=args.date_from,
+            date_to=args.date_to,
+            gzip_output=args.gzip,
+        )
+        print(f"{table}: ~{result['rows']} filas -> {result['path']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream tables to CSV with COPY TO STDOUT")
+    parser.add_argument("tables", nargs="+", choices=sorted(EXPORTS))
+    parser.add_argument("--campaign", help="filter by campaign id")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--gzip", action="store_true", help="write .csv.gz")
+    parser.add_argument("--out-dir", default=None, help="output directory (default: EXPORT_DIR or exports/)")
+    asyncio.run(main(parser.parse_args()))
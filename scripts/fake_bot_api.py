@@ -0,0 +1,168 @@
+# Servidor Bot API falso para pruebas locales y benchmarks.
+# Responde a /bot<token>/<method> como Telegram, registra cada envío y, con
+# --enforce, contesta 429 (retry_after) cuando se superan los límites globales
+# o por chat. GET /stats devuelve los contadores. FakeSession usa la misma lógica
+# dentro del proceso, sin HTTP (scripts/bench_e2e.py).
+# Uso: python -m scripts.fake_bot_api --port 8081 --enforce
+#      TELEGRAM_API_BASE=http://127.0.0.1:8081 python main.py
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+
+from aiogram.client.session.base import BaseSession
+from aiohttp import web
+
+SEND_METHODS = {"sendmessage", "senddocument", "sendphoto", "copymessage", "forwardmessage", "editmessagetext", "editmessagereplymarkup"}
+
+
+class FakeBotAPI:
+    def __init__(self, enforce: bool = False, global_limit: int = 30, chat_limit: int = 1, group_limit_per_min: int = 20, retry_after: int = 1):
+        self.enforce = enforce
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.group_limit_per_min = group_limit_per_min
+        self.retry_after = retry_after
+        self._message_ids = itertools.count(1)
+        self._global = deque()
+        self._chats = defaultdict(deque)
+        self.stats = defaultdict(int)
+        self.sent = []
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, str):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+            else:
+                params[key] = getattr(value, "filename", "file")
+        return params
+
+    def _over_limit(self, chat_id, now: float) -> bool:
+        while self._global and now - self._global[0] > 1:
+            self._global.popleft()
+        is_group = str(chat_id).startswith("-")
+        window = 60 if is_group else 1
+        limit = self.group_limit_per_min if is_group else self.chat_limit
+        chat = self._chats[chat_id]
+        while chat and now - chat[0] > window:
+            chat.popleft()
+        if len(self._global) >= self.global_limit or len(chat) >= limit:
+            return True
+        self._global.append(now)
+        chat.append(now)
+        return False
+
+    def _message(self, params: dict) -> dict:
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group" if str(chat_id).startswith("-") else "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"},
+            "text": params.get("text", ""),
+        }
+
+    def call(self, method: str, params: dict) -> dict:
+        """Telegram-style response payload for one API call."""
+        method = method.lower()
+        self.stats[method] += 1
+        if method in SEND_METHODS:
+            now = time.monotonic()
+            chat_id = params.get("chat_id")
+            if self._over_limit(chat_id, now):
+                self.stats["violations"] += 1
+                if self.enforce:
+                    return {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    }
+            self.sent.append((now, chat_id, method))
+            return {"ok": True, "result": self._message(params)}
+        return {"ok": True, "result": self._result(method, params)}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = self.call(request.match_info["method"], await self._params(request))
+        return web.json_response(payload)
+
+    def _result(self, method: str, params: dict):
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "getchatmember":
+            return {"status": "member", "user": {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "User"}}
+        if method == "createchatinvitelink":
+            return {
+                "invite_link": "https://t.me/+fake",
+                "creator": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+                "creates_join_request": False,
+                "is_primary": False,
+                "is_revoked": False,
+            }
+        if method == "getupdates":
+            return []
+        return True
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+
+class FakeSession(BaseSession):
+    """In-process Bot session answering from FakeBotAPI, without HTTP (benchmarks)."""
+
+    def __init__(self, api: FakeBotAPI = None, latency: float = 0.0):
+        super().__init__()
+        self.api = api or FakeBotAPI()
+        self.latency = latency
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = {}
+        for name in ("chat_id", "message_id", "user_id", "text"):
+            value = getattr(method, name, None)
+            if isinstance(value, (int, str)):
+                params[name] = value
+        payload = self.api.call(method.__api_method__, params)
+        status = 200 if payload["ok"] else payload["error_code"]
+        response = self.check_response(bot=bot, method=method, status_code=status, content=json.dumps(payload))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def build_app(api: FakeBotAPI) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/stats", api.handle_stats)
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--enforce", action="store_true", help="answer 429 when Telegram limits are exceeded")
+    parser.add_argument("--global-limit", type=int, default=30)
+    parser.add_argument("--chat-limit", type=int, default=1)
+    args = parser.parse_args()
+    api = FakeBotAPI(enforce=args.enforce, global_limit=args.global_limit, chat_limit=args.chat_limit)
+    web.run_app(build_app(api), host=args.host, port=args.port)
@@ -1,10 +1,12 @@
 import asyncio
 from services.db_service import open_pool, init_db
+from services.migrations import run_migrations
 
 async def main():
     await open_pool()
     await init_db()
-    print("DB INIT OK")
+    applied = await run_migrations()
+    print(f"DB INIT OK ({len(applied)} migrations applied)")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,25 @@
+# Aplica las migraciones pendientes (services/migrations.py).
+# Uso: python -m scripts.migrate [--status] [--to N]
+import argparse
+import asyncio
+import logging
+
+from services.migrations import migration_status, run_migrations
+
+async def main(args):
+    if args.status:
+        for version, name, applied_at in await migration_status():
+            state = applied_at.isoformat(timespec="seconds") if applied_at else "pendiente"
+            print(f"{version:04d}_{name}: {state}")
+        return
+    applied = await run_migrations(target=args.to)
+    for version, name, duration_ms in applied:
+        print(f"{version:04d}_{name}: aplicada en {duration_ms} ms")
+    print(f"Migraciones aplicadas: {len(applied)}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    parser.add_argument("--to", type=int, default=None, help="stop after this version")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+# Mantenimiento de particiones de points_history (por mes) y referrals (por campaña).
+# Uso:
+#   python -m scripts.partitions list
+#   python -m scripts.partitions ensure [--months-ahead 2]
+#   python -m scripts.partitions archive-months --older-than 12 [--out-dir archives]
+#   python -m scripts.partitions archive-campaign CAMP1 [CAMP2 ...] [--out-dir archives]
+import argparse
+import asyncio
+
+from services.db_service import open_pool, close_pool
+from services import partitions
+
+async def main(args):
+    await open_pool()
+    try:
+        if args.command == "list":
+            for parent in ("points_history", "referrals"):
+                print(parent)
+                for p in await partitions.list_partitions(parent):
+                    print(f"  {p['name']:<60} ~{p['rows_estimate']:>10} filas {p['bytes'] / 1024 / 1024:>9.1f} MB  {p['bound']}")
+        elif args.command == "ensure":
+            created = await partitions.ensure_partitions(args.months_ahead)
+            print(f"Particiones creadas: {created}")
+        else:
+            # Terminar primero archivos que quedaron a medias (tabla separada sin volcar)
+            for result in await partitions.resume_archives(args.out_dir):
+                print(f"{result['partition']}: ~{result['rows']} filas -> {result['path']} (reanudado)")
+            if args.command == "archive-months":
+                results = await partitions.archive_months(args.older_than, args.out_dir)
+            else:
+                results = [await partitions.archive_campaign(c, args.out_dir) for c in args.campaigns]
+            for result in filter(None, results):
+                print(f"{result['partition']}: ~{result['rows']} filas -> {result['path']}")
+    finally:
+        await close_pool()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create, list and archive table partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show partitions with size and row estimate")
+    ensure = sub.add_parser("ensure", help="create upcoming month partitions and per-campaign partitions")
+    ensure.add_argument("--months-ahead", type=int, default=partitions.MONTHS_AHEAD)
+    months = sub.add_parser("archive-months", help="detach and archive old points_history months")
+    months.add_argument("--older-than", type=int, required=True, help="months to keep online")
+    months.add_argument("--out-dir", default=None, help="output directory (default: ARCHIVE_DIR or archives/)")
+    campaigns = sub.add_parser("archive-campaign", help="detach and archive the referrals of closed campaigns")
+    campaigns.add_argument("campaigns", nargs="+")
+    campaigns.add_argument("--out-dir", default=None, help="output directory (default: ARCHIVE_DIR or archives/)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,39 @@
+# Genera archivos de pago por lotes (PayPal Payouts / Binance Pay) con los pagos APPROVED
+# y los marca PAID. Se puede lanzar en varias máquinas a la vez: SKIP LOCKED reparte las filas.
+# Uso: python -m scripts.payouts --method Paypal [--workers 2] [--max-items 15000] [--out-dir payouts]
+import argparse
+import asyncio
+import getpass
+import logging
+
+from services.db_service import open_pool, close_pool
+from services.payout_service import MAX_ITEMS, PAYOUT_FORMATS, format_amount, recover_batch_files, run_payouts
+
+async def main(args):
+    await open_pool()
+    try:
+        for path in await recover_batch_files():
+            print(f"Archivo recuperado: {path}")
+        for method_type in args.method:
+            batches = await run_payouts(
+                method_type,
+                workers=args.workers,
+                max_items=args.max_items,
+                out_dir=args.out_dir,
+                created_by=getpass.getuser(),
+            )
+            if not batches:
+                print(f"{method_type}: no hay pagos APPROVED pendientes")
+            for b in batches:
+                print(f"Lote #{b['batch_id']} {method_type}: {b['items']} pagos, {format_amount(b['total_cents'])} {b['currency']} -> {b['path']}")
+    finally:
+        await close_pool()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Build payout batch files and mark the payments as PAID")
+    parser.add_argument("--method", nargs="+", choices=sorted(PAYOUT_FORMATS), required=True)
+    parser.add_argument("--workers", type=int, default=1, help="concurrent batches per method")
+    parser.add_argument("--max-items", type=int, default=MAX_ITEMS, help="payments per batch file")
+    parser.add_argument("--out-dir", default=None, help="output directory (default: PAYOUT_DIR or payouts/)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,28 @@
+# Envía updates grabados (JSON) al servidor webhook local, como lo haría Telegram.
+# Uso: python -m scripts.post_update updates.json [--url http://127.0.0.1:8080/webhook]
+# El archivo puede tener un update (objeto) o una lista de updates.
+import argparse
+import asyncio
+import json
+import os
+
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+async def main(args):
+    with open(args.file, encoding="utf-8") as f:
+        payload = json.load(f)
+    updates = payload if isinstance(payload, list) else [payload]
+    headers = {SECRET_HEADER: args.secret}
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            async with session.post(args.url, json=update, headers=headers) as resp:
+                print(f"update_id={update.get('update_id')} -> HTTP {resp.status}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="POST recorded Telegram updates to the local webhook")
+    parser.add_argument("file")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}{os.getenv('WEBHOOK_PATH', '/webhook')}")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    asyncio.run(main(parser.parse_args()))
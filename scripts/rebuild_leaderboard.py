@@ -0,0 +1,10 @@
+import asyncio
+from services.db_service import open_pool, rebuild_leaderboard_scores
+
+async def main():
+    await open_pool()
+    rows = await rebuild_leaderboard_scores()
+    print(f"Ranking reconstruido: {rows} filas en leaderboard_scores.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
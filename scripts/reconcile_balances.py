@@ -0,0 +1,17 @@
+import argparse
+import asyncio
+from services.db_service import open_pool, reconcile_user_balances
+
+async def main(apply: bool):
+    await open_pool()
+    drift = await reconcile_user_balances(apply=apply)
+    for d in drift:
+        print(f"user={d['user_id']} campaign={d['campaign_id'] or '-'} snapshot={d['snapshot']} expected={d['expected']}")
+    action = "corregidas" if apply else "detectadas (dry-run)"
+    print(f"Reconciliación: {len(drift)} filas con drift {action}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild user_balances from referrals/payments and report drift")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift, do not rewrite snapshots")
+    args = parser.parse_args()
+    asyncio.run(main(apply=not args.dry_run))
@@ -0,0 +1,176 @@
+# Envíos masivos del admin (/broadcast).
+# Los destinatarios se leen en orden de id, por páginas (keyset) que no dejan
+# conexiones ni transacciones abiertas durante el envío, y se
+# reparten entre un grupo de workers. Cada envío va por el carril "bulk" del
+# OutboundScheduler (bot/outbound.py), que aplica los límites de Telegram y
+# deja pasar primero las respuestas interactivas. Tras cada lote se guarda el
+# checkpoint en broadcast_jobs: si el bot se reinicia, el trabajo sigue desde
+# el último lote completo (como mucho se repite un lote).
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot.i18n import t
+from bot.outbound import bulk_lane
+from services.db_service import (
+    checkpoint_broadcast,
+    get_resumable_broadcasts,
+    iter_broadcast_recipients,
+)
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+
+# job_id -> task del proceso actual
+_running = {}
+_cancel_requested = set()
+
+
+class BroadcastRunner:
+    def __init__(self, bot, job: dict, workers: int = BROADCAST_WORKERS, batch_size: int = BROADCAST_BATCH_SIZE):
+        self.bot = bot
+        self.job = job
+        self.workers = workers
+        self.batch_size = batch_size
+        # Los contadores siguen desde el checkpoint si el trabajo se reanuda
+        self.stats = {"sent": job["sent"], "blocked": job["blocked"], "failed": job["failed"]}
+        self.errors = {}
+        self._started = time.monotonic()
+        self._sent_at_start = job["sent"]
+
+    async def _send(self, user_id: int) -> None:
+        job = self.job
+        try:
+            if job["source_message_id"]:
+                await self.bot.copy_message(user_id, job["source_chat_id"], job["source_message_id"])
+            else:
+                await self.bot.send_message(user_id, job["text"])
+            self.stats["sent"] += 1
+        except TelegramForbiddenError:
+            # Bloqueó al bot o borró su cuenta
+            self.stats["blocked"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            kind = "bad_request" if isinstance(e, TelegramBadRequest) else type(e).__name__
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            logger.warning(f"Broadcast {job['id']}: send to {user_id} failed: {e}")
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            user_id = await queue.get()
+            try:
+                await self._send(user_id)
+            finally:
+                queue.task_done()
+
+    async def _checkpoint(self, last_user_id: int, status: str = None) -> None:
+        await checkpoint_broadcast(
+            self.job["id"], last_user_id, self.stats["sent"], self.stats["blocked"], self.stats["failed"], status
+        )
+
+    async def run(self) -> dict:
+        job = self.job
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        # Los workers copian el contexto al crearse: se crean dentro de bulk_lane()
+        with bulk_lane():
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        last_user_id = job["last_user_id"]
+        try:
+            async for batch in iter_broadcast_recipients(job["campaign_id"], last_user_id, self.batch_size):
+                for user_id in batch:
+                    await queue.put(user_id)
+                await queue.join()
+                last_user_id = batch[-1]
+                await self._checkpoint(last_user_id)
+            job["status"] = "DONE"
+        except asyncio.CancelledError:
+            if job["id"] not in _cancel_requested:
+                # Apagado del proceso: queda RUNNING para reanudar desde el checkpoint
+                raise
+            job["status"] = "CANCELLED"
+        except Exception as e:
+            logger.error(f"Broadcast {job['id']} failed: {e}")
+            job["status"] = "FAILED"
+        finally:
+            for w in workers:
+                w.cancel()
+            _cancel_requested.discard(job["id"])
+        try:
+            await self._checkpoint(last_user_id, job["status"])
+        except Exception as e:
+            # El reporte se envía igual; la fila queda con el último checkpoint de lote
+            logger.error(f"Broadcast {job['id']}: final checkpoint failed: {e}")
+        return self.report()
+
+    def report(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "job_id": self.job["id"],
+            "status": self.job["status"],
+            **self.stats,
+            "errors": dict(self.errors),
+            "elapsed_s": round(elapsed, 1),
+            "per_second": round((self.stats["sent"] - self._sent_at_start) / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def format_report(report: dict, lang: str) -> str:
+    return t(
+        "broadcast_report",
+        lang,
+        job_id=report["job_id"],
+        status=report["status"],
+        sent=report["sent"],
+        blocked=report["blocked"],
+        failed=report["failed"],
+        errors=", ".join(f"{k}={v}" for k, v in sorted(report["errors"].items())) or "-",
+        elapsed=report["elapsed_s"],
+        rate=report["per_second"],
+    )
+
+
+async def _run_and_report(bot, job: dict) -> dict:
+    runner = BroadcastRunner(bot, job)
+    report = await runner.run()
+    logger.info(f"Broadcast report: {report}")
+    if job["created_by"]:
+        try:
+            await bot.send_message(job["created_by"], format_report(report, job["lang"] or "es"))
+        except Exception as e:
+            logger.warning(f"Could not send broadcast report for job {job['id']}: {e}")
+    return report
+
+
+def start_broadcast(bot, job: dict) -> asyncio.Task:
+    task = asyncio.create_task(_run_and_report(bot, job))
+    _running[job["id"]] = task
+    task.add_done_callback(lambda _: _running.pop(job["id"], None))
+    return task
+
+
+async def cancel_broadcast(job_id: int) -> bool:
+    task = _running.get(job_id)
+    if task is None:
+        return False
+    _cancel_requested.add(job_id)
+    task.cancel()
+    return True
+
+
+def is_running(job_id: int) -> bool:
+    return job_id in _running
+
+
+async def resume_broadcasts(bot) -> int:
+    """Restarts jobs left RUNNING by a previous process, from their last checkpoint."""
+    jobs = await get_resumable_broadcasts()
+    for job in jobs:
+        logger.info(f"Resuming broadcast {job['id']} after user {job['last_user_id']}")
+        start_broadcast(bot, job)
+    return len(jobs)
+
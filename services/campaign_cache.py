@@ -0,0 +1,87 @@
+# In-process cache for active campaigns.
+# Campaigns rarely change, but every balance/withdraw/group handler looks them up.
+# We keep two maps: user_id -> client_id and client_id -> active campaign row.
+import time
+from collections import OrderedDict
+from typing import Optional
+
+_MISSING = object()
+
+
+class CampaignCache:
+    def __init__(self, ttl_seconds: float = 60.0, max_users: int = 100_000):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self._user_client: "OrderedDict[int, tuple]" = OrderedDict()
+        self._client_campaign: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, stored_at: float) -> bool:
+        return (time.monotonic() - stored_at) < self.ttl
+
+    def get_client_id(self, user_id: int):
+        entry = self._user_client.get(user_id)
+        if entry is None:
+            return _MISSING
+        client_id, stored_at = entry
+        if not self._fresh(stored_at):
+            self._user_client.pop(user_id, None)
+            return _MISSING
+        self._user_client.move_to_end(user_id)
+        return client_id
+
+    def get_campaign(self, client_id):
+        entry = self._client_campaign.get(client_id)
+        if entry is None:
+            return _MISSING
+        campaign, stored_at = entry
+        if not self._fresh(stored_at):
+            self._client_campaign.pop(client_id, None)
+            return _MISSING
+        return campaign
+
+    def lookup(self, user_id: int):
+        """Returns the cached campaign (dict or None) or _MISSING, counting hit/miss."""
+        client_id = self.get_client_id(user_id)
+        if client_id is not _MISSING:
+            campaign = self.get_campaign(client_id)
+            if campaign is not _MISSING:
+                self.hits += 1
+                return campaign
+        self.misses += 1
+        return _MISSING
+
+    def put_user(self, user_id: int, client_id) -> None:
+        self._user_client[user_id] = (client_id, time.monotonic())
+        self._user_client.move_to_end(user_id)
+        while len(self._user_client) > self.max_users:
+            self._user_client.popitem(last=False)
+
+    def put_campaign(self, client_id, campaign: Optional[dict]) -> None:
+        # Se guarda también None (cliente sin campaña activa) para no repetir la consulta
+        self._client_campaign[client_id] = (campaign, time.monotonic())
+
+    def invalidate_client(self, client_id) -> None:
+        self._client_campaign.pop(client_id, None)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._user_client.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._user_client.clear()
+        self._client_campaign.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "users": len(self._user_client),
+            "clients": len(self._client_campaign),
+        }
+
+
+def is_missing(value) -> bool:
+    return value is _MISSING
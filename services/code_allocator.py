@@ -0,0 +1,42 @@
+# Asignador de códigos de referido sin colisiones.
+# Reserva bloques de la secuencia referral_code_seq y codifica cada número con
+# utils.helpers.encode_code_number: números distintos -> códigos distintos, sin
+# reintentos ni INSERTs fallidos. El prefijo no afecta la unicidad.
+import asyncio
+
+from services.db_service import CODE_BLOCK_SIZE, reserve_code_block
+from utils.helpers import encode_code_number
+
+
+class CodeAllocator:
+    def __init__(self, block_size: int = CODE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self.blocks_reserved = 0
+        self.codes_issued = 0
+
+    async def _refill(self):
+        start = await reserve_code_block()
+        self._next, self._end = start, start + self.block_size
+        self.blocks_reserved += 1
+
+    async def next_number(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._refill()
+            n = self._next
+            self._next += 1
+            self.codes_issued += 1
+            return n
+
+    async def next_code(self, prefix: str = "RF") -> str:
+        return encode_code_number(await self.next_number(), prefix=prefix)
+
+
+_allocator = CodeAllocator()
+
+
+def get_allocator() -> CodeAllocator:
+    return _allocator
@@ -0,0 +1,206 @@
+# Cache en memoria user_id <-> código de referido.
+# Un código no cambia una vez asignado, así que no hace falta TTL: solo se invalida al
+# borrar o reescribir un usuario. Cada sentido es una tabla asociativa por conjuntos
+# (4 vías) sobre array('q'): 16 bytes por entrada, tamaño fijo y sin objetos Python
+# por entrada. Los códigos se guardan empaquetados en un entero de 58 bits:
+#   prefijo (hasta 3 caracteres [0-9A-Z], 6 bits c/u) | cuerpo (8 caracteres de ALPHABET, 5 bits c/u)
+# Los códigos que no encajan en ese formato van a un LRU pequeño aparte.
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from utils.helpers import ALPHABET, CODE_BODY_LENGTH
+
+_EMPTY = -1
+_WAYS = 4
+_PREFIX_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_PREFIX_INDEX = {c: i + 1 for i, c in enumerate(_PREFIX_CHARS)}  # 0 = sin carácter
+_BODY_INDEX = {c: i for i, c in enumerate(ALPHABET)}
+_BODY_BITS = 5 * CODE_BODY_LENGTH
+
+
+def pack_code(code: str) -> Optional[int]:
+    """'RF-ABCD-EFGH' -> int, or None if the code is not in the allocator format."""
+    prefix, sep, body = code.partition("-")
+    body = body.replace("-", "")
+    if not sep or not 1 <= len(prefix) <= 3 or len(body) != CODE_BODY_LENGTH or code.count("-") != 2:
+        return None
+    if code[len(prefix) + 5] != "-":
+        return None
+    packed = 0
+    for c in prefix:
+        i = _PREFIX_INDEX.get(c)
+        if i is None:
+            return None
+        packed = (packed << 6) | i
+    for c in body:
+        i = _BODY_INDEX.get(c)
+        if i is None:
+            return None
+        packed = (packed << 5) | i
+    return packed
+
+
+def unpack_code(packed: int) -> str:
+    body = []
+    for _ in range(CODE_BODY_LENGTH):
+        packed, i = divmod(packed, 32)
+        body.append(ALPHABET[i])
+    prefix = []
+    while packed:
+        packed, i = divmod(packed, 64)
+        prefix.append(_PREFIX_CHARS[i - 1])
+    body = "".join(reversed(body))
+    return f"{''.join(reversed(prefix))}-{body[:4]}-{body[4:]}"
+
+
+class _IntTable:
+    """Fixed-size 4-way set-associative int64 -> int64 map; a full set evicts round-robin."""
+
+    __slots__ = ("_keys", "_values", "_hands", "_mask", "_shift")
+
+    def __init__(self, capacity: int):
+        sets = 1
+        while sets * _WAYS < capacity:
+            sets *= 2
+        self._keys = array("q", [_EMPTY]) * (sets * _WAYS)
+        self._values = array("q", [0]) * (sets * _WAYS)
+        self._hands = bytearray(sets)
+        self._mask = sets - 1
+        self._shift = 64 - max(1, sets.bit_length() - 1)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._keys)
+
+    def _base(self, key: int) -> int:
+        # Hash multiplicativo (Fibonacci): ids consecutivos se reparten entre conjuntos
+        return (((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self._shift & self._mask) * _WAYS
+
+    def get(self, key: int) -> Optional[int]:
+        base = self._base(key)
+        keys = self._keys
+        for slot in range(base, base + _WAYS):
+            if keys[slot] == key:
+                return self._values[slot]
+        return None
+
+    def put(self, key: int, value: int) -> None:
+        base = self._base(key)
+        keys = self._keys
+        free = None
+        for slot in range(base, base + _WAYS):
+            k = keys[slot]
+            if k == key:
+                self._values[slot] = value
+                return
+            if k == _EMPTY and free is None:
+                free = slot
+        if free is None:
+            s = base // _WAYS
+            free = base + self._hands[s]
+            self._hands[s] = (self._hands[s] + 1) % _WAYS
+        keys[free] = key
+        self._values[free] = value
+
+    def pop(self, key: int) -> None:
+        base = self._base(key)
+        for slot in range(base, base + _WAYS):
+            if self._keys[slot] == key:
+                self._keys[slot] = _EMPTY
+                return
+
+    def __len__(self) -> int:
+        return len(self._keys) - self._keys.count(_EMPTY)
+
+    def clear(self) -> None:
+        for i in range(len(self._keys)):
+            self._keys[i] = _EMPTY
+
+
+class CodeCache:
+    def __init__(self, max_entries: int = 1_000_000, max_odd_entries: int = 10_000):
+        self._by_user = _IntTable(max_entries)
+        self._by_code = _IntTable(max_entries)
+        # Códigos con otro formato (p.ej. prefijos largos): dict LRU acotado
+        self._odd_by_user: "OrderedDict[int, str]" = OrderedDict()
+        self._odd_by_code: "OrderedDict[str, int]" = OrderedDict()
+        self.max_odd_entries = max_odd_entries
+        self.hits = {"code": 0, "user": 0}
+        self.misses = {"code": 0, "user": 0}
+
+    def _count(self, direction: str, value):
+        if value is None:
+            self.misses[direction] += 1
+        else:
+            self.hits[direction] += 1
+        return value
+
+    def code_for_user(self, user_id: int) -> Optional[str]:
+        packed = self._by_user.get(user_id)
+        if packed is not None:
+            return self._count("code", unpack_code(packed))
+        code = self._odd_by_user.get(user_id)
+        if code is not None:
+            self._odd_by_user.move_to_end(user_id)
+        return self._count("code", code)
+
+    def user_for_code(self, code: str) -> Optional[int]:
+        packed = pack_code(code)
+        if packed is not None:
+            return self._count("user", self._by_code.get(packed))
+        user_id = self._odd_by_code.get(code)
+        if user_id is not None:
+            self._odd_by_code.move_to_end(code)
+        return self._count("user", user_id)
+
+    def put(self, user_id: int, code: str) -> None:
+        packed = pack_code(code)
+        if packed is not None:
+            self._by_user.put(user_id, packed)
+            self._by_code.put(packed, user_id)
+            return
+        self._odd_by_user[user_id] = code
+        self._odd_by_user.move_to_end(user_id)
+        self._odd_by_code[code] = user_id
+        self._odd_by_code.move_to_end(code)
+        while len(self._odd_by_user) > self.max_odd_entries:
+            self._odd_by_user.popitem(last=False)
+        while len(self._odd_by_code) > self.max_odd_entries:
+            self._odd_by_code.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        packed = self._by_user.get(user_id)
+        if packed is not None:
+            self._by_user.pop(user_id)
+            self._by_code.pop(packed)
+        code = self._odd_by_user.pop(user_id, None)
+        if code is not None:
+            self._odd_by_code.pop(code, None)
+
+    def invalidate(self, user_id: int, code: Optional[str] = None) -> None:
+        """Drops both directions; code (the user's previous code) covers an evicted user slot."""
+        self.invalidate_user(user_id)
+        if code is None:
+            return
+        packed = pack_code(code)
+        if packed is not None:
+            if self._by_code.get(packed) == user_id:
+                self._by_code.pop(packed)
+        elif self._odd_by_code.get(code) == user_id:
+            self._odd_by_code.pop(code)
+
+    def clear(self) -> None:
+        self._by_user.clear()
+        self._by_code.clear()
+        self._odd_by_user.clear()
+        self._odd_by_code.clear()
+
+    def stats(self) -> dict:
+        out = {"capacity": self._by_user.capacity, "odd_entries": len(self._odd_by_user)}
+        for direction in ("code", "user"):
+            total = self.hits[direction] + self.misses[direction]
+            out[f"{direction}_hits"] = self.hits[direction]
+            out[f"{direction}_misses"] = self.misses[direction]
+            out[f"{direction}_hit_rate"] = (self.hits[direction] / total) if total else 0.0
+        return out
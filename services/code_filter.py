@@ -0,0 +1,133 @@
+# Filtro de Bloom de los códigos emitidos.
+# Un "no" del filtro significa que el código no se emitió hasta la última
+# sincronización: si esa sincronización es de hace más de min_sync_seconds se
+# sincroniza una vez más (puede venir de otra réplica) y solo si sigue sin estar se
+# rechaza sin consultar la base. El mínimo evita que cada código inventado cueste una
+# consulta. Un "quizás" sigue el camino normal; si la base tampoco lo encuentra es un
+# falso positivo y se cuenta para medir la tasa real.
+# Se construye al arrancar leyendo users.code y se mantiene al día con los códigos
+# que emite este proceso, los que avisan las otras réplicas (NOTIFY) y una
+# sincronización periódica.
+import hashlib
+import math
+import time
+from typing import Awaitable, Callable, Iterable
+
+
+class BloomFilter:
+    __slots__ = ("size_bits", "hashes", "_bits", "count")
+
+    def __init__(self, capacity: int, fp_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size_bits = max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.size_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Doble hashing (Kirsch-Mitzenmacher): k posiciones a partir de un solo digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.size_bits
+        return [(h1 + i * h2) % m for i in range(self.hashes)]
+
+    def add(self, item: str) -> bool:
+        """Sets item's bits; returns False (and does not count it) if all were already set."""
+        # El sync vuelve a leer los códigos de su ventana de solape: sin esto cada uno
+        # se contaría varias veces y estimated_fp_rate saldría inflado
+        bits = self._bits
+        new = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def estimated_fp_rate(self) -> float:
+        # (1 - e^(-k n / m))^k con n = elementos añadidos
+        return (1 - math.exp(-self.hashes * self.count / self.size_bits)) ** self.hashes
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+
+class CodeFilter:
+    """Holds the current BloomFilter; rejects only once a full build has completed."""
+
+    def __init__(self, capacity: int = 2_000_000, fp_rate: float = 0.001, min_sync_seconds: float = 1.0):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.min_sync_seconds = min_sync_seconds
+        self._filter = None
+        self._synced_at = None
+        # late: códigos que faltaban en el filtro pero aparecieron al sincronizar
+        self.stats = {"checks": 0, "rejected": 0, "passed": 0, "late": 0, "false_positives": 0, "added": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def new_filter(self, expected_items: int) -> BloomFilter:
+        # Margen x2 para que la tasa de falsos positivos no se dispare hasta el siguiente arranque
+        return BloomFilter(max(self.capacity, 2 * expected_items), self.fp_rate)
+
+    def install(self, bloom: BloomFilter) -> None:
+        self._filter = bloom
+
+    def mark_synced(self, at: float = None) -> None:
+        """Records a sync that saw every code committed before at (time.monotonic())."""
+        self._synced_at = time.monotonic() if at is None else at
+
+    def _recently_synced(self) -> bool:
+        return self._synced_at is not None and time.monotonic() - self._synced_at < self.min_sync_seconds
+
+    def add(self, code: str) -> None:
+        if self._filter is not None and self._filter.add(code):
+            self.stats["added"] += 1
+
+    async def might_exist(self, code: str, refresh: Callable[[], Awaitable[bool]]) -> bool:
+        """False if code is missing and the filter synced recently, or is still missing after refresh() succeeded."""
+        if self._filter is None:
+            return True
+        self.stats["checks"] += 1
+        if code not in self._filter:
+            if self._recently_synced() or (await refresh() and code not in self._filter):
+                self.stats["rejected"] += 1
+                return False
+            if code in self._filter:
+                self.stats["late"] += 1
+        self.stats["passed"] += 1
+        return True
+
+    def record_false_positive(self) -> None:
+        if self._filter is not None:
+            self.stats["false_positives"] += 1
+
+    def observed_fp_rate(self) -> float:
+        # Falsos positivos sobre todos los códigos inexistentes consultados
+        negatives = self.stats["false_positives"] + self.stats["rejected"]
+        return self.stats["false_positives"] / negatives if negatives else 0.0
+
+    def summary(self) -> dict:
+        out = dict(self.stats, ready=self.ready, observed_fp_rate=self.observed_fp_rate())
+        if self._filter is not None:
+            out.update(
+                items=self._filter.count,
+                memory_bytes=self._filter.memory_bytes,
+                hashes=self._filter.hashes,
+                estimated_fp_rate=self._filter.estimated_fp_rate(),
+            )
+        return out
@@ -1,17 +1,33 @@
 # Eliminar usuario por id (para tests)
 async def delete_user(user_id: int):
     pool = get_pool()
-    async with pool.connection() as conn, conn.cursor() as cur:
+    async with pool.connection() as conn, maybe_pipeline(conn), conn.cursor() as cur:
         # Borra puntos primero para evitar violación de FK
         await cur.execute("DELETE FROM points_history WHERE user_id = %s;", (user_id,))
-        await cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+        await cur.execute("DELETE FROM users WHERE id = %s RETURNING code;", (user_id,))
+        row = await cur.fetchone()
         await conn.commit()
+    _code_cache.invalidate(user_id, row[0] if row else None)
 
 # --- Database Service Layer (migrated from db_repo.py) ---
 import os
+import sys
+import json
+import time
+from contextlib import asynccontextmanager, nullcontext
 from typing import Optional
+import enum
+import psycopg
 import psycopg_pool
+from psycopg import sql
 import logging
+import asyncio
+from services.campaign_cache import CampaignCache, is_missing
+from services.code_cache import CodeCache
+from services.code_filter import CodeFilter
+from services.leaderboard import Leaderboard, METRICS
+from services import metrics
+from services.slow_query_log import SlowQueryLog, is_read_only
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
@@ -26,28 +42,297 @@ def get_pool():
         raise RuntimeError("Pool not initialized. Call open_pool() first.")
     return _pool
 
+# --- Prepared statements / pipeline ---
+# Las sentencias calientes se preparan en el servidor la primera vez que se usan en cada
+# conexión del pool (psycopg guarda el cache por conexión). El resto sigue la política de
+# DB_PREPARE_THRESHOLD ("none" lo desactiva, p.ej. detrás de pgbouncer en modo transaction).
+PREPARE_HOT_STATEMENTS = os.getenv("DB_PREPARE_HOT_STATEMENTS", "1") != "0"
+_threshold_env = os.getenv("DB_PREPARE_THRESHOLD", "5").strip().lower()
+PREPARE_THRESHOLD = None if _threshold_env in ("", "none", "off") else int(_threshold_env)
+USE_PIPELINE = os.getenv("DB_USE_PIPELINE", "1") != "0"
+
+HOT_STATEMENTS = {
+    "code_by_user": "SELECT code FROM users WHERE id = %s;",
+    "user_by_code": "SELECT id FROM users WHERE code = %s;",
+    "code_by_phone": "SELECT id, code FROM users WHERE phone=%s",
+    "user_points": "SELECT COALESCE(total_points, 0) FROM users WHERE id=%s",
+    "balances": "SELECT campaign_id, approved_count, paid_cents, pending_cents FROM user_balances WHERE user_id=%s AND campaign_id IN (%s, %s)",
+    "campaign_by_client": """
+            SELECT * FROM campaigns
+            WHERE client_id = %s AND status = 'ACTIVE'
+            ORDER BY created_at DESC LIMIT 1;
+        """,
+    "campaign_by_user": """
+                SELECT u.client_id AS _user_client_id, c.* FROM users u
+                LEFT JOIN LATERAL (
+                    SELECT * FROM campaigns
+                    WHERE client_id = u.client_id AND status = 'ACTIVE'
+                    ORDER BY created_at DESC LIMIT 1
+                ) c ON true
+                WHERE u.id = %s;
+            """,
+    "payment_insert": "INSERT INTO payments (user_id, amount_cents, status, method_id, requested_at, account) VALUES (%s, %s, 'REQUESTED', %s, now(), %s) RETURNING id",
+}
+
+async def execute_hot(cur, name: str, params):
+    # prepare=None deja la decisión a prepare_threshold de la conexión
+    await cur.execute(HOT_STATEMENTS[name], params, prepare=True if PREPARE_HOT_STATEMENTS else None, label=name)
+
+# --- Instrumentación (services/metrics.py) ---
+# Consultas lentas: umbral en ms (0 desactiva), fracción con EXPLAIN y carpeta de salida
+_slow_log = SlowQueryLog(
+    threshold_ms=float(os.getenv("SLOW_QUERY_MS", "200")),
+    explain_sample=float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1")),
+    explain_interval=float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", "60")),
+    out_dir=os.getenv("SLOW_QUERY_DIR", "slow_queries"),
+)
+_INTERNAL_FRAMES = ("execute", "executemany", "execute_hot")
+_explain_tasks = set()
+
+def get_slow_query_stats() -> dict:
+    return dict(_slow_log.stats)
+
+def _caller_name() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_name in _INTERNAL_FRAMES:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+async def _explain_slow_query(entry: dict, query, params):
+    # Corre en otra conexión y siempre con ROLLBACK; ANALYZE solo para lecturas
+    options = "ANALYZE, BUFFERS, VERBOSE" if is_read_only(str(query)) else "VERBOSE"
+    try:
+        async with _pool.connection() as conn:
+            async with conn.transaction(force_rollback=True):
+                async with conn.cursor() as cur:
+                    timeout_ms = int(max(1000, entry["elapsed_ms"] * 5))
+                    await cur.execute(f"SET LOCAL statement_timeout = {timeout_ms};", label="explain")
+                    await cur.execute(f"EXPLAIN ({options}) {query}", params, label="explain")
+                    plan = "\n".join(row[0] for row in await cur.fetchall())
+        path = await _slow_log.write(entry, plan)
+        logger.info(f"EXPLAIN for slow query in {entry['caller']} written to {path}")
+    except Exception as e:
+        _slow_log.stats["explain_errors"] += 1
+        logger.warning(f"EXPLAIN failed for slow query in {entry['caller']}: {e}")
+
+def _on_slow_query(label: str, query, params, elapsed_ms: float):
+    entry = _slow_log.record(label, _caller_name(), query, params, elapsed_ms)
+    if isinstance(query, str) and _slow_log.should_explain(label):
+        task = asyncio.get_running_loop().create_task(_explain_slow_query(entry, query, params))
+        _explain_tasks.add(task)
+        task.add_done_callback(_explain_tasks.discard)
+
+class TimedCursor(psycopg.AsyncCursor):
+    """Cursor that records each execute in db_query_duration_seconds and reports slow queries.
+
+    The label is the statement name for execute_hot, otherwise the calling function.
+    In pipeline mode the time only covers queueing the statement.
+    """
+
+    async def execute(self, query, params=None, *, label: str = None, **kwargs):
+        label = label or sys._getframe(1).f_code.co_name
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - t0
+            metrics.DB_QUERY_DURATION.observe(elapsed, label)
+            if _slow_log.enabled and elapsed * 1000 >= _slow_log.threshold_ms and label != "explain":
+                _on_slow_query(label, query, params, elapsed * 1000)
+
+    async def executemany(self, query, params_seq, *, label: str = None, **kwargs):
+        label = label or sys._getframe(1).f_code.co_name
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - t0
+            metrics.DB_QUERY_DURATION.observe(elapsed, label)
+            if _slow_log.enabled and elapsed * 1000 >= _slow_log.threshold_ms:
+                # Sin EXPLAIN: el plan depende de cada fila de parámetros
+                _slow_log.record(label, _caller_name(), query, None, elapsed * 1000)
+
+class TimedPool:
+    """Wraps the psycopg pool to time connection waits and hold times; other attributes pass through."""
+
+    def __init__(self, pool: psycopg_pool.AsyncConnectionPool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def connection(self, timeout: float = None):
+        t0 = time.perf_counter()
+        async with self._pool.connection(timeout=timeout) as conn:
+            acquired = time.perf_counter()
+            metrics.DB_POOL_WAIT.observe(acquired - t0)
+            try:
+                yield conn
+            finally:
+                metrics.DB_POOL_HOLD.observe(time.perf_counter() - acquired)
+
+def _pool_gauges() -> dict:
+    if _pool is None:
+        return {}
+    stats = _pool.get_stats()
+    size, available = stats.get("pool_size", 0), stats.get("pool_available", 0)
+    return {
+        ("size",): size,
+        ("in_use",): size - available,
+        ("idle",): available,
+        ("waiting",): stats.get("requests_waiting", 0),
+        ("max",): _pool.max_size,
+    }
+
+metrics.Gauge("db_pool_connections", "Pooled connections by state", ("state",), callback=_pool_gauges)
+
+def maybe_pipeline(conn):
+    # Agrupa sentencias independientes en un solo round trip
+    return conn.pipeline() if USE_PIPELINE else nullcontext()
+
+async def _configure_connection(conn):
+    conn.prepare_threshold = PREPARE_THRESHOLD
+    conn.cursor_factory = TimedCursor
+
 # Inicializar pool de forma asíncrona
 async def open_pool():
     global _pool
-    _pool = psycopg_pool.AsyncConnectionPool(DATABASE_URL, min_size=2, max_size=10)
+    _pool = TimedPool(psycopg_pool.AsyncConnectionPool(DATABASE_URL, min_size=2, max_size=10, configure=_configure_connection))
     await _pool.open()
 
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
 logger = logging.getLogger(__name__)
 
+# Cache de campañas activas (user -> client -> campaign)
+_campaign_cache = CampaignCache(
+    ttl_seconds=float(os.getenv("CAMPAIGN_CACHE_TTL_SECONDS", "60")),
+    max_users=int(os.getenv("CAMPAIGN_CACHE_MAX_USERS", "100000")),
+)
+
+def get_campaign_cache_stats() -> dict:
+    return _campaign_cache.stats()
+
+# Cache user_id <-> código (inmutable una vez asignado; ver services/code_cache.py)
+_code_cache = CodeCache(max_entries=int(os.getenv("CODE_CACHE_MAX_ENTRIES", "1000000")))
+
+def get_code_cache_stats() -> dict:
+    return _code_cache.stats()
+
+def _code_cache_gauges() -> dict:
+    return {
+        (direction, result): getattr(_code_cache, result)[direction]
+        for direction in ("code", "user")
+        for result in ("hits", "misses")
+    }
+
+metrics.Gauge("code_cache_lookups", "user<->code cache lookups by direction and result", ("direction", "result"), callback=_code_cache_gauges)
+
+# Filtro de Bloom de códigos emitidos (services/code_filter.py): rechaza códigos
+# inventados sin consultar la base
+_code_filter = CodeFilter(
+    capacity=int(os.getenv("CODE_FILTER_CAPACITY", "2000000")),
+    fp_rate=float(os.getenv("CODE_FILTER_FP_RATE", "0.001")),
+    min_sync_seconds=float(os.getenv("CODE_FILTER_MIN_SYNC_SECONDS", "1")),
+)
+# upsert_user avisa por aquí cada código que asigna (run_code_filter_listener)
+CODE_NOTIFY_CHANNEL = "issued_codes"
+_code_filter_synced_at = None
+# Sync en curso: los misses concurrentes (y el loop periódico) esperan la misma
+_code_filter_sync_task = None
+
+def get_code_filter_stats() -> dict:
+    return _code_filter.summary()
+
+async def refresh_code_filter() -> bool:
+    """Runs sync_code_filter, sharing an in-flight sync; False if it failed."""
+    global _code_filter_sync_task
+    if _code_filter_sync_task is None or _code_filter_sync_task.done():
+        _code_filter_sync_task = asyncio.ensure_future(sync_code_filter())
+    try:
+        await asyncio.shield(_code_filter_sync_task)
+        return True
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Code filter sync failed: {e}")
+        return False
+
+async def code_might_exist(code: str) -> bool:
+    # Un código emitido por otra réplica llega por NOTIFY o con el siguiente sync: un
+    # miss sincroniza antes de rechazar si el último sync tiene más de
+    # CODE_FILTER_MIN_SYNC_SECONDS (una sola consulta para todos los misses a la vez)
+    return await _code_filter.might_exist(code, refresh_code_filter)
+
+def record_code_filter_false_positive() -> None:
+    _code_filter.record_false_positive()
+
+def _code_filter_gauges() -> dict:
+    summary = _code_filter.summary()
+    keys = ("checks", "rejected", "passed", "late", "false_positives", "items", "observed_fp_rate", "estimated_fp_rate")
+    return {(key,): summary[key] for key in keys if key in summary}
+
+metrics.Gauge("code_filter", "Issued-code Bloom filter counters and false-positive rates", ("stat",), callback=_code_filter_gauges)
+
+def invalidate_campaign_cache(client_id=None, user_id: int = None):
+    # Sin argumentos se vacía todo el cache
+    if client_id is None and user_id is None:
+        _campaign_cache.clear()
+        return
+    if client_id is not None:
+        _campaign_cache.invalidate_client(client_id)
+    if user_id is not None:
+        _campaign_cache.invalidate_user(user_id)
+
 async def get_active_campaign_for_user(user_id: int):
+    cached = _campaign_cache.lookup(user_id)
+    if not is_missing(cached):
+        return cached
     pool = get_pool()
     async with pool.connection() as conn, conn.cursor() as cur:
-        await cur.execute("""
-            SELECT c.* FROM campaigns c
-            JOIN users u ON u.id = %s
-            WHERE c.client_id = u.client_id AND c.status = 'ACTIVE'
-            ORDER BY c.created_at DESC LIMIT 1;
-        """, (user_id,))
+        client_id = _campaign_cache.get_client_id(user_id)
+        if is_missing(client_id):
+            # Usuario desconocido: resolver cliente y campaña en una sola consulta
+            await execute_hot(cur, "campaign_by_user", (user_id,))
+            row = await cur.fetchone()
+            if not row:
+                return None
+            columns = [desc[0] for desc in cur.description]
+            client_id = row[0]
+            campaign = dict(zip(columns[1:], row[1:]))
+            if campaign.get("id") is None:
+                campaign = None
+            _campaign_cache.put_user(user_id, client_id)
+            _campaign_cache.put_campaign(client_id, campaign)
+            return campaign
+        await execute_hot(cur, "campaign_by_client", (client_id,))
         row = await cur.fetchone()
+        campaign = None
         if row:
             columns = [desc[0] for desc in cur.description]
-            return dict(zip(columns, row))
-        return None
+            campaign = dict(zip(columns, row))
+        _campaign_cache.put_campaign(client_id, campaign)
+        return campaign
+
+async def set_campaign_status(campaign_id: str, status: str) -> bool:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "UPDATE campaigns SET status = %s WHERE id = %s RETURNING client_id;",
+            (status.upper(), campaign_id),
+        )
+        row = await cur.fetchone()
+        await conn.commit()
+    if not row:
+        return False
+    invalidate_campaign_cache(client_id=row[0])
+    logger.info(f"Campaign {campaign_id} status set to {status.upper()} (cache invalidated for client={row[0]})")
+    return True
 
 async def get_default_method(user_id, method_type=None):
     pool = get_pool()
@@ -67,26 +352,291 @@ async def get_default_method(user_id, method_type=None):
             return dict(zip([desc[0] for desc in cur.description], row))
         return None
 
+# --- Balance snapshots (user_balances) ---
+# approved_count se guarda por (user_id, campaign_id). Los pagos no están ligados a una
+# campaña, así que sus totales viven en la fila con campaign_id = '' del mismo usuario.
+USER_WIDE_CAMPAIGN = ""
+PENDING_PAYMENT_STATUSES = ("REQUESTED", "APPROVED")
+
+def _payment_bucket(status: Optional[str]) -> Optional[str]:
+    if status == "PAID":
+        return "paid_cents"
+    if status in PENDING_PAYMENT_STATUSES:
+        return "pending_cents"
+    return None
+
+async def _apply_balance_delta(cur, user_id: int, campaign_id: str, approved: int = 0, paid_cents: int = 0, pending_cents: int = 0):
+    # Debe llamarse con el cursor de la transacción que modifica referrals/payments
+    await cur.execute("""
+        INSERT INTO user_balances (user_id, campaign_id, approved_count, paid_cents, pending_cents)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, campaign_id) DO UPDATE SET
+            approved_count = user_balances.approved_count + EXCLUDED.approved_count,
+            paid_cents = user_balances.paid_cents + EXCLUDED.paid_cents,
+            pending_cents = user_balances.pending_cents + EXCLUDED.pending_cents,
+            updated_at = now();
+    """, (user_id, campaign_id, approved, paid_cents, pending_cents))
+
 async def create_withdraw_request(user_id: int, amount_cents: int, method_id: int, campaign_id: int = None, account: str = None):
     pool = get_pool()
     try:
-        async with pool.connection() as conn, conn.cursor() as cur:
-            await cur.execute(
-                "INSERT INTO payments (user_id, amount_cents, status, method_id, requested_at, account) VALUES (%s, %s, 'REQUESTED', %s, now(), %s) RETURNING id",
-                (user_id, amount_cents, method_id, account)
-            )
-            row = await cur.fetchone()
-            await conn.commit()
-            return int(row[0])
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    await execute_hot(cur, "payment_insert", (user_id, amount_cents, method_id, account))
+                    row = await cur.fetchone()
+                    await _apply_balance_delta(cur, user_id, USER_WIDE_CAMPAIGN, pending_cents=amount_cents)
+                    return int(row[0])
     except Exception as e:
         raise
 
+async def set_payment_status(payment_id: int, status: str) -> bool:
+    status = status.upper()
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT user_id, amount_cents, status FROM payments WHERE id = %s FOR UPDATE;", (payment_id,))
+                row = await cur.fetchone()
+                if not row:
+                    return False
+                user_id, amount_cents, old_status = row
+                if old_status == status:
+                    return True
+                processed_col = ", paid_at = now()" if status == "PAID" else ""
+                await cur.execute(
+                    f"UPDATE payments SET status = %s, processed_at = now(){processed_col} WHERE id = %s;",
+                    (status, payment_id),
+                )
+                delta = {"paid_cents": 0, "pending_cents": 0}
+                old_bucket, new_bucket = _payment_bucket(old_status), _payment_bucket(status)
+                if old_bucket:
+                    delta[old_bucket] -= amount_cents
+                if new_bucket:
+                    delta[new_bucket] += amount_cents
+                if old_bucket != new_bucket:
+                    await _apply_balance_delta(cur, user_id, USER_WIDE_CAMPAIGN, **delta)
+    logger.info(f"Payment {payment_id} status {old_status} -> {status}")
+    return True
+
+async def set_referral_status(campaign_id: str, referee_id: int, status: str) -> bool:
+    status = status.upper()
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT referrer_id, status FROM referrals WHERE campaign_id = %s AND referee_id = %s FOR UPDATE;",
+                    (campaign_id, referee_id),
+                )
+                row = await cur.fetchone()
+                if not row:
+                    return False
+                referrer_id, old_status = row
+                if old_status == status:
+                    return True
+                await cur.execute(
+                    "UPDATE referrals SET status = %s WHERE campaign_id = %s AND referee_id = %s;",
+                    (status, campaign_id, referee_id),
+                )
+                delta = (status == "APPROVED") - (old_status == "APPROVED")
+                if delta:
+                    await _apply_balance_delta(cur, referrer_id, campaign_id, approved=delta)
+    _leaderboard.record(campaign_id, "referrals", referrer_id, delta)
+    logger.info(f"Referral campaign={campaign_id} referee={referee_id} status {old_status} -> {status}")
+    return True
+
+# Aprobación/rechazo masivo de referidos PENDING: UPDATE por bloques en orden de PK
+# (keyset), cada bloque en su transacción junto con los balances y puntos afectados.
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+def _bulk_referral_filter(campaign_id=None, older_than=None, verified=False, referee_ids=None, default_chat_id=None):
+    where = ["r.status = 'PENDING'"]
+    params = {}
+    if campaign_id:
+        where.append("r.campaign_id = %(campaign_id)s")
+        params["campaign_id"] = campaign_id
+    if older_than is not None:
+        where.append("r.created_at <= now() - %(older_than)s")
+        params["older_than"] = older_than
+    if referee_ids:
+        where.append("r.referee_id = ANY(%(referee_ids)s)")
+        params["referee_ids"] = list(referee_ids)
+    if verified:
+        # Miembro del grupo de la campaña según el índice group_members
+        where.append("""EXISTS (
+            SELECT 1 FROM campaigns c JOIN group_members gm
+              ON gm.chat_id = COALESCE(c.group_chat_id, %(default_chat_id)s::bigint)
+            WHERE c.id = r.campaign_id AND gm.user_id = r.referee_id AND gm.status = ANY(%(member_statuses)s)
+        )""")
+        params["default_chat_id"] = int(default_chat_id) if default_chat_id else None
+        params["member_statuses"] = list(MEMBER_STATUSES)
+    return " AND ".join(where), params
+
+async def count_pending_referrals(**filters) -> int:
+    where, params = _bulk_referral_filter(**filters)
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(f"SELECT COUNT(*) FROM referrals r WHERE {where};", params)
+        return (await cur.fetchone())[0]
+
+async def bulk_set_referral_status(
+    status: str,
+    chunk_size: int = 1000,
+    clawback_points: int = 0,
+    on_progress=None,
+    **filters,
+) -> dict:
+    """Moves matching PENDING referrals to APPROVED or REJECTED in chunks.
+
+    filters: campaign_id, older_than (timedelta), verified, referee_ids, default_chat_id.
+    clawback_points: points deducted from referrer and referee per rejected referral.
+    on_progress: async callable(done, chunks) awaited after each committed chunk.
+    """
+    status = status.upper()
+    if status not in ("APPROVED", "REJECTED"):
+        raise ValueError(f"Unsupported bulk status: {status}")
+    where, params = _bulk_referral_filter(**filters)
+    params.update({"status": status, "limit": chunk_size, "after_campaign": "", "after_referee": -1})
+    statement = f"""
+        WITH picked AS (
+            SELECT r.campaign_id, r.referee_id FROM referrals r
+            WHERE {where} AND (r.campaign_id, r.referee_id) > (%(after_campaign)s, %(after_referee)s)
+            ORDER BY r.campaign_id, r.referee_id
+            LIMIT %(limit)s
+            FOR UPDATE OF r
+        )
+        UPDATE referrals r SET status = %(status)s
+        FROM picked p
+        WHERE r.campaign_id = p.campaign_id AND r.referee_id = p.referee_id AND r.status = 'PENDING'
+        RETURNING r.campaign_id, r.referrer_id, r.referee_id;
+    """
+    pool = get_pool()
+    done = chunks = 0
+    started = time.perf_counter()
+    while True:
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    await cur.execute(statement, params)
+                    rows = await cur.fetchall()
+                    if not rows:
+                        break
+                    approved = {}
+                    points = {}
+                    for campaign_id, referrer_id, referee_id in rows:
+                        approved[(referrer_id, campaign_id)] = approved.get((referrer_id, campaign_id), 0) + 1
+                        for uid in (referrer_id, referee_id):
+                            points[(uid, campaign_id)] = points.get((uid, campaign_id), 0) - clawback_points
+                    if status == "APPROVED":
+                        users, campaigns, counts = zip(*[(u, c, n) for (u, c), n in approved.items()])
+                        await cur.execute("""
+                            INSERT INTO user_balances (user_id, campaign_id, approved_count)
+                            SELECT * FROM unnest(%s::bigint[], %s::text[], %s::int[])
+                            ON CONFLICT (user_id, campaign_id) DO UPDATE SET
+                                approved_count = user_balances.approved_count + EXCLUDED.approved_count,
+                                updated_at = now();
+                        """, (list(users), list(campaigns), list(counts)))
+                    elif clawback_points:
+                        users, campaigns, deltas = zip(*[(u, c, d) for (u, c), d in points.items()])
+                        await cur.execute("""
+                            UPDATE users u SET total_points = COALESCE(u.total_points, 0) + d.points
+                            FROM (
+                                SELECT user_id, SUM(points) AS points
+                                FROM unnest(%s::bigint[], %s::int[]) AS t(user_id, points)
+                                GROUP BY user_id
+                            ) d
+                            WHERE u.id = d.user_id;
+                        """, (list(users), list(deltas)))
+                        await cur.execute("""
+                            INSERT INTO points_history (user_id, campaign_id, points, reason)
+                            SELECT user_id, campaign_id, points, 'referral_rejected'
+                            FROM unnest(%s::bigint[], %s::text[], %s::int[]) AS t(user_id, campaign_id, points);
+                        """, (list(users), list(campaigns), list(deltas)))
+        # Bloque confirmado: ranking en memoria y siguiente página del keyset
+        if status == "APPROVED":
+            for (referrer_id, campaign_id), n in approved.items():
+                _leaderboard.record(campaign_id, "referrals", referrer_id, n)
+        elif clawback_points:
+            for (uid, campaign_id), delta in points.items():
+                _leaderboard.record(campaign_id, "points", uid, delta)
+        last = max((campaign_id, referee_id) for campaign_id, _, referee_id in rows)
+        params["after_campaign"], params["after_referee"] = last
+        done += len(rows)
+        chunks += 1
+        if on_progress is not None:
+            await on_progress(done, chunks)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Bulk referral status -> {status}: {done} rows in {chunks} chunks ({elapsed:.1f}s) filters={filters}")
+    return {"status": status, "updated": done, "chunks": chunks, "elapsed": elapsed}
+
+async def reconcile_user_balances(apply: bool = True) -> list:
+    """Recalcula user_balances desde referrals/payments y devuelve las filas con drift."""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                # EXCLUSIVE bloquea escrituras concurrentes al snapshot pero no las lecturas
+                await cur.execute("LOCK TABLE user_balances IN EXCLUSIVE MODE;")
+                await cur.execute("""
+                    WITH truth AS (
+                        SELECT referrer_id AS user_id, campaign_id, COUNT(*) AS approved_count,
+                               0::bigint AS paid_cents, 0::bigint AS pending_cents
+                        FROM referrals WHERE status = 'APPROVED'
+                        GROUP BY referrer_id, campaign_id
+                        UNION ALL
+                        SELECT user_id, %s::text, 0,
+                               COALESCE(SUM(amount_cents) FILTER (WHERE status = 'PAID'), 0),
+                               COALESCE(SUM(amount_cents) FILTER (WHERE status IN ('REQUESTED','APPROVED')), 0)
+                        FROM payments GROUP BY user_id
+                    )
+                    SELECT COALESCE(t.user_id, b.user_id), COALESCE(t.campaign_id, b.campaign_id),
+                           COALESCE(t.approved_count, 0), COALESCE(t.paid_cents, 0), COALESCE(t.pending_cents, 0),
+                           COALESCE(b.approved_count, 0), COALESCE(b.paid_cents, 0), COALESCE(b.pending_cents, 0)
+                    FROM truth t
+                    FULL OUTER JOIN user_balances b ON b.user_id = t.user_id AND b.campaign_id = t.campaign_id
+                    WHERE (COALESCE(t.approved_count, 0), COALESCE(t.paid_cents, 0), COALESCE(t.pending_cents, 0))
+                       IS DISTINCT FROM
+                          (COALESCE(b.approved_count, 0), COALESCE(b.paid_cents, 0), COALESCE(b.pending_cents, 0))
+                      -- Las campañas archivadas ya no tienen referrals: su snapshot es la única fuente
+                      AND COALESCE(t.campaign_id, b.campaign_id) NOT IN (
+                          SELECT bound FROM partition_archives WHERE parent = 'referrals'
+                      );
+                """, (USER_WIDE_CAMPAIGN,))
+                drift = [
+                    {
+                        "user_id": r[0],
+                        "campaign_id": r[1],
+                        "expected": {"approved_count": r[2], "paid_cents": r[3], "pending_cents": r[4]},
+                        "snapshot": {"approved_count": r[5], "paid_cents": r[6], "pending_cents": r[7]},
+                    }
+                    for r in await cur.fetchall()
+                ]
+                if apply and drift:
+                    await cur.executemany("""
+                        INSERT INTO user_balances (user_id, campaign_id, approved_count, paid_cents, pending_cents)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (user_id, campaign_id) DO UPDATE SET
+                            approved_count = EXCLUDED.approved_count,
+                            paid_cents = EXCLUDED.paid_cents,
+                            pending_cents = EXCLUDED.pending_cents,
+                            updated_at = now();
+                    """, [
+                        (d["user_id"], d["campaign_id"], d["expected"]["approved_count"],
+                         d["expected"]["paid_cents"], d["expected"]["pending_cents"])
+                        for d in drift
+                    ])
+    logger.info(f"Balance reconciliation: {len(drift)} rows with drift (applied={apply})")
+    return drift
+
 async def get_code_by_phone(phone_e164: str):
     pool = get_pool()
     try:
         async with pool.connection() as conn, conn.cursor() as cur:
-            await cur.execute("SELECT id, code FROM users WHERE phone=%s", (phone_e164,))
+            await execute_hot(cur, "code_by_phone", (phone_e164,))
             row = await cur.fetchone()
+            if row and row[1]:
+                _code_cache.put(int(row[0]), row[1])
             return (row[0], row[1]) if row else None
     except Exception as e:
         logger.error(f"Error getting code by phone {phone_e164}: {e}")
@@ -96,7 +646,7 @@ async def get_user_points(user_id: int, campaign_id: int = None) -> int:
     pool = get_pool()
     try:
         async with pool.connection() as conn, conn.cursor() as cur:
-            await cur.execute("SELECT COALESCE(total_points, 0) FROM users WHERE id=%s", (user_id,))
+            await execute_hot(cur, "user_points", (user_id,))
             row = await cur.fetchone()
             return int(row[0]) if row else 0
     except Exception as e:
@@ -107,13 +657,15 @@ async def compute_balances(user_id: int, campaign_id: int, commission_per_approv
     pool = get_pool()
     try:
         async with pool.connection() as conn, conn.cursor() as cur:
-            await cur.execute("SELECT COUNT(*) FROM referrals WHERE referrer_id=%s AND campaign_id=%s AND status='APPROVED'", (user_id, campaign_id))
-            approved = (await cur.fetchone())[0]
+            # Una sola lectura por PK: fila de la campaña + fila de pagos del usuario
+            await execute_hot(cur, "balances", (user_id, campaign_id, USER_WIDE_CAMPAIGN))
+            approved = paid = pending = 0
+            for row_campaign, row_approved, row_paid, row_pending in await cur.fetchall():
+                if row_campaign == USER_WIDE_CAMPAIGN:
+                    paid, pending = int(row_paid), int(row_pending)
+                else:
+                    approved = int(row_approved)
             gross = approved * commission_per_approved_cents
-            await cur.execute("SELECT COALESCE(SUM(amount_cents),0) FROM payments WHERE user_id=%s AND status='PAID'", (user_id,))
-            paid = (await cur.fetchone())[0]
-            await cur.execute("SELECT COALESCE(SUM(amount_cents),0) FROM payments WHERE user_id=%s AND status IN ('REQUESTED','APPROVED')", (user_id,))
-            pending = (await cur.fetchone())[0]
             return approved, gross, paid, pending
     except Exception as e:
         logger.error(f"Error computing balances for user {user_id}: {e}")
@@ -121,7 +673,7 @@ async def compute_balances(user_id: int, campaign_id: int, commission_per_approv
 
 async def init_db():
     pool = get_pool()
-    async with pool.connection() as conn, conn.cursor() as cur:
+    async with pool.connection() as conn, maybe_pipeline(conn), conn.cursor() as cur:
         # Crear tabla clients (mínima)
         await cur.execute("""
         CREATE TABLE IF NOT EXISTS clients (
@@ -174,12 +726,78 @@ async def init_db():
             created_at TIMESTAMPTZ DEFAULT now()
         );
         """)
+        # Secuencia para el asignador de códigos (services/code_allocator.py)
+        await cur.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS referral_code_seq START WITH 0 MINVALUE 0 INCREMENT BY {CODE_BLOCK_SIZE};"
+        )
+        # Estado de conversaciones (FSM) compartido entre réplicas del bot
+        await cur.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}'::jsonb,
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+        """)
+        await cur.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_expires ON fsm_states (expires_at);")
+        # Índice de miembros del grupo (alimentado por updates chat_member)
+        await cur.execute("""
+        CREATE TABLE IF NOT EXISTS group_members (
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT group_members_pk PRIMARY KEY (chat_id, user_id)
+        );
+        """)
+        # Envíos masivos del admin (/broadcast); last_user_id es el checkpoint para reanudar
+        await cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id SERIAL PRIMARY KEY,
+            campaign_id TEXT,
+            text TEXT,
+            source_chat_id BIGINT,
+            source_message_id BIGINT,
+            status TEXT NOT NULL DEFAULT 'RUNNING',
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by BIGINT,
+            lang TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        );
+        """)
+        # Puntuaciones del ranking (services/leaderboard.py); se reconstruye con scripts/rebuild_leaderboard.py
+        await cur.execute("""
+        CREATE TABLE IF NOT EXISTS leaderboard_scores (
+            campaign_id TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            score BIGINT NOT NULL DEFAULT 0,
+            CONSTRAINT leaderboard_scores_pk PRIMARY KEY (campaign_id, metric, user_id)
+        );
+        """)
+        # Snapshot de balances; se reconstruye con scripts/reconcile_balances.py
+        await cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_balances (
+            user_id BIGINT NOT NULL,
+            campaign_id TEXT NOT NULL,
+            approved_count INTEGER NOT NULL DEFAULT 0,
+            paid_cents BIGINT NOT NULL DEFAULT 0,
+            pending_cents BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT user_balances_pk PRIMARY KEY (user_id, campaign_id)
+        );
+        """)
         await conn.commit()
 
 async def add_points(user_id: int, points: int, reason: str, campaign_id: str = None):
     pool = get_pool()
     try:
-        async with pool.connection() as conn, conn.cursor() as cur:
+        async with pool.connection() as conn, maybe_pipeline(conn), conn.cursor() as cur:
             await cur.execute(
                 "UPDATE users SET total_points = COALESCE(total_points, 0) + %s WHERE id = %s;",
                 (points, user_id)
@@ -189,6 +807,7 @@ async def add_points(user_id: int, points: int, reason: str, campaign_id: str =
                 (user_id, campaign_id, points, reason)
             )
             await conn.commit()
+            _leaderboard.record(campaign_id, "points", user_id, points)
             logger.info(f"Added {points} points to user {user_id} for {reason} (campaign={campaign_id})")
     except Exception as e:
         logger.error(f"Error adding points to user {user_id}: {e}")
@@ -213,31 +832,129 @@ async def upsert_user(user_id: int, code: str = None, phone: Optional[str] = Non
                 fields.append("email")
                 values.append(email)
                 updates.append("email = EXCLUDED.email")
-            sql = f"INSERT INTO users ({', '.join(fields)}) VALUES ({', '.join(['%s']*len(fields))}) "
+            query = f"INSERT INTO users ({', '.join(fields)}) VALUES ({', '.join(['%s']*len(fields))}) "
             if updates:
-                sql += f"ON CONFLICT (id) DO UPDATE SET {', '.join(updates)};"
+                query += f"ON CONFLICT (id) DO UPDATE SET {', '.join(updates)}"
             else:
-                sql += "ON CONFLICT (id) DO NOTHING;"
-            await cur.execute(sql, tuple(values))
+                query += "ON CONFLICT (id) DO NOTHING"
+            if code is not None:
+                # El CTE ve la fila anterior: el código viejo sale del cache aunque su
+                # entrada user -> código ya se haya desalojado
+                query = f"WITH old AS (SELECT code FROM users WHERE id = %s) {query} RETURNING (SELECT code FROM old), pg_notify(%s, code)"
+                values.insert(0, user_id)
+                values.append(CODE_NOTIFY_CHANNEL)
+            await cur.execute(query + ";", tuple(values))
+            old_code = (await cur.fetchone())[0] if code is not None else None
             await conn.commit()
+            if code is not None:
+                _code_cache.invalidate(user_id, old_code)
+                _code_cache.put(user_id, code)
+                _code_filter.add(code)
             logger.info(f"Upserted user {user_id}")
     except Exception as e:
         logger.error(f"Error upserting user {user_id}: {e}")
         raise
 
 async def get_existing_code_by_user(user_id: int) -> Optional[str]:
+    code = _code_cache.code_for_user(user_id)
+    if code is not None:
+        return code
     pool = get_pool()
     async with pool.connection() as conn, conn.cursor() as cur:
-        await cur.execute("SELECT code FROM users WHERE id = %s;", (user_id,))
+        await execute_hot(cur, "code_by_user", (user_id,))
         row = await cur.fetchone()
-        return row[0] if row else None
+    # Solo se cachean aciertos: un usuario sin código puede recibirlo después
+    if row and row[0]:
+        _code_cache.put(user_id, row[0])
+    return row[0] if row else None
 
 async def find_user_by_code(code: str) -> Optional[int]:
+    user_id = _code_cache.user_for_code(code)
+    if user_id is not None:
+        return user_id
+    if not await code_might_exist(code):
+        return None
     pool = get_pool()
     async with pool.connection() as conn, conn.cursor() as cur:
-        await cur.execute("SELECT id FROM users WHERE code = %s;", (code,))
+        await execute_hot(cur, "user_by_code", (code,))
         row = await cur.fetchone()
-        return int(row[0]) if row else None
+    if row:
+        _code_cache.put(int(row[0]), code)
+    else:
+        _code_filter.record_false_positive()
+    return int(row[0]) if row else None
+
+async def rebuild_code_filter(batch_size: int = 10_000) -> dict:
+    """Builds a new filter from users.code with a server-side cursor and swaps it in."""
+    global _code_filter_synced_at
+    started = time.perf_counter()
+    synced = time.monotonic()
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT now(), GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'users'::regclass;")
+                snapshot_at, estimate = await cur.fetchone()
+            bloom = _code_filter.new_filter(estimate)
+            async with conn.cursor(name="code_filter_rebuild") as cur:
+                cur.itersize = batch_size
+                await cur.execute("SELECT code FROM users WHERE code IS NOT NULL;")
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    bloom.update(row[0] for row in rows)
+    _code_filter.install(bloom)
+    _code_filter.mark_synced(synced)
+    _code_filter_synced_at = snapshot_at
+    summary = _code_filter.summary()
+    logger.info(
+        f"Code filter built: {bloom.count} codes, {bloom.memory_bytes / 1024 / 1024:.1f} MB, k={bloom.hashes}, "
+        f"est. fp={summary['estimated_fp_rate']:.5f} ({time.perf_counter() - started:.1f}s)"
+    )
+    return summary
+
+async def sync_code_filter(overlap_seconds: float = 60) -> int:
+    """Adds codes created since the last build/sync (codes issued by other replicas)."""
+    global _code_filter_synced_at
+    if _code_filter_synced_at is None:
+        return 0
+    synced = time.monotonic()
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        # Se solapa un poco: una fila insertada por una transacción que empezó antes
+        # del último corte puede tener created_at anterior a él
+        await cur.execute(
+            "SELECT now(), array_agg(code) FROM users WHERE created_at > %s::timestamptz - make_interval(secs => %s) AND code IS NOT NULL;",
+            (_code_filter_synced_at, overlap_seconds),
+        )
+        synced_at, codes = await cur.fetchone()
+    for code in codes or ():
+        _code_filter.add(code)
+    _code_filter.mark_synced(synced)
+    _code_filter_synced_at = synced_at
+    return len(codes or ())
+
+async def run_code_filter_sync_loop(interval: float = 5.0):
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_code_filter()
+
+async def run_code_filter_listener(retry_seconds: float = 5.0):
+    """Adds codes issued by other replicas as their transactions commit (LISTEN on a dedicated connection)."""
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CODE_NOTIFY_CHANNEL};")
+                # Lo emitido mientras no se escuchaba lo trae un sync
+                await refresh_code_filter()
+                async for notify in conn.notifies():
+                    _code_filter.add(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Code filter listener disconnected: {e}")
+        await asyncio.sleep(retry_seconds)
 
 async def referee_already_referred(campaign_id: str, referee_id: int) -> bool:
     pool = get_pool()
@@ -277,6 +994,7 @@ async def insert_referral(campaign_id: str, referrer_id: int, referee_id: int, r
                     if await cur.fetchone():
                         logger.info(f"Reciprocal referral blocked: campaign={campaign_id}, referrer={referrer_id}, referee={referee_id}")
                         return False
+                    # PENDING no suma al balance; user_balances se actualiza al aprobar (set_referral_status)
                     status = 'PENDING'
                     await cur.execute("""
                         INSERT INTO referrals (campaign_id, referrer_id, referee_id, ref_code, status)
@@ -291,5 +1009,520 @@ async def insert_referral(campaign_id: str, referrer_id: int, referee_id: int, r
         logger.error(f"Error inserting referral: campaign={campaign_id}, referrer={referrer_id}, referee={referee_id}, error={e}\nTraceback:\n{tb}")
         raise
 
+# --- Referral code blocks ---
+# Cada nextval reserva un bloque de CODE_BLOCK_SIZE números para el proceso que lo pide
+CODE_BLOCK_SIZE = 1000
+
+async def reserve_code_block() -> int:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT nextval('referral_code_seq');")
+        row = await cur.fetchone()
+        await conn.commit()
+        return int(row[0])
+
+# --- FSM storage (fsm_states) ---
+async def fsm_load(key: str):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT state, data FROM fsm_states WHERE key = %s AND expires_at > now();",
+            (key,),
+        )
+        row = await cur.fetchone()
+        if not row:
+            return None, {}
+        state, data = row
+        if isinstance(data, str):
+            data = json.loads(data)
+        return state, (data or {})
+
+async def fsm_save(key: str, state: Optional[str], data: dict, ttl_seconds: float):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        if state is None and not data:
+            await cur.execute("DELETE FROM fsm_states WHERE key = %s;", (key,))
+        else:
+            await cur.execute("""
+                INSERT INTO fsm_states (key, state, data, expires_at)
+                VALUES (%s, %s, %s::jsonb, now() + make_interval(secs => %s))
+                ON CONFLICT (key) DO UPDATE SET
+                    state = EXCLUDED.state, data = EXCLUDED.data, expires_at = EXCLUDED.expires_at;
+            """, (key, state, json.dumps(data), ttl_seconds))
+        await conn.commit()
+
+async def fsm_purge_expired() -> int:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("DELETE FROM fsm_states WHERE expires_at <= now();")
+        deleted = cur.rowcount
+        await conn.commit()
+        return deleted
+
+# --- Group membership index (group_members) ---
+async def get_member_status(chat_id, user_id: int, max_age_seconds: float = None) -> Optional[str]:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        sql = "SELECT status FROM group_members WHERE chat_id = %s AND user_id = %s"
+        params = [int(chat_id), user_id]
+        if max_age_seconds:
+            sql += " AND updated_at > now() - make_interval(secs => %s)"
+            params.append(max_age_seconds)
+        await cur.execute(sql, params)
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+async def set_member_status(chat_id, user_id: int, status: str):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("""
+            INSERT INTO group_members (chat_id, user_id, status, updated_at)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET status = EXCLUDED.status, updated_at = now();
+        """, (int(chat_id), user_id, status))
+        await conn.commit()
+
+async def clear_chat_members(chat_id):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("DELETE FROM group_members WHERE chat_id = %s;", (int(chat_id),))
+        await conn.commit()
+
+async def clawback_referral_points(chat_id, referee_id: int, points: int) -> int:
+    """Revoca los referidos del usuario en campañas de ese grupo y descuenta los puntos otorgados.
+
+    Se descuenta lo que dice points_history para cada referido; points solo se usa si
+    esas filas ya no están (referidos anteriores al registro atómico o meses archivados).
+    """
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    WITH old AS (
+                        SELECT r.campaign_id, r.referee_id, r.status
+                        FROM referrals r JOIN campaigns c ON c.id = r.campaign_id
+                        WHERE r.referee_id = %s AND r.status IN ('PENDING', 'APPROVED')
+                          AND c.group_chat_id::text = %s
+                        FOR UPDATE OF r
+                    )
+                    UPDATE referrals r SET status = 'REVOKED'
+                    FROM old
+                    WHERE r.campaign_id = old.campaign_id AND r.referee_id = old.referee_id
+                    RETURNING r.campaign_id, r.referrer_id, old.status, r.created_at;
+                """, (referee_id, str(chat_id)))
+                revoked = await cur.fetchall()
+                clawed = []
+                for campaign_id, referrer_id, old_status, created_at in revoked:
+                    # register_referral_atomic inserta el referido y sus puntos en la misma
+                    # sentencia: comparten created_at (now() de la transacción)
+                    await cur.execute("""
+                        SELECT user_id, SUM(points) FROM points_history
+                        WHERE campaign_id = %s AND created_at = %s
+                          AND ((user_id = %s AND reason = 'joined_group') OR (user_id = %s AND reason = 'referral_success'))
+                        GROUP BY user_id;
+                    """, (campaign_id, created_at, referee_id, referrer_id))
+                    awarded = dict(await cur.fetchall())
+                    amounts = {uid: int(awarded.get(uid, points)) for uid in (referee_id, referrer_id)}
+                    for uid, amount in amounts.items():
+                        if not amount:
+                            continue
+                        await cur.execute(
+                            "UPDATE users SET total_points = COALESCE(total_points, 0) - %s WHERE id = %s;",
+                            (amount, uid),
+                        )
+                        await cur.execute(
+                            "INSERT INTO points_history (user_id, campaign_id, points, reason) VALUES (%s, %s, %s, 'left_group_clawback');",
+                            (uid, campaign_id, -amount),
+                        )
+                    if old_status == "APPROVED":
+                        await _apply_balance_delta(cur, referrer_id, campaign_id, approved=-1)
+                    clawed.append((campaign_id, referrer_id, old_status, amounts))
+    for campaign_id, referrer_id, old_status, amounts in clawed:
+        for uid, amount in amounts.items():
+            if amount:
+                _leaderboard.record(campaign_id, "points", uid, -amount)
+        if old_status == "APPROVED":
+            _leaderboard.record(campaign_id, "referrals", referrer_id, -1)
+    if revoked:
+        logger.info(f"Clawback: referee={referee_id} left chat={chat_id}, revoked {len(revoked)} referrals")
+    return len(revoked)
+
+class ReferralResult(enum.Enum):
+    OK = "OK"
+    INVALID_CODE = "INVALID_CODE"
+    SELF_REFERRAL = "SELF_REFERRAL"
+    ALREADY_REFERRED = "ALREADY_REFERRED"
+    RECIPROCAL = "RECIPROCAL"
+    CAMPAIGN_INACTIVE = "CAMPAIGN_INACTIVE"
+
+# Validación + insert + puntos en una sola sentencia (un round trip, una transacción).
+# Con apply = false solo se evalúan las validaciones.
+_REGISTER_REFERRAL_SQL = """
+WITH params AS (
+    SELECT %(campaign_id)s::text AS campaign_id, %(referee_id)s::bigint AS referee_id,
+           %(code)s::text AS code, %(points)s::int AS points, %(apply)s::boolean AS apply
+),
+checks AS (
+    SELECT
+        (SELECT u.id FROM users u WHERE u.code = p.code) AS referrer_id,
+        EXISTS (SELECT 1 FROM campaigns c WHERE c.id = p.campaign_id AND c.status = 'ACTIVE') AS campaign_active,
+        EXISTS (SELECT 1 FROM referrals r WHERE r.campaign_id = p.campaign_id AND r.referee_id = p.referee_id) AS already_referred,
+        EXISTS (
+            SELECT 1 FROM referrals r JOIN users u ON u.id = r.referee_id
+            WHERE r.campaign_id = p.campaign_id AND r.referrer_id = p.referee_id AND u.code = p.code
+        ) AS reciprocal
+    FROM params p
+),
+verdict AS (
+    SELECT c.referrer_id, CASE
+        WHEN c.referrer_id IS NULL THEN 'INVALID_CODE'
+        WHEN c.referrer_id = p.referee_id THEN 'SELF_REFERRAL'
+        WHEN c.already_referred THEN 'ALREADY_REFERRED'
+        WHEN c.reciprocal THEN 'RECIPROCAL'
+        WHEN NOT c.campaign_active THEN 'CAMPAIGN_INACTIVE'
+        ELSE 'OK' END AS status
+    FROM checks c, params p
+),
+ins AS (
+    INSERT INTO referrals (campaign_id, referrer_id, referee_id, ref_code, status)
+    SELECT p.campaign_id, v.referrer_id, p.referee_id, p.code, 'PENDING'
+    FROM verdict v, params p
+    WHERE v.status = 'OK' AND p.apply
+    ON CONFLICT (campaign_id, referee_id) DO NOTHING
+    RETURNING referrer_id, referee_id
+),
+awarded AS (
+    UPDATE users u SET total_points = COALESCE(u.total_points, 0) + p.points
+    FROM ins i, params p
+    WHERE u.id IN (i.referrer_id, i.referee_id)
+    RETURNING u.id, (u.id = i.referee_id) AS is_referee
+),
+hist AS (
+    INSERT INTO points_history (user_id, campaign_id, points, reason)
+    SELECT a.id, p.campaign_id, p.points,
+           CASE WHEN a.is_referee THEN 'joined_group' ELSE 'referral_success' END
+    FROM awarded a, params p
+    RETURNING user_id
+)
+SELECT
+    CASE WHEN v.status = 'OK' AND p.apply AND NOT EXISTS (SELECT 1 FROM ins)
+         THEN 'ALREADY_REFERRED' ELSE v.status END,
+    v.referrer_id,
+    (SELECT COUNT(*) FROM hist)
+FROM verdict v, params p;
+"""
+
+async def register_referral_atomic(campaign_id: str, referee_id: int, code: str, points: int, apply: bool = True):
+    """Returns (ReferralResult, referrer_id). Nothing is written unless apply=True and the result is OK."""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(_REGISTER_REFERRAL_SQL, {
+                    "campaign_id": campaign_id,
+                    "referee_id": referee_id,
+                    "code": code,
+                    "points": points,
+                    "apply": apply,
+                })
+                status, referrer_id, awarded = await cur.fetchone()
+    result = ReferralResult(status)
+    if awarded:
+        _leaderboard.record(campaign_id, "points", referee_id, points)
+        _leaderboard.record(campaign_id, "points", referrer_id, points)
+    logger.info(f"Referral register: campaign={campaign_id}, referrer={referrer_id}, referee={referee_id}, result={result.value}, apply={apply}, points_rows={awarded}")
+    return result, (int(referrer_id) if referrer_id is not None else None)
+
+# --- Broadcasts (broadcast_jobs) ---
+BROADCAST_COLUMNS = "id, campaign_id, text, source_chat_id, source_message_id, status, last_user_id, sent, blocked, failed, created_by, lang"
+
+def _broadcast_row(row) -> Optional[dict]:
+    if not row:
+        return None
+    return dict(zip([c.strip() for c in BROADCAST_COLUMNS.split(",")], row))
+
+async def create_broadcast_job(created_by: int, lang: str, text: str = None, campaign_id: str = None,
+                               source_chat_id: int = None, source_message_id: int = None) -> dict:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(f"""
+            INSERT INTO broadcast_jobs (campaign_id, text, source_chat_id, source_message_id, created_by, lang)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING {BROADCAST_COLUMNS};
+        """, (campaign_id, text, source_chat_id, source_message_id, created_by, lang))
+        job = _broadcast_row(await cur.fetchone())
+        await conn.commit()
+    logger.info(f"Broadcast job {job['id']} created by {created_by} (campaign={campaign_id})")
+    return job
+
+async def get_broadcast_job(job_id: int) -> Optional[dict]:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcast_jobs WHERE id = %s;", (job_id,))
+        return _broadcast_row(await cur.fetchone())
+
+async def get_resumable_broadcasts() -> list:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcast_jobs WHERE status = 'RUNNING' ORDER BY id;")
+        return [_broadcast_row(r) for r in await cur.fetchall()]
+
+async def checkpoint_broadcast(job_id: int, last_user_id: int, sent: int, blocked: int, failed: int, status: str = None):
+    """Guarda el avance: en un reinicio se sigue desde last_user_id."""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("""
+            UPDATE broadcast_jobs SET
+                last_user_id = GREATEST(last_user_id, %s),
+                sent = %s, blocked = %s, failed = %s,
+                status = COALESCE(%s::text, status),
+                updated_at = now(),
+                -- Sin el cast Postgres no puede inferir el tipo de un parámetro que solo se compara
+                finished_at = CASE WHEN %s::text IS NOT NULL AND %s::text <> 'RUNNING' THEN now() ELSE finished_at END
+            WHERE id = %s;
+        """, (last_user_id, sent, blocked, failed, status, status, status, job_id))
+        await conn.commit()
+
+async def iter_broadcast_recipients(campaign_id: Optional[str], after_user_id: int = 0, batch_size: int = 500):
+    """Yields batches of recipient ids in id order, one keyset page per query."""
+    if campaign_id:
+        sql = """
+            SELECT user_id FROM (
+                SELECT referrer_id AS user_id FROM referrals WHERE campaign_id = %s AND referrer_id > %s
+                UNION
+                SELECT referee_id FROM referrals WHERE campaign_id = %s AND referee_id > %s
+            ) r ORDER BY user_id LIMIT %s;
+        """
+        params = lambda last: (campaign_id, last, campaign_id, last, batch_size)
+    else:
+        sql = "SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s;"
+        params = lambda last: (last, batch_size)
+    pool = get_pool()
+    last = after_user_id
+    while True:
+        # La conexión se devuelve al pool antes de entregar el lote: el envío tarda
+        # minutos y no debe quedar una transacción abierta ni una conexión ocupada.
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params(last))
+            rows = await cur.fetchall()
+        if not rows:
+            return
+        last = int(rows[-1][0])
+        yield [int(r[0]) for r in rows]
+        if len(rows) < batch_size:
+            return
+
+# --- Leaderboard (leaderboard_scores) ---
+_leaderboard = Leaderboard(refresh_seconds=float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60")))
+# Evita que una recarga lea la tabla mientras otro flush tiene deltas a medio escribir
+_leaderboard_lock = asyncio.Lock()
+
+def get_leaderboard_stats() -> dict:
+    return _leaderboard.stats()
+
+async def _flush_leaderboard_locked() -> int:
+    pending = _leaderboard.drain_pending()
+    if not pending:
+        return 0
+    pool = get_pool()
+    try:
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.executemany("""
+                INSERT INTO leaderboard_scores (campaign_id, metric, user_id, score)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (campaign_id, metric, user_id) DO UPDATE SET
+                    score = leaderboard_scores.score + EXCLUDED.score;
+            """, [(cid, metric, uid, delta) for (cid, metric, uid), delta in pending.items()])
+            await conn.commit()
+    except Exception:
+        _leaderboard.restore_pending(pending)
+        raise
+    return len(pending)
+
+async def flush_leaderboard() -> int:
+    """Persiste los deltas pendientes del ranking. Devuelve cuántas filas se tocaron."""
+    async with _leaderboard_lock:
+        return await _flush_leaderboard_locked()
+
+async def run_leaderboard_flush_loop(interval: float = 5.0):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_leaderboard()
+        except Exception as e:
+            logger.warning(f"Leaderboard flush failed: {e}")
+
+async def _get_board(campaign_id: str, metric: str):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown leaderboard metric: {metric}")
+    board = _leaderboard.board(campaign_id, metric)
+    if board is not None:
+        return board
+    async with _leaderboard_lock:
+        board = _leaderboard.board(campaign_id, metric)
+        if board is not None:
+            return board
+        await _flush_leaderboard_locked()
+        pool = get_pool()
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "SELECT user_id, score FROM leaderboard_scores WHERE campaign_id = %s AND metric = %s AND score <> 0;",
+                (str(campaign_id), metric),
+            )
+            rows = await cur.fetchall()
+        return _leaderboard.load(campaign_id, metric, rows)
+
+async def get_leaderboard_top(campaign_id: str, metric: str = "referrals", limit: int = 10, offset: int = 0) -> list:
+    """[(rank, user_id, score)] ordered by score."""
+    board = await _get_board(campaign_id, metric)
+    return board.top(limit, offset)
+
+async def get_leaderboard_rank(campaign_id: str, metric: str, user_id: int):
+    """(rank, score) or None if the user has no score in that campaign."""
+    board = await _get_board(campaign_id, metric)
+    return board.rank(user_id)
+
+async def rebuild_leaderboard_scores() -> int:
+    """Recalcula leaderboard_scores desde user_balances, points_history y points_rollup (uso offline).
+
+    Los deltas pendientes de esta réplica ya están en esas tablas y se descartan justo
+    antes del INSERT; los que se registren mientras corre quedan para el próximo flush.
+    """
+    pool = get_pool()
+    async with _leaderboard_lock:
+        pending = {}
+        try:
+            async with pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor() as cur:
+                        await cur.execute("LOCK TABLE leaderboard_scores IN EXCLUSIVE MODE;")
+                        await cur.execute("DELETE FROM leaderboard_scores;")
+                        pending = _leaderboard.drain_pending()
+                        await cur.execute("""
+                            INSERT INTO leaderboard_scores (campaign_id, metric, user_id, score)
+                            SELECT campaign_id, 'referrals', user_id, approved_count
+                            FROM user_balances
+                            WHERE campaign_id <> %s AND approved_count <> 0
+                            UNION ALL
+                            SELECT campaign_id, 'points', user_id, SUM(points)
+                            FROM (
+                                SELECT campaign_id, user_id, points FROM points_history WHERE campaign_id IS NOT NULL
+                                UNION ALL
+                                -- Meses de points_history ya archivados (services/partitions.py)
+                                SELECT campaign_id, user_id, points FROM points_rollup
+                            ) p
+                            GROUP BY campaign_id, user_id
+                            HAVING SUM(points) <> 0;
+                        """, (USER_WIDE_CAMPAIGN,))
+                        rows = cur.rowcount
+        except Exception:
+            # La tabla no cambió: los deltas descartados siguen sin persistir
+            _leaderboard.restore_pending(pending)
+            raise
+        _leaderboard.clear_boards()
+    logger.info(f"Leaderboard rebuilt: {rows} rows")
+    return rows
+
+# --- Read API (api/main.py) ---
+# Paginación por keyset: cada página sigue desde la última clave vista (usa el índice,
+# no recorre las filas saltadas como OFFSET).
+def _rows_as_dicts(cur, rows) -> list:
+    columns = [desc[0] for desc in cur.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+def _page_query(select: str, conditions: list, order_by: str) -> sql.Composed:
+    # Solo entran los filtros recibidos: con "(%s IS NULL OR ...)" el plan genérico que
+    # se prepara tras prepare_threshold no puede usar los índices de cada filtro
+    where = sql.SQL(" AND ").join(sql.SQL(c) for c in conditions) if conditions else sql.SQL("TRUE")
+    return sql.SQL("{select} WHERE {where} ORDER BY {order_by} LIMIT %s;").format(
+        select=sql.SQL(select), where=where, order_by=sql.SQL(order_by),
+    )
+
+async def list_users_page(after_id: int = None, limit: int = 50) -> list:
+    conditions, params = [], []
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+    query = _page_query("SELECT id, code, phone, email, total_points, created_at FROM users", conditions, "id")
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(query, (*params, limit))
+        return _rows_as_dicts(cur, await cur.fetchall())
+
+async def list_referrals_page(campaign_id: str = None, after: tuple = None, limit: int = 50, status: str = None) -> list:
+    """after = (campaign_id, referee_id) de la última fila de la página anterior."""
+    conditions, params = [], []
+    if campaign_id is not None:
+        conditions.append("campaign_id = %s")
+        params.append(campaign_id)
+    if status is not None:
+        conditions.append("status = %s")
+        params.append(status)
+    if after:
+        conditions.append("(campaign_id, referee_id) > (%s, %s)")
+        params.extend(after)
+    query = _page_query(
+        "SELECT campaign_id, referrer_id, referee_id, ref_code, status, created_at FROM referrals",
+        conditions, "campaign_id, referee_id",
+    )
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(query, (*params, limit))
+        return _rows_as_dicts(cur, await cur.fetchall())
+
+async def list_payments_page(after_id: int = None, limit: int = 50, status: str = None, user_id: int = None) -> list:
+    conditions, params = [], []
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+    if status is not None:
+        conditions.append("status = %s")
+        params.append(status)
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    query = _page_query(
+        "SELECT id, user_id, amount_cents, status, method_id, account, requested_at, processed_at, paid_at, note FROM payments",
+        conditions, "id",
+    )
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(query, (*params, limit))
+        return _rows_as_dicts(cur, await cur.fetchall())
+
+async def get_campaign_stats(campaign_id: str) -> Optional[dict]:
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT id, name, status, created_at FROM campaigns WHERE id = %s;", (campaign_id,))
+        campaign = await cur.fetchone()
+        if not campaign:
+            return None
+        stats = dict(zip(("id", "name", "status", "created_at"), campaign))
+        await cur.execute("""
+            SELECT status, COUNT(*) FROM referrals
+            WHERE campaign_id = %s GROUP BY status;
+        """, (campaign_id,))
+        by_status = await cur.fetchall()
+        stats["referrals"] = {status: count for status, count in by_status}
+        stats["referrals_total"] = sum(count for _, count in by_status)
+        await cur.execute(
+            "SELECT COUNT(DISTINCT referrer_id) FROM referrals WHERE campaign_id = %s;",
+            (campaign_id,),
+        )
+        stats["referrers"] = (await cur.fetchone())[0]
+        await cur.execute("""
+            SELECT (SELECT COALESCE(SUM(points), 0) FROM points_history WHERE campaign_id = %s)
+                 + (SELECT COALESCE(SUM(points), 0) FROM points_rollup WHERE campaign_id = %s);
+        """, (campaign_id, campaign_id))
+        stats["points_awarded"] = int((await cur.fetchone())[0])
+        # Campaña archivada: sus referrals ya no están en la base (ver partition_archives)
+        await cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM partition_archives WHERE parent = 'referrals' AND bound = %s);",
+            (campaign_id,),
+        )
+        stats["archived"] = (await cur.fetchone())[0]
+        return stats
+
 # This module will contain all database access and repository logic for the SaaS bot.
 # Move all DB-related functions from db_repo.py here, and import them as needed.
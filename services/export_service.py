@@ -0,0 +1,116 @@
+# Exportación CSV en streaming con COPY ... TO STDOUT.
+# Postgres genera el CSV y lo enviamos a disco por bloques (opcionalmente gzip),
+# sin materializar el resultado en memoria de Python.
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Optional
+
+import aiofiles
+
+from services.db_service import get_pool
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+CHUNK_BYTES = 1024 * 1024
+
+# tabla -> (SELECT base, columna de fecha, filtro por campaña)
+EXPORTS = {
+    "users": (
+        "SELECT u.id AS user_id, u.phone, u.code, u.email, u.total_points, u.created_at FROM users u",
+        "u.created_at",
+        "EXISTS (SELECT 1 FROM referrals r WHERE r.campaign_id = %(campaign_id)s"
+        " AND (r.referrer_id = u.id OR r.referee_id = u.id))",
+    ),
+    "referrals": (
+        "SELECT r.campaign_id, r.referrer_id, r.referee_id, r.ref_code, r.status, r.created_at FROM referrals r",
+        "r.created_at",
+        "r.campaign_id = %(campaign_id)s",
+    ),
+    "payments": (
+        "SELECT p.id, p.user_id, p.amount_cents, p.status, p.method_id, p.account,"
+        " p.requested_at, p.processed_at, p.paid_at, p.note FROM payments p",
+        "p.requested_at",
+        # payments no tiene campaign_id: se filtra por los referidores de la campaña
+        "p.user_id IN (SELECT r.referrer_id FROM referrals r WHERE r.campaign_id = %(campaign_id)s)",
+    ),
+    "points_history": (
+        "SELECT h.id, h.user_id, h.campaign_id, h.points, h.reason, h.created_at FROM points_history h",
+        "h.created_at",
+        "h.campaign_id = %(campaign_id)s",
+    ),
+}
+
+
+def build_export_query(table: str, campaign_id: Optional[str] = None, date_from=None, date_to=None):
+    if table not in EXPORTS:
+        raise ValueError(f"Unknown export table: {table}")
+    base, date_col, campaign_filter = EXPORTS[table]
+    where = []
+    params = {}
+    if campaign_id:
+        where.append(campaign_filter)
+        params["campaign_id"] = campaign_id
+    if date_from:
+        where.append(f"{date_col} >= %(date_from)s")
+        params["date_from"] = date_from
+    if date_to:
+        # Una fecha sin hora incluye el día completo
+        if isinstance(date_to, datetime):
+            where.append(f"{date_col} <= %(date_to)s")
+        else:
+            where.append(f"{date_col} < %(date_to)s::date + 1")
+        params["date_to"] = date_to
+    query = base + (" WHERE " + " AND ".join(where) if where else "")
+    return f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", params
+
+
+def export_path(table: str, gzip_output: bool = False, out_dir: str = None) -> str:
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"{table}-{stamp}.csv" + (".gz" if gzip_output else "")
+    return os.path.join(out_dir or EXPORT_DIR, name)
+
+
+async def copy_to_file(statement, params, path: str, gzip_output: bool = False, chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """Streams a COPY ... TO STDOUT statement into path. Returns {"bytes", "rows"}."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None
+    buffer = bytearray()
+    raw_bytes = 0
+    newlines = 0
+    pool = get_pool()
+    async with aiofiles.open(path, "wb") as f:
+        async with pool.connection() as conn, conn.cursor() as cur:
+            async with cur.copy(statement, params or None) as copy:
+                async for data in copy:
+                    raw_bytes += len(data)
+                    newlines += bytes(data).count(b"\n")
+                    buffer += compressor.compress(data) if compressor else data
+                    if len(buffer) >= chunk_bytes:
+                        await f.write(bytes(buffer))
+                        buffer.clear()
+        if compressor:
+            buffer += compressor.flush()
+        if buffer:
+            await f.write(bytes(buffer))
+    # Aproximado: los saltos de línea dentro de campos entrecomillados también cuentan
+    return {"bytes": raw_bytes, "rows": max(0, newlines - 1)}
+
+
+async def export_table(
+    table: str,
+    path: Optional[str] = None,
+    campaign_id: Optional[str] = None,
+    date_from=None,
+    date_to=None,
+    gzip_output: bool = False,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> dict:
+    """Streams one table to a CSV file. Returns {"path", "bytes", "rows"}."""
+    statement, params = build_export_query(table, campaign_id, date_from, date_to)
+    path = path or export_path(table, gzip_output)
+    result = await copy_to_file(statement, params, path, gzip_output, chunk_bytes)
+    logger.info(f"Exported {table} to {path}: ~{result['rows']} rows, {result['bytes']} bytes (gzip={gzip_output})")
+    return {"path": path, **result}
@@ -0,0 +1,195 @@
+# Ranking en memoria por campaña (referidos aprobados y puntos).
+# Cada tablero es una skip list indexable ordenada por (-score, user_id): insertar,
+# borrar, "mi posición" y el inicio del top-N cuestan O(log n). Los cambios se
+# aplican al tablero cargado y además se acumulan como deltas pendientes, que
+# db_service persiste periódicamente en leaderboard_scores (sumándolos, así varias
+# réplicas no se pisan). Un tablero se recarga desde la tabla tras refresh_seconds.
+import random
+import time
+from typing import Optional
+
+METRICS = ("referrals", "points")
+
+_MAX_LEVEL = 32
+_P = 0.25
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        # width[i]: posiciones que avanza el enlace next[i]
+        self.width = [1] * level
+
+
+class RankedSet:
+    """Indexable skip list of comparable keys."""
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < _MAX_LEVEL and random.random() < _P:
+            level += 1
+        return level
+
+    def _predecessors(self, key):
+        update = [None] * _MAX_LEVEL
+        rank = [0] * _MAX_LEVEL
+        x, acc = self._head, 0
+        for i in reversed(range(_MAX_LEVEL)):
+            while x.next[i] is not None and x.next[i].key < key:
+                acc += x.width[i]
+                x = x.next[i]
+            update[i], rank[i] = x, acc
+        return update, rank
+
+    def add(self, key) -> None:
+        update, rank = self._predecessors(key)
+        level = self._random_level()
+        node = _Node(key, level)
+        for i in range(_MAX_LEVEL):
+            prev = update[i]
+            if i < level:
+                node.next[i] = prev.next[i]
+                prev.next[i] = node
+                node.width[i] = prev.width[i] - (rank[0] - rank[i])
+                prev.width[i] = rank[0] - rank[i] + 1
+            elif prev.next[i] is not None:
+                prev.width[i] += 1
+        self._len += 1
+
+    def remove(self, key) -> bool:
+        update, _ = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(_MAX_LEVEL):
+            prev = update[i]
+            if prev.next[i] is node:
+                prev.width[i] += node.width[i] - 1
+                prev.next[i] = node.next[i]
+            elif prev.next[i] is not None:
+                prev.width[i] -= 1
+        self._len -= 1
+        return True
+
+    def count_less(self, key) -> int:
+        """Number of keys strictly lower than key."""
+        _, rank = self._predecessors(key)
+        return rank[0]
+
+    def slice(self, start: int, count: int) -> list:
+        """Keys at positions [start, start + count)."""
+        if start < 0 or start >= self._len or count <= 0:
+            return []
+        target = start + 1
+        x, acc = self._head, 0
+        for i in reversed(range(_MAX_LEVEL)):
+            while x.next[i] is not None and acc + x.width[i] <= target:
+                acc += x.width[i]
+                x = x.next[i]
+        out = []
+        while x is not None and len(out) < count:
+            out.append(x.key)
+            x = x.next[0]
+        return out
+
+
+class Board:
+    def __init__(self):
+        self.scores = {}
+        self.ranked = RankedSet()
+        self.loaded_at = time.monotonic()
+
+    def incr(self, user_id: int, delta: int) -> int:
+        old = self.scores.get(user_id, 0)
+        new = old + delta
+        if old:
+            self.ranked.remove((-old, user_id))
+        if new:
+            self.scores[user_id] = new
+            self.ranked.add((-new, user_id))
+        else:
+            self.scores.pop(user_id, None)
+        return new
+
+    def top(self, n: int, offset: int = 0) -> list:
+        """[(rank, user_id, score)]; ties share the rank (1, 2, 2, 4...)."""
+        out = []
+        for neg_score, user_id in self.ranked.slice(offset, n):
+            out.append((self.rank_of_score(-neg_score), user_id, -neg_score))
+        return out
+
+    def rank_of_score(self, score: int) -> int:
+        # Posición = 1 + cuántos tienen estrictamente más
+        return self.ranked.count_less((-score, float("-inf"))) + 1
+
+    def rank(self, user_id: int) -> Optional[tuple]:
+        score = self.scores.get(user_id)
+        if not score:
+            return None
+        return self.rank_of_score(score), score
+
+
+class Leaderboard:
+    def __init__(self, refresh_seconds: float = 60.0):
+        self.refresh_seconds = refresh_seconds
+        self._boards = {}
+        self._pending = {}
+
+    def record(self, campaign_id: str, metric: str, user_id: int, delta: int) -> None:
+        if not campaign_id or not delta:
+            return
+        key = (str(campaign_id), metric)
+        board = self._boards.get(key)
+        if board is not None:
+            board.incr(user_id, delta)
+        pkey = key + (user_id,)
+        self._pending[pkey] = self._pending.get(pkey, 0) + delta
+
+    def drain_pending(self) -> dict:
+        pending, self._pending = self._pending, {}
+        return {k: v for k, v in pending.items() if v}
+
+    def restore_pending(self, pending: dict) -> None:
+        # Si la escritura falla los deltas vuelven a la cola (sin tocar los tableros)
+        for pkey, delta in pending.items():
+            self._pending[pkey] = self._pending.get(pkey, 0) + delta
+
+    def board(self, campaign_id: str, metric: str) -> Optional[Board]:
+        board = self._boards.get((str(campaign_id), metric))
+        if board is None or time.monotonic() - board.loaded_at >= self.refresh_seconds:
+            return None
+        return board
+
+    def load(self, campaign_id: str, metric: str, rows) -> Board:
+        """Replaces the board with persisted (user_id, score) rows plus deltas not yet flushed."""
+        board = Board()
+        for user_id, score in rows:
+            board.incr(int(user_id), int(score))
+        key = (str(campaign_id), metric)
+        for (cid, m, user_id), delta in self._pending.items():
+            if (cid, m) == key:
+                board.incr(user_id, delta)
+        self._boards[key] = board
+        return board
+
+    def clear_boards(self) -> None:
+        # Los deltas pendientes se conservan: se persisten en el próximo flush
+        self._boards.clear()
+
+    def stats(self) -> dict:
+        return {
+            "boards": len(self._boards),
+            "entries": sum(len(b.scores) for b in self._boards.values()),
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,93 @@
+# Índice local de miembros del grupo.
+# Se alimenta de los updates chat_member/my_chat_member y evita llamar a
+# bot.get_chat_member en cada referido. Postgres (group_members) es la fuente
+# persistente y este módulo mantiene un front en memoria acotado.
+# Solo "es miembro" se guarda por horas: un "no es miembro" puede cambiar en cuanto
+# el usuario se une y los eventos chat_member solo llegan si el bot es admin, así
+# que se recuerda unos segundos en memoria y luego se vuelve a preguntar a la API.
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from services.db_service import MEMBER_STATUSES, get_member_status, set_member_status, clear_chat_members
+
+logger = logging.getLogger(__name__)
+
+_MEMORY_TTL = float(os.getenv("MEMBERSHIP_MEMORY_TTL_SECONDS", "3600"))
+_DB_MAX_AGE = float(os.getenv("MEMBERSHIP_DB_MAX_AGE_SECONDS", "86400"))
+_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL_SECONDS", "10"))
+_MAX_ENTRIES = int(os.getenv("MEMBERSHIP_MAX_ENTRIES", "200000"))
+
+_index: "OrderedDict[tuple, tuple]" = OrderedDict()
+stats = {"memory_hits": 0, "db_hits": 0, "api_calls": 0, "api_errors": 0, "events": 0}
+
+
+def normalize_status(member) -> str:
+    # "restricted" puede seguir siendo miembro; se reduce a member/left
+    status = getattr(member, "status", None)
+    status = getattr(status, "value", status)
+    if status == "restricted":
+        return "member" if getattr(member, "is_member", False) else "left"
+    return status or "left"
+
+
+def _remember(chat_id, user_id: int, status: str) -> None:
+    key = (str(chat_id), user_id)
+    _index[key] = (status, time.monotonic())
+    _index.move_to_end(key)
+    while len(_index) > _MAX_ENTRIES:
+        _index.popitem(last=False)
+
+
+def _cached(chat_id, user_id: int):
+    key = (str(chat_id), user_id)
+    entry = _index.get(key)
+    if entry is None:
+        return None
+    status, stored_at = entry
+    ttl = _MEMORY_TTL if status in MEMBER_STATUSES else _NEGATIVE_TTL
+    if time.monotonic() - stored_at >= ttl:
+        _index.pop(key, None)
+        return None
+    _index.move_to_end(key)
+    return status
+
+
+async def record_member_status(chat_id, user_id: int, status: str) -> None:
+    _remember(chat_id, user_id, status)
+    await set_member_status(chat_id, user_id, status)
+
+
+async def is_group_member(bot, chat_id, user_id: int) -> bool:
+    status = _cached(chat_id, user_id)
+    if status is not None:
+        stats["memory_hits"] += 1
+        return status in MEMBER_STATUSES
+    status = await get_member_status(chat_id, user_id, max_age_seconds=_DB_MAX_AGE)
+    # Un "left" guardado no se cree: pudo unirse después sin que llegara el evento
+    if status in MEMBER_STATUSES:
+        stats["db_hits"] += 1
+        _remember(chat_id, user_id, status)
+        return status in MEMBER_STATUSES
+    # Miss: consultar la API; solo se persiste si es miembro
+    stats["api_calls"] += 1
+    try:
+        member = await bot.get_chat_member(chat_id, user_id)
+    except Exception as e:
+        stats["api_errors"] += 1
+        logger.warning(f"get_chat_member failed chat={chat_id} user={user_id}: {e}")
+        return False
+    status = normalize_status(member)
+    if status in MEMBER_STATUSES:
+        await record_member_status(chat_id, user_id, status)
+    else:
+        _remember(chat_id, user_id, status)
+    return status in MEMBER_STATUSES
+
+
+async def forget_chat(chat_id) -> None:
+    # El bot salió del grupo: ya no recibiremos eventos, el índice quedaría obsoleto
+    for key in [k for k in _index if k[0] == str(chat_id)]:
+        _index.pop(key, None)
+    await clear_chat_members(chat_id)
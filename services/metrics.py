@@ -0,0 +1,155 @@
+# Métricas en formato de texto de Prometheus, sin dependencias externas.
+# Pensado para dejarlo activo en producción: observar un valor es un bisect y una
+# búsqueda en dict; el texto solo se arma cuando alguien pide /metrics.
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [conteo por bucket (no acumulado) ..., +Inf, suma]
+        self._series: Dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = []
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """Gauge read at scrape time from a callback returning {labels tuple: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), callback: Callable[[], dict] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        _registry.append(self)
+
+    def render(self) -> list:
+        if self.callback is None:
+            return []
+        try:
+            values = self.callback() or {}
+        except Exception:
+            return []
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in sorted(values.items())]
+
+
+def render() -> str:
+    out = []
+    for metric in _registry:
+        lines = metric.render()
+        if not lines:
+            continue
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+class timer:
+    """with timer(HISTOGRAM, *labels): ..."""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+# --- Métricas del bot ---
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Handler execution time by command / callback prefix", ("handler", "status")
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Query execution time by caller / statement name", ("query",))
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+DB_POOL_HOLD = Histogram("db_pool_hold_seconds", "Time a pooled connection is held by a caller")
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host: str, port: int):
+    """Standalone /metrics endpoint (polling mode, where there is no webhook server)."""
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
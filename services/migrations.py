@@ -0,0 +1,313 @@
+# Migraciones versionadas del esquema.
+# init_db() crea las tablas base de una instalación nueva; todo cambio posterior va
+# aquí como una migración numerada. run_migrations() aplica en orden las que falten
+# en schema_migrations, con un advisory lock para que dos procesos no migren a la vez.
+# Las migraciones normales corren en una transacción; las "concurrent" (CREATE INDEX
+# CONCURRENTLY) en autocommit, sin bloquear escrituras sobre la tabla.
+# Uso: python -m scripts.migrate [--status] [--to N]
+import logging
+import time
+from collections import namedtuple
+from typing import Optional
+
+import psycopg
+
+from services.db_service import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Clave arbitraria para pg_advisory_lock (una sola migración a la vez)
+MIGRATION_LOCK_KEY = 7_312_004_019
+
+Migration = namedtuple("Migration", "version name statements concurrent indexes", defaults=(False, ()))
+
+MIGRATIONS = [
+    Migration(1, "columns_used_by_services", [
+        # Columnas que el código ya usa pero que no tenían DDL (antes scripts/migrate_add_email.py)
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS email TEXT;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS country_code TEXT;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS client_id INTEGER REFERENCES clients(id);",
+        "ALTER TABLE referrals ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'PENDING';",
+        "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS group_chat_id BIGINT;",
+        "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS commission_per_approved_cents INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS min_withdraw_cents INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS currency TEXT;",
+    ]),
+    Migration(2, "payments_and_payout_methods", [
+        """
+        CREATE TABLE IF NOT EXISTS payout_methods (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            method_type TEXT NOT NULL,
+            details JSONB NOT NULL DEFAULT '{}'::jsonb,
+            is_default BOOLEAN NOT NULL DEFAULT false,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            amount_cents BIGINT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'REQUESTED',
+            method_id INTEGER,
+            account TEXT,
+            note TEXT,
+            requested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            processed_at TIMESTAMPTZ,
+            paid_at TIMESTAMPTZ
+        );
+        """,
+    ]),
+    # Índices de las búsquedas calientes; uno por migración para poder reintentar por separado
+    Migration(3, "payments_user_status_idx", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_user_status ON payments (user_id, status);",
+    ], concurrent=True, indexes=("idx_payments_user_status",)),
+    Migration(4, "referrals_referrer_campaign_status_idx", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_referrals_referrer_campaign_status"
+        " ON referrals (referrer_id, campaign_id, status);",
+    ], concurrent=True, indexes=("idx_referrals_referrer_campaign_status",)),
+    # Único: save_account_and_confirm hace ON CONFLICT (user_id, method_type)
+    Migration(5, "payout_methods_user_type_uidx", [
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uidx_payout_methods_user_type"
+        " ON payout_methods (user_id, method_type);",
+    ], concurrent=True, indexes=("uidx_payout_methods_user_type",)),
+    Migration(6, "users_phone_idx", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_phone ON users (phone);",
+    ], concurrent=True, indexes=("idx_users_phone",)),
+    # Particionado (services/partitions.py). Las migraciones 8 y 9 reescriben la tabla
+    # una vez bajo ACCESS EXCLUSIVE: correrlas en una ventana de mantenimiento.
+    Migration(7, "partition_support_tables", [
+        """
+        CREATE TABLE IF NOT EXISTS partition_archives (
+            id SERIAL PRIMARY KEY,
+            parent TEXT NOT NULL,
+            partition TEXT NOT NULL,
+            bound TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'DETACHED',
+            rows BIGINT,
+            bytes BIGINT,
+            path TEXT,
+            detached_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            archived_at TIMESTAMPTZ
+        );
+        """,
+        # Puntos por (campaña, usuario) de los meses de points_history ya archivados
+        """
+        CREATE TABLE IF NOT EXISTS points_rollup (
+            campaign_id TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            points BIGINT NOT NULL DEFAULT 0,
+            CONSTRAINT points_rollup_pk PRIMARY KEY (campaign_id, user_id)
+        );
+        """,
+    ]),
+    Migration(8, "partition_points_history_by_month", [
+        "ALTER TABLE points_history RENAME TO points_history_legacy;",
+        "ALTER TABLE points_history_legacy RENAME CONSTRAINT points_history_pkey TO points_history_legacy_pkey;",
+        """
+        CREATE TABLE points_history (
+            id BIGINT NOT NULL DEFAULT nextval('points_history_id_seq'),
+            user_id BIGINT NOT NULL,
+            campaign_id TEXT,
+            points INTEGER NOT NULL,
+            reason TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT points_history_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        """,
+        "CREATE TABLE points_history_default PARTITION OF points_history DEFAULT;",
+        # Un mes por partición (UTC), desde la fila más antigua hasta dos meses por delante.
+        # Mismo nombre que partitions.month_partition_name()
+        """
+        DO $$
+        DECLARE
+            m timestamp;
+            last_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months';
+        BEGIN
+            SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC') INTO m FROM points_history_legacy;
+            m := LEAST(COALESCE(m, last_month), date_trunc('month', now() AT TIME ZONE 'UTC'));
+            WHILE m <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF points_history FOR VALUES FROM (%L) TO (%L)',
+                    'points_history_' || to_char(m, 'YYYY_MM'),
+                    m AT TIME ZONE 'UTC',
+                    (m + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                m := m + interval '1 month';
+            END LOOP;
+        END $$;
+        """,
+        """
+        INSERT INTO points_history (id, user_id, campaign_id, points, reason, created_at)
+        SELECT id, user_id, campaign_id, points, reason, COALESCE(created_at, now()) FROM points_history_legacy;
+        """,
+        "ALTER SEQUENCE points_history_id_seq OWNED BY points_history.id;",
+        "DROP TABLE points_history_legacy;",
+        "CREATE INDEX idx_points_history_user ON points_history (user_id);",
+        "CREATE INDEX idx_points_history_campaign_user ON points_history (campaign_id, user_id);",
+    ]),
+    Migration(9, "partition_referrals_by_campaign", [
+        "ALTER TABLE referrals RENAME TO referrals_legacy;",
+        "ALTER TABLE referrals_legacy RENAME CONSTRAINT referrals_pk TO referrals_legacy_pk;",
+        "DROP INDEX IF EXISTS idx_referrals_referrer;",
+        "DROP INDEX IF EXISTS idx_referrals_referrer_campaign_status;",
+        """
+        CREATE TABLE referrals (
+            campaign_id TEXT NOT NULL,
+            referrer_id BIGINT NOT NULL,
+            referee_id BIGINT NOT NULL,
+            ref_code TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            status TEXT NOT NULL DEFAULT 'PENDING',
+            CONSTRAINT referrals_pk PRIMARY KEY (campaign_id, referee_id),
+            CONSTRAINT no_self_referral CHECK (referrer_id <> referee_id)
+        ) PARTITION BY LIST (campaign_id);
+        """,
+        "CREATE TABLE referrals_default PARTITION OF referrals DEFAULT;",
+        # Mismo nombre que partitions.campaign_partition_name()
+        """
+        DO $$
+        DECLARE
+            cid text;
+        BEGIN
+            FOR cid IN SELECT DISTINCT campaign_id FROM referrals_legacy LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF referrals FOR VALUES IN (%L)',
+                    'referrals_c_' || left(regexp_replace(lower(cid), '[^a-z0-9]+', '_', 'g'), 40) || '_' || left(md5(cid), 8),
+                    cid
+                );
+            END LOOP;
+        END $$;
+        """,
+        """
+        INSERT INTO referrals (campaign_id, referrer_id, referee_id, ref_code, created_at, status)
+        SELECT campaign_id, referrer_id, referee_id, ref_code, created_at, status FROM referrals_legacy;
+        """,
+        "DROP TABLE referrals_legacy;",
+        "CREATE INDEX idx_referrals_referrer ON referrals (campaign_id, referrer_id);",
+        "CREATE INDEX idx_referrals_referrer_campaign_status ON referrals (referrer_id, campaign_id, status);",
+        # Búsquedas por referido sin campaña (clawback al salir del grupo) recorren todas las particiones
+        "CREATE INDEX idx_referrals_referee ON referrals (referee_id);",
+    ]),
+    # Lotes de pago (services/payout_service.py)
+    Migration(10, "payout_batches", [
+        """
+        CREATE TABLE IF NOT EXISTS payout_batches (
+            id SERIAL PRIMARY KEY,
+            method_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'OPEN',
+            items INTEGER NOT NULL DEFAULT 0,
+            total_cents BIGINT NOT NULL DEFAULT 0,
+            path TEXT,
+            created_by TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            completed_at TIMESTAMPTZ
+        );
+        """,
+        "ALTER TABLE payments ADD COLUMN IF NOT EXISTS batch_id INTEGER REFERENCES payout_batches(id);",
+    ]),
+    # Solo los pagos aprobados y sin lote: el índice se queda pequeño aunque payments crezca
+    Migration(11, "payments_approved_unbatched_idx", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_approved_unbatched"
+        " ON payments (id) WHERE status = 'APPROVED' AND batch_id IS NULL;",
+    ], concurrent=True, indexes=("idx_payments_approved_unbatched",)),
+    # Sincronización del filtro de códigos entre réplicas (db_service.sync_code_filter)
+    Migration(12, "users_created_at_idx", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_created_at ON users (created_at);",
+    ], concurrent=True, indexes=("idx_users_created_at",)),
+]
+
+
+async def _connect() -> psycopg.AsyncConnection:
+    # Conexión propia (no del pool): CONCURRENTLY necesita autocommit
+    return await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True)
+
+
+async def _ensure_table(conn) -> None:
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            duration_ms INTEGER
+        );
+    """)
+
+
+async def _applied_versions(conn) -> dict:
+    cur = await conn.execute("SELECT version, applied_at FROM schema_migrations ORDER BY version;")
+    return {version: applied_at for version, applied_at in await cur.fetchall()}
+
+
+async def _drop_invalid_indexes(conn, names) -> None:
+    # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID y el
+    # IF NOT EXISTS del reintento no lo reconstruiría
+    for name in names:
+        cur = await conn.execute(
+            "SELECT NOT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s);", (name,)
+        )
+        row = await cur.fetchone()
+        if row and row[0]:
+            logger.warning(f"Dropping invalid index {name} left by an interrupted migration")
+            await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}";')
+
+
+async def _apply(conn, migration: Migration) -> int:
+    started = time.perf_counter()
+    if migration.concurrent:
+        await _drop_invalid_indexes(conn, migration.indexes)
+        for statement in migration.statements:
+            await conn.execute(statement)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s) ON CONFLICT (version) DO NOTHING;",
+            (migration.version, migration.name, duration_ms),
+        )
+        return duration_ms
+    async with conn.transaction():
+        for statement in migration.statements:
+            await conn.execute(statement)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s);",
+            (migration.version, migration.name, duration_ms),
+        )
+    return duration_ms
+
+
+async def migration_status() -> list:
+    """[(version, name, applied_at or None)] for every known migration."""
+    conn = await _connect()
+    try:
+        await _ensure_table(conn)
+        applied = await _applied_versions(conn)
+    finally:
+        await conn.close()
+    return [(m.version, m.name, applied.get(m.version)) for m in MIGRATIONS]
+
+
+async def pending_migrations() -> list:
+    return [(version, name) for version, name, applied_at in await migration_status() if applied_at is None]
+
+
+async def run_migrations(target: Optional[int] = None) -> list:
+    """Applies pending migrations up to target (all if None). Returns [(version, name, ms)]."""
+    conn = await _connect()
+    done = []
+    try:
+        await conn.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+        try:
+            await _ensure_table(conn)
+            applied = await _applied_versions(conn)
+            for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+                if migration.version in applied or (target is not None and migration.version > target):
+                    continue
+                logger.info(f"Applying migration {migration.version:04d}_{migration.name}")
+                duration_ms = await _apply(conn, migration)
+                done.append((migration.version, migration.name, duration_ms))
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+    finally:
+        await conn.close()
+    return done
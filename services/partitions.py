@@ -0,0 +1,258 @@
+# Mantenimiento de particiones (migraciones 7-9 en services/migrations.py).
+# points_history está particionada por mes (UTC) y referrals por campaña; cada tabla
+# tiene una partición DEFAULT que recoge lo que no tenga partición propia todavía.
+# - ensure_*: crea las particiones que faltan moviendo antes sus filas desde DEFAULT
+#   (Postgres no deja crear una partición si DEFAULT ya tiene filas de su rango).
+# - archive_*: separa (DETACH) meses viejos o campañas cerradas, los vuelca a CSV gzip
+#   en ARCHIVE_DIR y borra la tabla. Queda registro en partition_archives; los puntos
+#   de los meses archivados se suman antes en points_rollup.
+# Uso: python -m scripts.partitions {list,ensure,archive-months,archive-campaign}
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from psycopg import sql
+
+from services.db_service import get_pool
+from services.export_service import copy_to_file
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archives")
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+# Evita quedarse esperando detrás de una transacción larga con la tabla padre bloqueada
+LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_partition_name(month: date) -> str:
+    return f"points_history_{month:%Y_%m}"
+
+
+def campaign_partition_name(campaign_id: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", campaign_id.lower())[:40]
+    return f"referrals_c_{slug}_{hashlib.md5(campaign_id.encode()).hexdigest()[:8]}"
+
+
+def _month_bounds(month: date):
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end = _add_months(month, 1)
+    return start, datetime(end.year, end.month, 1, tzinfo=timezone.utc)
+
+
+async def _exists(cur, name: str) -> bool:
+    await cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+    return (await cur.fetchone())[0]
+
+
+async def _create_partition(parent: str, name: str, bound: sql.Composable, match: sql.Composable, params) -> int:
+    """Creates name as a partition of parent, moving its rows out of the DEFAULT partition first."""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                if await _exists(cur, name):
+                    return 0
+                await cur.execute(sql.SQL("SET LOCAL lock_timeout = {};").format(sql.Literal(LOCK_TIMEOUT)))
+                await cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);").format(
+                    sql.Identifier(name), sql.Identifier(parent)
+                ))
+                await cur.execute(sql.SQL(
+                    "WITH moved AS (DELETE FROM {default} WHERE {match} RETURNING *) INSERT INTO {name} SELECT * FROM moved;"
+                ).format(default=sql.Identifier(f"{parent}_default"), match=match, name=sql.Identifier(name)), params)
+                moved = cur.rowcount
+                await cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} {};").format(
+                    sql.Identifier(parent), sql.Identifier(name), bound
+                ))
+    logger.info(f"Created partition {name} of {parent} ({moved} rows moved from default)")
+    return moved
+
+
+async def ensure_month_partition(month: date) -> int:
+    month = _month_start(month)
+    start, end = _month_bounds(month)
+    return await _create_partition(
+        "points_history",
+        month_partition_name(month),
+        sql.SQL("FOR VALUES FROM ({}) TO ({})").format(sql.Literal(start), sql.Literal(end)),
+        sql.SQL("created_at >= %s AND created_at < %s"),
+        (start, end),
+    )
+
+
+async def ensure_campaign_partition(campaign_id: str) -> int:
+    return await _create_partition(
+        "referrals",
+        campaign_partition_name(campaign_id),
+        sql.SQL("FOR VALUES IN ({})").format(sql.Literal(campaign_id)),
+        sql.SQL("campaign_id = %s"),
+        (campaign_id,),
+    )
+
+
+async def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> dict:
+    """Creates upcoming month partitions and one partition per active campaign."""
+    this_month = _month_start(datetime.now(timezone.utc).date())
+    created = {"months": [], "campaigns": []}
+    for i in range(months_ahead + 1):
+        month = _add_months(this_month, i)
+        pool = get_pool()
+        async with pool.connection() as conn, conn.cursor() as cur:
+            exists = await _exists(cur, month_partition_name(month))
+        if not exists:
+            await ensure_month_partition(month)
+            created["months"].append(month_partition_name(month))
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        # Campañas activas sin partición y cualquier campaña con filas en DEFAULT
+        await cur.execute("""
+            SELECT id FROM campaigns WHERE status = 'ACTIVE'
+            UNION
+            SELECT DISTINCT campaign_id FROM referrals_default;
+        """)
+        campaign_ids = [row[0] for row in await cur.fetchall()]
+        await cur.execute("SELECT bound FROM partition_archives WHERE parent = 'referrals';")
+        archived = {row[0] for row in await cur.fetchall()}
+        missing = []
+        for campaign_id in campaign_ids:
+            if campaign_id not in archived and not await _exists(cur, campaign_partition_name(campaign_id)):
+                missing.append(campaign_id)
+    for campaign_id in missing:
+        await ensure_campaign_partition(campaign_id)
+        created["campaigns"].append(campaign_partition_name(campaign_id))
+    return created
+
+
+async def list_partitions(parent: str) -> list:
+    """[{"name", "bound", "bytes", "rows_estimate"}] for the attached partitions of parent."""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), pg_total_relation_size(c.oid), c.reltuples::bigint
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname;
+        """, (parent,))
+        return [
+            {"name": name, "bound": bound, "bytes": size, "rows_estimate": max(0, rows)}
+            for name, bound, size, rows in await cur.fetchall()
+        ]
+
+
+async def _detach(parent: str, name: str, bound: str, before_detach=None) -> Optional[int]:
+    """Detaches a partition and records it in partition_archives. Returns the archive id."""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                if not await _exists(cur, name):
+                    return None
+                await cur.execute(sql.SQL("SET LOCAL lock_timeout = {};").format(sql.Literal(LOCK_TIMEOUT)))
+                if before_detach is not None:
+                    await before_detach(cur)
+                await cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                    sql.Identifier(parent), sql.Identifier(name)
+                ))
+                await cur.execute(
+                    "INSERT INTO partition_archives (parent, partition, bound) VALUES (%s, %s, %s) RETURNING id;",
+                    (parent, name, bound),
+                )
+                archive_id = (await cur.fetchone())[0]
+    logger.info(f"Detached partition {name} from {parent}")
+    return archive_id
+
+
+async def _archive_detached(archive_id: int, name: str, out_dir: str = None) -> dict:
+    # Ya separada: el COPY y el DROP no bloquean la tabla padre
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir or ARCHIVE_DIR, f"{name}-{stamp}.csv.gz")
+    statement = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER true)").format(sql.Identifier(name))
+    result = await copy_to_file(statement, None, path, gzip_output=True)
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    UPDATE partition_archives
+                    SET status = 'ARCHIVED', rows = %s, bytes = %s, path = %s, archived_at = now()
+                    WHERE id = %s;
+                """, (result["rows"], result["bytes"], path, archive_id))
+                await cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+    logger.info(f"Archived {name} to {path}: ~{result['rows']} rows, {result['bytes']} bytes")
+    return {"partition": name, "path": path, **result}
+
+
+async def archive_months(older_than_months: int, out_dir: str = None) -> list:
+    """Archives every points_history month that ended more than older_than_months ago."""
+    if older_than_months < 1:
+        raise ValueError("older_than_months must be >= 1")
+    cutoff = month_partition_name(_add_months(_month_start(datetime.now(timezone.utc).date()), -older_than_months))
+    done = []
+    for partition in await list_partitions("points_history"):
+        name = partition["name"]
+        # Los nombres points_history_YYYY_MM ordenan igual que los meses
+        if name == "points_history_default" or name >= cutoff:
+            continue
+
+        async def rollup(cur, name=name):
+            await cur.execute(sql.SQL("""
+                INSERT INTO points_rollup (campaign_id, user_id, points)
+                SELECT campaign_id, user_id, SUM(points) FROM {}
+                WHERE campaign_id IS NOT NULL
+                GROUP BY campaign_id, user_id
+                ON CONFLICT (campaign_id, user_id) DO UPDATE SET points = points_rollup.points + EXCLUDED.points;
+            """).format(sql.Identifier(name)))
+
+        archive_id = await _detach("points_history", name, name[len("points_history_"):], before_detach=rollup)
+        if archive_id is not None:
+            done.append(await _archive_detached(archive_id, name, out_dir))
+    return done
+
+
+async def archive_campaign(campaign_id: str, out_dir: str = None) -> Optional[dict]:
+    """Archives the referrals of a campaign that is no longer ACTIVE."""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT status FROM campaigns WHERE id = %s;", (campaign_id,))
+        row = await cur.fetchone()
+    if row and row[0] == "ACTIVE":
+        raise ValueError(f"Campaign {campaign_id} is still ACTIVE")
+    await ensure_campaign_partition(campaign_id)
+    name = campaign_partition_name(campaign_id)
+    archive_id = await _detach("referrals", name, campaign_id)
+    if archive_id is None:
+        return None
+    return await _archive_detached(archive_id, name, out_dir)
+
+
+async def resume_archives(out_dir: str = None) -> list:
+    """Finishes archives interrupted after DETACH (table still present, no file recorded)."""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT id, partition FROM partition_archives WHERE status = 'DETACHED' ORDER BY id;")
+        pending = await cur.fetchall()
+    return [await _archive_detached(archive_id, name, out_dir) for archive_id, name in pending]
+
+
+async def run_partition_maintenance_loop(interval_seconds: float = 21600) -> None:
+    while True:
+        try:
+            created = await ensure_partitions()
+            if created["months"] or created["campaigns"]:
+                logger.info(f"Partition maintenance: {created}")
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,212 @@
+# Lotes de pago para PayPal Payouts y Binance Pay.
+# Cada lote es una transacción: los pagos APPROVED del método se leen con un cursor
+# del servidor (FOR UPDATE SKIP LOCKED, así varios workers no se pisan), se escriben
+# al archivo por bloques y, en la misma transacción, pasan a PAID con batch_id y se
+# mueve el monto de pending_cents a paid_cents en user_balances. El archivo se
+# escribe como .part y se renombra después del COMMIT: un lote a medias no deja un
+# archivo que parezca válido, y sus pagos siguen APPROVED para el siguiente intento.
+# Uso: python -m scripts.payouts --method Paypal [--workers 4] [--max-items 15000]
+import asyncio
+import csv
+import io
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import aiofiles
+import psycopg
+
+from services.db_service import USER_WIDE_CAMPAIGN, get_pool
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_DIR = os.getenv("PAYOUT_DIR", "payouts")
+# PayPal Payouts acepta hasta 15 000 ítems por lote
+MAX_ITEMS = int(os.getenv("PAYOUT_BATCH_MAX_ITEMS", "15000"))
+FETCH_SIZE = int(os.getenv("PAYOUT_FETCH_SIZE", "1000"))
+CURRENCIES = {
+    "Paypal": os.getenv("PAYOUT_CURRENCY_PAYPAL", os.getenv("CURRENCY", "USD")),
+    "BinancePay": os.getenv("PAYOUT_CURRENCY_BINANCE", "USDT"),
+}
+
+
+def format_amount(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _paypal_rows(rows, currency: str) -> list:
+    # Archivo de Payouts: receptor, monto, moneda, referencia, nota, wallet (sin cabecera)
+    return [
+        [account, format_amount(amount_cents), currency, f"payment-{payment_id}", "Referral payout", "PAYPAL"]
+        for payment_id, user_id, amount_cents, account in rows
+    ]
+
+
+def _binance_rows(rows, currency: str) -> list:
+    # Campos de transferDetailList del batch payout de Binance Pay
+    return [
+        [
+            f"payment{payment_id}",
+            "PAY_ID" if account.strip().isdigit() else "EMAIL",
+            account.strip(),
+            format_amount(amount_cents),
+            currency,
+            "Referral payout",
+        ]
+        for payment_id, user_id, amount_cents, account in rows
+    ]
+
+
+# method_type -> (extensión, cabecera o None, filas)
+PAYOUT_FORMATS = {
+    "Paypal": ("csv", None, _paypal_rows),
+    "BinancePay": (
+        "csv",
+        ["merchantSendId", "receiveType", "receiver", "transferAmount", "currency", "remark"],
+        _binance_rows,
+    ),
+}
+
+
+def _csv_chunk(rows: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+
+async def _mark_paid(cur, batch_id: int, rows) -> None:
+    ids = [payment_id for payment_id, _, _, _ in rows]
+    await cur.execute("""
+        UPDATE payments SET status = 'PAID', paid_at = now(), processed_at = now(), batch_id = %s
+        WHERE id = ANY(%s) AND status = 'APPROVED';
+    """, (batch_id, ids))
+    if cur.rowcount != len(ids):
+        # Imposible con las filas bloqueadas; si pasa, el lote no debe confirmarse
+        raise RuntimeError(f"Payout batch {batch_id}: expected {len(ids)} APPROVED rows, updated {cur.rowcount}")
+    per_user = {}
+    for _, user_id, amount_cents, _ in rows:
+        per_user[user_id] = per_user.get(user_id, 0) + amount_cents
+    await cur.execute("""
+        INSERT INTO user_balances (user_id, campaign_id, paid_cents, pending_cents)
+        SELECT user_id, %s, amount, -amount FROM unnest(%s::bigint[], %s::bigint[]) AS t(user_id, amount)
+        ON CONFLICT (user_id, campaign_id) DO UPDATE SET
+            paid_cents = user_balances.paid_cents + EXCLUDED.paid_cents,
+            pending_cents = user_balances.pending_cents + EXCLUDED.pending_cents,
+            updated_at = now();
+    """, (USER_WIDE_CAMPAIGN, list(per_user), list(per_user.values())))
+
+
+async def run_payout_batch(
+    method_type: str,
+    max_items: int = MAX_ITEMS,
+    fetch_size: int = FETCH_SIZE,
+    out_dir: str = None,
+    created_by: str = None,
+) -> Optional[dict]:
+    """Builds one payout file for method_type. Returns the batch summary, or None if nothing was pending."""
+    if method_type not in PAYOUT_FORMATS:
+        raise ValueError(f"Unknown payout method: {method_type}")
+    extension, header, to_rows = PAYOUT_FORMATS[method_type]
+    currency = CURRENCIES[method_type]
+    out_dir = out_dir or PAYOUT_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    items = total_cents = 0
+    part_path = path = None
+    pool = get_pool()
+    try:
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "INSERT INTO payout_batches (method_type, created_by) VALUES (%s, %s) RETURNING id;",
+                        (method_type, created_by),
+                    )
+                    batch_id = (await cur.fetchone())[0]
+                    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+                    path = os.path.join(out_dir, f"payout-{method_type.lower()}-{batch_id}-{stamp}.{extension}")
+                    part_path = path + ".part"
+                    async with conn.cursor(name=f"payout_batch_{batch_id}") as source, aiofiles.open(
+                        part_path, "w", encoding="utf-8", newline=""
+                    ) as f:
+                        if header:
+                            await f.write(_csv_chunk([header]))
+                        await source.execute("""
+                            SELECT p.id, p.user_id, p.amount_cents, p.account
+                            FROM payments p JOIN payout_methods m ON m.id = p.method_id
+                            WHERE p.status = 'APPROVED' AND p.batch_id IS NULL
+                              AND m.method_type = %s AND COALESCE(p.account, '') <> ''
+                            ORDER BY p.id
+                            LIMIT %s
+                            FOR UPDATE OF p SKIP LOCKED;
+                        """, (method_type, max_items))
+                        while True:
+                            rows = await source.fetchmany(fetch_size)
+                            if not rows:
+                                break
+                            await f.write(_csv_chunk(to_rows(rows, currency)))
+                            await _mark_paid(cur, batch_id, rows)
+                            items += len(rows)
+                            total_cents += sum(amount_cents for _, _, amount_cents, _ in rows)
+                    if not items:
+                        # Nada pendiente para este método: no dejar un lote vacío
+                        raise psycopg.Rollback()
+                    await cur.execute("""
+                        UPDATE payout_batches
+                        SET status = 'COMPLETE', items = %s, total_cents = %s, path = %s, completed_at = now()
+                        WHERE id = %s;
+                    """, (items, total_cents, path, batch_id))
+    except BaseException:
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    if not items:
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+    os.replace(part_path, path)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Payout batch {batch_id} ({method_type}): {items} payments, {format_amount(total_cents)} {currency} -> {path} ({elapsed:.1f}s)"
+    )
+    return {
+        "batch_id": batch_id,
+        "method_type": method_type,
+        "items": items,
+        "total_cents": total_cents,
+        "currency": currency,
+        "path": path,
+        "elapsed": elapsed,
+    }
+
+
+async def run_payouts(method_type: str, workers: int = 1, **kwargs) -> list:
+    """Runs batches until nothing is left; workers run concurrently on disjoint rows (SKIP LOCKED)."""
+    batches = []
+
+    async def worker():
+        while True:
+            batch = await run_payout_batch(method_type, **kwargs)
+            if batch is None:
+                return
+            batches.append(batch)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return sorted(batches, key=lambda b: b["batch_id"])
+
+
+async def recover_batch_files() -> list:
+    """Renames .part files of batches that committed but were not renamed (crash right after COMMIT)."""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT id, path FROM payout_batches WHERE status = 'COMPLETE' AND path IS NOT NULL;")
+        batches = await cur.fetchall()
+    recovered = []
+    for batch_id, path in batches:
+        if not os.path.exists(path) and os.path.exists(path + ".part"):
+            os.replace(path + ".part", path)
+            recovered.append(path)
+            logger.warning(f"Recovered payout file for batch {batch_id}: {path}")
+    return recovered
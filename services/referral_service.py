@@ -1,11 +1,35 @@
+from psycopg import errors as pg_errors
+
 from services.db_service import (
-	find_user_by_code,
-	referee_already_referred,
-	is_reciprocal_referral,
-	insert_referral,
+	ReferralResult,
+	register_referral_atomic,
+	code_might_exist,
+	record_code_filter_false_positive,
+	get_existing_code_by_user,
+	get_code_by_phone,
 	upsert_user,
-	add_points,
 )
+from services.code_allocator import get_allocator
+from services.membership_service import is_group_member
+
+# ReferralResult -> clave de texto para t()
+REFERRAL_RESULT_MESSAGES = {
+	ReferralResult.INVALID_CODE: "invalid_referral",
+	ReferralResult.SELF_REFERRAL: "self_referral",
+	ReferralResult.ALREADY_REFERRED: "already_referred",
+	ReferralResult.RECIPROCAL: "reciprocal_blocked",
+	ReferralResult.CAMPAIGN_INACTIVE: "campaign_inactive",
+	ReferralResult.OK: "referral_done",
+}
+
+def normalize_code(ref_code: str) -> str:
+	return (
+		ref_code.strip().upper()
+		.replace(" ", "")
+		.replace("_", "")
+		.replace("—", "-")
+		.replace("–", "-")
+	)
 
 async def register_referral(
 	campaign_id: str,
@@ -19,54 +43,30 @@ async def register_referral(
 	message,
 ):
 	lang = get_lang(message.from_user)
-	code = (
-		ref_code.strip().upper()
-		.replace(" ", "")
-		.replace("_", "")
-		.replace("—", "-")
-		.replace("–", "-")
-	)
-	referrer_id = await find_user_by_code(code)
-	if not referrer_id:
-		await message.answer(t("invalid_referral", lang)); return
-	if referrer_id == referee_id:
-		await message.answer(t("self_referral", lang)); return
-	if await referee_already_referred(campaign_id, referee_id):
-		await message.answer(t("already_referred", lang)); return
-	if await is_reciprocal_referral(campaign_id, referee_id, referrer_id):
-		await message.answer(t("reciprocal_blocked", lang)); return
-	# Check if referee is in the group before awarding points
+	code = normalize_code(ref_code)
+	# Código nunca emitido (filtro de Bloom, confirmado con un sync): se rechaza sin más consultas ni la API
+	if not await code_might_exist(code):
+		await message.answer(t(REFERRAL_RESULT_MESSAGES[ReferralResult.INVALID_CODE], lang)); return
+	# Check if referee is in the group before awarding points (local index, API only on miss)
 	is_member = False
 	if group_chat_id:
-		try:
-			member = await bot.get_chat_member(group_chat_id, referee_id)
-			is_member = getattr(member, "status", None) in ("member", "administrator", "creator")
-		except Exception:
-			pass
+		is_member = await is_group_member(bot, group_chat_id, referee_id)
+	# Si no es miembro solo se validan los datos (apply=False), sin escribir nada
+	try:
+		result, _ = await register_referral_atomic(
+			campaign_id, referee_id, code, points_per_referral, apply=is_member
+		)
+	except Exception as e:
+		await message.answer(t("already_referred", lang) + f"\nError: {e}"); return
+	if result is ReferralResult.INVALID_CODE:
+		record_code_filter_false_positive()
+	if result is not ReferralResult.OK:
+		await message.answer(t(REFERRAL_RESULT_MESSAGES[result], lang)); return
 	if is_member:
-		try:
-			await insert_referral(campaign_id, referrer_id, referee_id, code)
-			points = points_per_referral
-			await upsert_user(referee_id)
-			await upsert_user(referrer_id)
-			await add_points(referee_id, points, reason="joined_group")
-			await add_points(referrer_id, points, reason="referral_success")
-		except Exception as e:
-			await message.answer(t("already_referred", lang) + f"\nError: {e}"); return
 		await message.answer(t("referral_done", lang))
-		await message.answer(
-			"⚠️ If you leave the main group, you will lose your points!\n¡Si sales del grupo principal, perderás tus puntos!"
-		)
+		await message.answer(t("leave_group_warning", lang))
 	else:
-		await message.answer(
-			"❗️You must join the main group to receive your points.\nDebes unirte al grupo principal para recibir tus puntos."
-		)
-from services.db_service import (
-	get_existing_code_by_user,
-	get_code_by_phone,
-	upsert_user,
-)
-from utils.helpers import build_random_code
+		await message.answer(t("must_join_group", lang))
 
 # Assign or get a unique referral code for a user
 async def assign_or_get_code(user_id: int, phone_e164: str, prefix_override: str, country_code: str) -> str | None:
@@ -79,16 +79,19 @@ async def assign_or_get_code(user_id: int, phone_e164: str, prefix_override: str
 		_, code = phone_owner
 		return code
 
-	for _ in range(5):
-		code = build_random_code(prefix=prefix_override or "RF", length=8)
+	allocator = get_allocator()
+	# Los códigos del asignador son únicos entre sí; el loop solo cubre un choque
+	# con un código aleatorio antiguo (build_random_code), que es muy improbable.
+	for _ in range(3):
+		code = await allocator.next_code(prefix=prefix_override or "RF")
 		try:
 			await upsert_user(user_id, code, phone_e164)
 			return code
-		except Exception as e:
-			msg = str(e).lower()
-			if "unique" in msg and "code" in msg:
+		except pg_errors.UniqueViolation as e:
+			constraint = (e.diag.constraint_name or "").lower()
+			if "code" in constraint:
 				continue
-			if "unique" in msg and "phone" in msg:
+			if "phone" in constraint:
 				row = await get_code_by_phone(phone_e164)
 				if row:
 					_, existing_code = row
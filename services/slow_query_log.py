@@ -0,0 +1,104 @@
+# Registro de consultas lentas.
+# db_service.TimedCursor avisa aquí de cada sentencia que supera el umbral: se
+# registra en el log con sus parámetros redactados y la función que la lanzó, y
+# para una muestra se guarda el plan (EXPLAIN ANALYZE, BUFFERS) en
+# <SLOW_QUERY_DIR>/slow_queries-YYYY-MM-DD.log.
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+# Solo se ejecuta EXPLAIN ANALYZE sobre lecturas; las escrituras se explican sin ANALYZE
+_WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|LOCK|NEXTVAL|SETVAL)\b", re.IGNORECASE)
+
+
+def normalize_query(query) -> str:
+    return _WS.sub(" ", str(query)).strip()
+
+
+def is_read_only(query: str) -> bool:
+    head = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    return head in ("SELECT", "WITH") and not _WRITE.search(query)
+
+
+def _redact(value):
+    # Números, booleanos y NULL se dejan (ids, montos); textos y estructuras no
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, (list, tuple)):
+        return [_redact(v) for v in value[:10]] + (["..."] if len(value) > 10 else [])
+    return f"<{type(value).__name__}>"
+
+
+def redact_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _redact(v) for k, v in params.items()}
+    return [_redact(v) for v in params]
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold_ms: float = 200,
+        explain_sample: float = 0.1,
+        explain_interval: float = 60,
+        out_dir: str = "slow_queries",
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample = explain_sample
+        self.explain_interval = explain_interval
+        self.out_dir = out_dir
+        # label -> último EXPLAIN (monotonic), para no repetir planes de la misma consulta
+        self._last_explain = {}
+        self.stats = {"slow": 0, "explained": 0, "explain_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def record(self, label: str, caller: str, query, params, elapsed_ms: float) -> dict:
+        self.stats["slow"] += 1
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "label": label,
+            "caller": caller,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "query": normalize_query(query),
+            "params": redact_params(params),
+        }
+        logger.warning(
+            f"Slow query {entry['elapsed_ms']}ms in {caller} ({label}): {entry['query'][:300]} params={entry['params']}"
+        )
+        return entry
+
+    def should_explain(self, label: str) -> bool:
+        if self.explain_sample <= 0 or random.random() >= self.explain_sample:
+            return False
+        now = time.monotonic()
+        last = self._last_explain.get(label)
+        if last is not None and now - last < self.explain_interval:
+            return False
+        self._last_explain[label] = now
+        return True
+
+    async def write(self, entry: dict, plan: str) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"slow_queries-{entry['ts'][:10]}.log")
+        async with aiofiles.open(path, "a", encoding="utf-8") as f:
+            await f.write(json.dumps(entry, default=str) + "\n" + plan + "\n\n")
+        self.stats["explained"] += 1
+        return path
@@ -0,0 +1,47 @@
+# checkpoint_broadcast contra un Postgres real (los tipos de los parámetros los
+# infiere el servidor, un mock no lo detecta).
+# Uso: TEST_DATABASE_URL=postgresql://... python -m pytest tests/
+# La base debe ser desechable: se crea el esquema completo con init_db.
+import asyncio
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+async def _checkpoints():
+    from services import db_service
+
+    await db_service.open_pool()
+    try:
+        await db_service.init_db()
+        job = await db_service.create_broadcast_job(created_by=1, lang="es", text="test")
+        # Checkpoint de lote: sin status
+        await db_service.checkpoint_broadcast(job["id"], 500, sent=480, blocked=15, failed=5)
+        running = await db_service.get_broadcast_job(job["id"])
+        # Checkpoint final: con status
+        await db_service.checkpoint_broadcast(job["id"], 900, sent=870, blocked=20, failed=10, status="DONE")
+        done = await db_service.get_broadcast_job(job["id"])
+        pool = db_service.get_pool()
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT finished_at FROM broadcast_jobs WHERE id = %s;", (job["id"],))
+            finished_at = (await cur.fetchone())[0]
+            await cur.execute("DELETE FROM broadcast_jobs WHERE id = %s;", (job["id"],))
+            await conn.commit()
+        return running, done, finished_at
+    finally:
+        await db_service.close_pool()
+
+
+def test_checkpoint_broadcast_with_and_without_status():
+    running, done, finished_at = asyncio.run(_checkpoints())
+    assert running["status"] == "RUNNING"
+    assert (running["last_user_id"], running["sent"], running["blocked"], running["failed"]) == (500, 480, 15, 5)
+    assert done["status"] == "DONE"
+    assert (done["last_user_id"], done["sent"], done["blocked"], done["failed"]) == (900, 870, 20, 10)
+    assert finished_at is not None
@@ -0,0 +1,99 @@
+# BloomFilter y CodeFilter (services/code_filter.py) sin base: refresh() es un fake.
+import asyncio
+import time
+
+from services.code_filter import BloomFilter, CodeFilter
+from utils.helpers import encode_code_number
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(5000, fp_rate=0.01)
+    codes = [encode_code_number(n) for n in range(5000)]
+    bloom.update(codes)
+    assert all(code in bloom for code in codes)
+    # Un código nuevo cuyos bits ya estaban todos puestos no se cuenta (es un falso positivo)
+    assert len(codes) * 0.98 <= bloom.count <= len(codes)
+    others = [encode_code_number(n) for n in range(5000, 25_000)]
+    observed = sum(code in bloom for code in others) / len(others)
+    assert observed < 3 * 0.01
+
+
+def test_bloom_counts_each_item_once():
+    bloom = BloomFilter(1000)
+    assert bloom.add("RF-AAAA-BBBB")
+    assert not bloom.add("RF-AAAA-BBBB")
+    bloom.update(["RF-AAAA-BBBB", "RF-CCCC-DDDD", "RF-CCCC-DDDD"])
+    assert bloom.count == 2
+
+
+def _filter(codes=(), min_sync_seconds=1.0) -> CodeFilter:
+    code_filter = CodeFilter(capacity=1000, min_sync_seconds=min_sync_seconds)
+    bloom = code_filter.new_filter(len(codes))
+    bloom.update(codes)
+    code_filter.install(bloom)
+    return code_filter
+
+
+class FakeSync:
+    def __init__(self, code_filter: CodeFilter, issued=(), ok=True):
+        self.code_filter = code_filter
+        self.issued = list(issued)
+        self.ok = ok
+        self.calls = 0
+
+    async def __call__(self) -> bool:
+        self.calls += 1
+        if not self.ok:
+            return False
+        for code in self.issued:
+            self.code_filter.add(code)
+        self.code_filter.mark_synced()
+        return True
+
+
+def test_not_ready_passes_everything():
+    code_filter = CodeFilter()
+    assert asyncio.run(code_filter.might_exist("RF-AAAA-BBBB", FakeSync(code_filter)))
+    assert code_filter.stats["checks"] == 0
+
+
+def test_miss_syncs_then_rejects_or_finds_late_code():
+    code_filter = _filter(["RF-AAAA-BBBB"])
+    sync = FakeSync(code_filter, issued=["RF-CCCC-DDDD"])
+    assert asyncio.run(code_filter.might_exist("RF-AAAA-BBBB", sync))
+    assert sync.calls == 0
+    # Emitido por otra réplica: aparece al sincronizar
+    assert asyncio.run(code_filter.might_exist("RF-CCCC-DDDD", sync))
+    assert sync.calls == 1
+    code_filter.mark_synced(time.monotonic() - 5)
+    assert not asyncio.run(code_filter.might_exist("RF-EEEE-FFFF", sync))
+    assert sync.calls == 2
+    stats = code_filter.stats
+    assert (stats["checks"], stats["passed"], stats["late"], stats["rejected"]) == (3, 2, 1, 1)
+
+
+def test_recent_sync_rejects_without_refresh():
+    code_filter = _filter(["RF-AAAA-BBBB"])
+    code_filter.mark_synced()
+    sync = FakeSync(code_filter)
+    for n in range(50):
+        assert not asyncio.run(code_filter.might_exist(encode_code_number(n), sync))
+    assert sync.calls == 0
+    assert code_filter.stats["rejected"] == 50
+
+
+def test_failed_sync_passes_to_database():
+    code_filter = _filter(min_sync_seconds=0)
+    sync = FakeSync(code_filter, ok=False)
+    assert asyncio.run(code_filter.might_exist("RF-AAAA-BBBB", sync))
+    assert (code_filter.stats["rejected"], code_filter.stats["passed"]) == (0, 1)
+    code_filter.record_false_positive()
+    assert code_filter.observed_fp_rate() == 1.0
+
+
+def test_added_counts_new_codes_only():
+    code_filter = _filter()
+    code_filter.add("RF-AAAA-BBBB")
+    code_filter.add("RF-AAAA-BBBB")
+    assert code_filter.stats["added"] == 1
+    assert code_filter.summary()["items"] == 1
@@ -0,0 +1,56 @@
+# Formato de los códigos de referido: encode_code_number (utils/helpers.py) y el
+# empaquetado de services/code_cache.py.
+import random
+
+from services.code_cache import CodeCache, pack_code, unpack_code
+from utils.helpers import ALPHABET, CODE_SPACE, build_random_code, encode_code_number, scramble_code_number
+
+
+def test_scramble_is_a_bijection_on_a_sample():
+    rng = random.Random(3)
+    sample = set(range(50_000)) | {rng.randrange(CODE_SPACE) for _ in range(50_000)} | {CODE_SPACE - 1}
+    mixed = {scramble_code_number(n) for n in sample}
+    assert len(mixed) == len(sample)
+    assert all(0 <= x < CODE_SPACE for x in mixed)
+
+
+def test_encode_code_number_distinct_and_well_formed():
+    codes = [encode_code_number(n) for n in range(20_000)]
+    assert len(set(codes)) == len(codes)
+    for code in codes[:500]:
+        prefix, first, second = code.split("-")
+        assert prefix == "RF" and len(first) == len(second) == 4
+        assert set(first + second) <= set(ALPHABET)
+    assert encode_code_number(5, prefix="VIP").startswith("VIP-")
+
+
+def test_pack_unpack_round_trip():
+    rng = random.Random(5)
+    codes = [encode_code_number(rng.randrange(CODE_SPACE), prefix=p) for p in ("RF", "A", "Z9X") for _ in range(300)]
+    codes += [build_random_code() for _ in range(300)]
+    packed = [pack_code(code) for code in codes]
+    assert all(p is not None and 0 <= p < 2 ** 58 for p in packed)
+    assert [unpack_code(p) for p in packed] == codes
+    assert len(set(packed)) == len(set(codes))
+
+
+def test_pack_rejects_other_formats():
+    for code in ("", "RF", "RFABCDEFGH", "RF-ABCD-EFG", "RF-ABCDE-FGH", "rf-ABCD-EFGH", "RF-ABCD-EFG0", "LONG-ABCD-EFGH", "RF-AB-CD-EFGH"):
+        assert pack_code(code) is None, code
+
+
+def test_code_cache_invalidate_with_evicted_user_slot():
+    for old, new in (("RF-AAAA-BBBB", "RF-CCCC-DDDD"), ("LONGPREFIX-1", "LONGPREFIX-2")):
+        cache = CodeCache(max_entries=64, max_odd_entries=64)
+        cache.put(1, old)
+        cache.put(2, "RF-EEEE-FFFF")
+        # Solo queda el sentido código -> usuario
+        cache._by_user.pop(1)
+        cache._odd_by_user.pop(1, None)
+        cache.invalidate(1, old)
+        cache.put(1, new)
+        assert cache.user_for_code(old) is None
+        assert cache.user_for_code(new) == 1 and cache.code_for_user(1) == new
+        # El código de otro usuario no se toca
+        cache.invalidate(1, "RF-EEEE-FFFF")
+        assert cache.user_for_code("RF-EEEE-FFFF") == 2
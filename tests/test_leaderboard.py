@@ -0,0 +1,59 @@
+# RankedSet y Board (services/leaderboard.py) contra una lista ordenada como oráculo,
+# con inserciones, cambios de puntaje y bajas aleatorias.
+import bisect
+import random
+
+from services.leaderboard import Board, Leaderboard, RankedSet
+
+
+def test_ranked_set_matches_sorted_list():
+    rng = random.Random(7)
+    ranked, oracle = RankedSet(), []
+    for _ in range(3000):
+        if oracle and rng.random() < 0.4:
+            key = rng.choice(oracle)
+            assert ranked.remove(key)
+            oracle.remove(key)
+        else:
+            key = (rng.randrange(-50, 50), rng.randrange(1000))
+            if key in oracle:
+                continue
+            ranked.add(key)
+            bisect.insort(oracle, key)
+        assert len(ranked) == len(oracle)
+        probe = (rng.randrange(-50, 50), rng.randrange(1000))
+        assert ranked.count_less(probe) == bisect.bisect_left(oracle, probe)
+        start, count = rng.randrange(len(oracle) + 2), rng.randrange(1, 12)
+        assert ranked.slice(start, count) == oracle[start:start + count]
+    assert not ranked.remove((999, 999))
+
+
+def test_board_top_and_rank_match_oracle():
+    rng = random.Random(11)
+    board, scores = Board(), {}
+    for _ in range(2000):
+        user_id = rng.randrange(200)
+        delta = rng.choice([-3, -1, 1, 1, 2, 5])
+        board.incr(user_id, delta)
+        scores[user_id] = scores.get(user_id, 0) + delta
+        if not scores[user_id]:
+            del scores[user_id]
+    ordered = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    assert [(u, s) for _, u, s in board.top(len(ordered) + 5)] == ordered
+    for user_id, score in scores.items():
+        # Empates comparten posición: 1 + cuántos tienen estrictamente más
+        assert board.rank(user_id) == (1 + sum(1 for s in scores.values() if s > score), score)
+    offset = len(ordered) // 2
+    assert [u for _, u, _ in board.top(10, offset)] == [u for u, _ in ordered[offset:offset + 10]]
+    missing = next(u for u in range(1000) if u not in scores)
+    assert board.rank(missing) is None
+
+
+def test_leaderboard_load_applies_pending_and_clear_boards_keeps_them():
+    lb = Leaderboard(refresh_seconds=60)
+    lb.record("c1", "points", 1, 5)
+    board = lb.load("c1", "points", [(1, 10), (2, 12)])
+    assert board.rank(1) == (1, 15)
+    lb.clear_boards()
+    assert lb.board("c1", "points") is None
+    assert lb.drain_pending() == {("c1", "points", 1): 5}
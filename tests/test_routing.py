@@ -0,0 +1,111 @@
+# command_key y PrefixRouter (bot/routing.py) con updates sintéticos, sin red.
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Update
+
+from bot.routing import (
+    LEGACY_MENU_CALLBACKS,
+    MenuAction,
+    MenuCallback,
+    PayoutConfirmAction,
+    PayoutConfirmCallback,
+    PrefixRouter,
+    command_key,
+    is_payload,
+)
+
+
+def test_command_key():
+    assert command_key("/Balance@my_bot 10") == "balance"
+    assert command_key("/start") == "start"
+    assert command_key("/top\n") == "top"
+    for text in (None, "", "hola", "/", "/ start", "/@bot"):
+        assert command_key(text) is None, text
+
+
+def _dispatcher(seen: list) -> Dispatcher:
+    async def on_menu(callback, callback_data: MenuCallback):
+        seen.append(("menu", callback_data.action))
+
+    async def on_confirm(callback, callback_data: PayoutConfirmCallback):
+        seen.append(("pmc", callback_data.method, callback_data.action))
+
+    async def on_balance(message):
+        seen.append(("balance", message.text))
+
+    async def on_text(message):
+        seen.append(("fallback", message.text))
+
+    routes = PrefixRouter(name="routes")
+    menu = Router(name="menu")
+    menu.callback_query.register(on_menu, is_payload(MenuCallback))
+    routes.include_callbacks(menu, MenuCallback, legacy=LEGACY_MENU_CALLBACKS)
+    payouts = Router(name="payouts")
+    payouts.callback_query.register(on_confirm, is_payload(PayoutConfirmCallback))
+    routes.include_callbacks(payouts, PayoutConfirmCallback)
+    commands = Router(name="commands")
+    commands.message.register(on_balance, Command("balance"))
+    routes.include_commands(commands)
+    fallback = Router(name="fallback")
+    fallback.message.register(on_text)
+    dp = Dispatcher()
+    dp.include_routers(routes, fallback)
+    return dp
+
+
+def _feed(dp: Dispatcher, updates: list):
+    async def run():
+        bot = Bot(token="123456:TEST")
+        user = {"id": 1, "is_bot": False, "first_name": "Test"}
+        try:
+            for n, (kind, value) in enumerate(updates, 1):
+                if kind == "callback":
+                    payload = {"callback_query": {"id": str(n), "from": user, "chat_instance": "1", "data": value}}
+                else:
+                    payload = {"message": {"message_id": n, "date": 0, "chat": {"id": 1, "type": "private"}, "from": user, "text": value}}
+                await dp.feed_update(bot, Update.model_validate({"update_id": n, **payload}, context={"bot": bot}))
+        finally:
+            await bot.session.close()
+
+    asyncio.run(run())
+
+
+def test_prefix_router_dispatches_by_key():
+    seen = []
+    _feed(_dispatcher(seen), [
+        ("callback", MenuCallback(action=MenuAction.link).pack()),
+        ("callback", "remember_code"),
+        ("callback", PayoutConfirmCallback(method="paypal", action=PayoutConfirmAction.yes).pack()),
+        ("callback", "pmc:paypal:bogus"),
+        ("callback", "unknown:1"),
+        ("message", "/balance 10"),
+        ("message", "/other"),
+        ("message", "hola"),
+    ])
+    assert seen == [
+        ("menu", MenuAction.link),
+        ("menu", MenuAction.code),
+        ("pmc", "paypal", PayoutConfirmAction.yes),
+        ("balance", "/balance 10"),
+        ("fallback", "/other"),
+        ("fallback", "hola"),
+    ]
+
+
+def test_duplicate_routes_are_rejected():
+    routes = PrefixRouter()
+    routes.include_callbacks(Router(), MenuCallback)
+    commands = Router()
+    commands.message.register(lambda m: None, Command("balance"))
+    routes.include_commands(commands)
+    for include in (
+        lambda: routes.include_callbacks(Router(), MenuCallback),
+        lambda: routes.include_commands(Router(), "Balance"),
+    ):
+        try:
+            include()
+        except ValueError:
+            continue
+        raise AssertionError("duplicate route accepted")
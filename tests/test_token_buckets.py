@@ -0,0 +1,30 @@
+# TokenBuckets (bot/middlewares.py) con relojes explícitos.
+from bot.middlewares import TokenBuckets
+
+
+def test_burst_then_refill():
+    buckets = TokenBuckets()
+    limits = [("u", 1.0, 3)]
+    assert [buckets.take(limits, now=0) for _ in range(4)] == [True, True, True, False]
+    assert not buckets.take(limits, now=0.5)
+    assert buckets.take(limits, now=1.0)
+    # Nunca acumula más que la ráfaga
+    assert buckets.level("u", 1.0, 3, now=100) == 3
+
+
+def test_take_is_all_or_nothing():
+    buckets = TokenBuckets()
+    assert buckets.take([("a", 1.0, 1)], now=0)
+    # "a" está vacío: "b" no debe perder su token
+    assert not buckets.take([("b", 1.0, 1), ("a", 1.0, 1)], now=0)
+    assert buckets.level("b", 1.0, 1, now=0) == 1
+
+
+def test_lru_bound():
+    buckets = TokenBuckets(max_entries=2)
+    for key in ("a", "b", "c"):
+        buckets.take([(key, 1.0, 1)], now=0)
+    assert len(buckets) == 2
+    # "a" fue desalojado: vuelve con la ráfaga completa
+    assert buckets.level("a", 1.0, 1, now=0) == 1
+    assert buckets.level("c", 1.0, 1, now=0) == 0
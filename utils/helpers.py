@@ -11,6 +11,37 @@ def build_random_code(prefix: str = "RF", length: int = 8) -> str:
 	body = "".join(secrets.choice(ALPHABET) for _ in range(length))
 	return f"{prefix}-{body[:4]}-{body[4:]}"
 
+CODE_BODY_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_BODY_LENGTH  # 32^8 = 2^40
+_CODE_MULT = 0x5DEECE66D  # impar -> biyección módulo 2^40
+_CODE_ADD = 0x2545F4914F
+
+def scramble_code_number(n: int) -> int:
+	"""Bijective mix of 0..2^40-1 so sequential numbers don't give guessable codes."""
+	x = (n * _CODE_MULT + _CODE_ADD) % CODE_SPACE
+	x ^= x >> 20
+	x = (x * _CODE_MULT) % CODE_SPACE
+	return x ^ (x >> 17)
+
+def encode_code_number(n: int, prefix: str = "RF") -> str:
+	"""Encodes a sequence number as a referral code. Distinct n (< 2^40) give distinct codes."""
+	x = scramble_code_number(n % CODE_SPACE)
+	chars = []
+	for _ in range(CODE_BODY_LENGTH):
+		x, r = divmod(x, len(ALPHABET))
+		chars.append(ALPHABET[r])
+	body = "".join(chars)
+	return f"{prefix}-{body[:4]}-{body[4:]}"
+
+_AGE_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def parse_age(value: str) -> Optional[timedelta]:
+	"""'30m', '48h', '7d', '2w' -> timedelta; None if the format is invalid."""
+	match = re.fullmatch(r"(\d+)([mhdw])", (value or "").strip().lower())
+	if not match:
+		return None
+	return timedelta(**{_AGE_UNITS[match.group(2)]: int(match.group(1))})
+
 def utcnow_iso() -> str:
 	return datetime.now(timezone.utc).isoformat()
 